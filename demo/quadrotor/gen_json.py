@@ -88,7 +88,7 @@ def trans_dict(root: AnalysisTreeNode, level, id, parent_dict):
 
     trace_dict = {}
     for agent_id in root.trace:
-        trace_dict[agent_id] = [dumps(step) for step in root.trace[agent_id]]
+        trace_dict[agent_id] = [dumps(list(step)) for step in root.trace[agent_id]]
     rst_dict['trace'] = trace_dict
 
     if level+1 not in tree_dict:
@@ -105,8 +105,8 @@ class QuadrotorAgent(BaseAgent):
                               [0.1, 0.1, 11.81]]
         init = initalCondition
         trajectory = [init]
+        # a single solver is restarted from the current state at every step
         r = ode(self.dynamic)
-        # r.set_initial_value(init)
         ex_list = []
         ey_list = []
         ez_list = []
@@ -145,7 +145,6 @@ class QuadrotorAgent(BaseAgent):
             df = self.action_handler(init)
             u = u+[df]
             init = trajectory[i]  # len 11
-            r = ode(self.dynamic)
             r.set_initial_value(init)
             r.set_f_params(u)
             val = r.integrate(r.t + time_step)
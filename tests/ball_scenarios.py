@@ -0,0 +1,89 @@
+# Small ball scenarios shared by the tests, with the trees they produce compared node by node
+from enum import Enum, auto
+
+import numpy as np
+
+from verse import Scenario
+from verse.agents.example_agent.ball_agent import BallAgent
+from verse.sensor import BaseSensor
+
+# Balls moving between walls at x = 0 and x = 10, turning around when they reach one of them. The modes are
+# compared as strings so that the controller is parsed without the enum
+CONTROLLER = '''
+from enum import Enum, auto
+import copy
+from typing import List
+
+class BallMode(Enum):
+    Left = auto()
+    Right = auto()
+
+class State:
+    x = 0.0
+    y = 0.0
+    vx = 0.0
+    vy = 0.0
+    mode: BallMode
+
+    def __init__(self, x, y, vx, vy, mode: BallMode):
+        pass
+
+def controller(ego: State, others: List[State]):
+    output = copy.deepcopy(ego)
+    if ego.mode == 'Right' and ego.x > 10:
+        output.mode = 'Left'
+        output.x = 10
+        output.vx = -ego.vx
+    if ego.mode == 'Left' and ego.x < 0:
+        output.mode = 'Right'
+        output.x = 0
+        output.vx = -ego.vx
+    assert not any(ego.x - other.x < 0.5 and other.x - ego.x < 0.5 and ego.y - other.y < 0.5 and other.y - ego.y < 0.5 for other in others), "collision"
+    return output
+'''
+
+class BallMode(Enum):
+    Left = auto()
+    Right = auto()
+
+class StepSensor(BaseSensor):
+    """The omniscient sensor without sense_trace, so the scenarios sense and check one step at a time"""
+    def sense(self, scenario, agent, state_dict, lane_map):
+        return super().sense(scenario, agent, state_dict, lane_map)
+
+def scenario(inits, modes, sensor=None) -> Scenario:
+    """A scenario with one ball per initial set in inits, starting in modes"""
+    s = Scenario()
+    for i in range(len(inits)):
+        s.add_agent(BallAgent(f'ball{i}', code=CONTROLLER))
+    s.set_init(inits, [(mode,) for mode in modes])
+    if sensor is not None:
+        s.set_sensor(sensor)
+    return s
+
+def two_balls(uncertain: bool = False, sensor=None) -> Scenario:
+    """Two balls on separate rows, each bouncing between the walls a few times"""
+    width = 0.2 if uncertain else 0
+    return scenario(
+        [[[2, 0, 3, 0], [2 + width, width, 3, 0]], [[8, 5, -2, 0], [8 + width, 5 + width, -2, 0]]],
+        [BallMode.Right, BallMode.Left], sensor)
+
+def one_ball(uncertain: bool = False, sensor=None) -> Scenario:
+    """A ball bouncing between the walls, which is back at the same states at each bounce on the same wall"""
+    width = 0.2 if uncertain else 0
+    return scenario([[[2, 0, 3, 0], [2, width, 3, 0]]], [BallMode.Right], sensor)
+
+def colliding_balls(sensor=None) -> Scenario:
+    """Two balls on the same row, which hit the collision assert"""
+    return scenario([[[2, 0, 3, 0], [2, 0, 3, 0]], [[8, 0, -2, 0], [8, 0, -2, 0]]], [BallMode.Right, BallMode.Left], sensor)
+
+def assert_trees_equal(test, tree, other, rtol=0, atol=0):
+    """Check that the two trees have the same nodes, in the same order"""
+    test.assertEqual(len(tree.nodes), len(other.nodes))
+    for node, other_node in zip(tree.nodes, other.nodes):
+        test.assertEqual(node.start_time, other_node.start_time)
+        test.assertEqual({k: list(v) for k, v in node.mode.items()}, {k: list(v) for k, v in other_node.mode.items()})
+        test.assertEqual(node.assert_hits, other_node.assert_hits)
+        test.assertEqual(node.trace.keys(), other_node.trace.keys())
+        for agent_id in node.trace:
+            np.testing.assert_allclose(np.asarray(node.trace[agent_id]), np.asarray(other_node.trace[agent_id]), rtol=rtol, atol=atol)
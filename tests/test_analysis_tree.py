@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from verse.analysis import AnalysisTree, AnalysisTreeWriter
+from ball_scenarios import two_balls, assert_trees_equal
+
+class TestTreeFormats(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def test_binary_roundtrip(self):
+        tree = two_balls().simulate(12, 0.05)
+        tree.dump_binary(self.path('tree.bin'))
+        loaded = AnalysisTree.load_binary(self.path('tree.bin'))
+        assert_trees_equal(self, tree, loaded)
+        self.assertIsInstance(loaded.root.trace['ball0'], np.memmap)
+
+    def test_json_roundtrip(self):
+        tree = two_balls(uncertain=True).verify(12, 0.05)
+        tree.dump(self.path('tree.json'))
+        tree.dump_binary(self.path('tree.bin'))
+        assert_trees_equal(self, tree, AnalysisTree.load(self.path('tree.json')))
+        assert_trees_equal(self, AnalysisTree.load(self.path('tree.json')), AnalysisTree.load_binary(self.path('tree.bin')))
+
+    def test_covered_by_roundtrip(self):
+        tree = two_balls(uncertain=True).verify(12, 0.05)
+        tree.nodes[-1].covered_by = tree.nodes[1]
+        tree.dump(self.path('tree.json'))
+        tree.dump_binary(self.path('tree.bin'))
+        for loaded in [AnalysisTree.load(self.path('tree.json')), AnalysisTree.load_binary(self.path('tree.bin'))]:
+            self.assertIs(loaded.nodes[-1].covered_by, loaded.nodes[1])
+            self.assertTrue(all(node.covered_by is None for node in loaded.nodes[:-1]))
+
+    def test_unclosed_writer(self):
+        writer = AnalysisTreeWriter(self.path('tree.bin'))
+        writer.write_node(two_balls().simulate(1, 0.05).root)
+        writer.f.flush()
+        with self.assertRaises(ValueError):
+            AnalysisTree.load_binary(self.path('tree.bin'))
+        writer.close()
+
+    def test_stream_simulation(self):
+        tree = two_balls().simulate(12, 0.05)
+        streamed = two_balls().simulate(12, 0.05, params={'stream_to': self.path('sim.bin')})
+        assert_trees_equal(self, tree, streamed)
+        assert_trees_equal(self, tree, AnalysisTree.load_binary(self.path('sim.bin')))
+
+    def test_stream_verification(self):
+        tree = two_balls(uncertain=True).verify(12, 0.05)
+        streamed = two_balls(uncertain=True).verify(12, 0.05, params={'stream_to': self.path('ver.bin')})
+        assert_trees_equal(self, tree, streamed)
+        assert_trees_equal(self, tree, AnalysisTree.load_binary(self.path('ver.bin')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+from z3 import Real, And, Or, Not, Solver, sat, unsat
+
+from verse.automaton.guard import GuardSolver
+
+def baseline_check(guard, variables, bounds):
+    """The check with new solvers for each box, as before the solvers were reused"""
+    solver = Solver()
+    solver.add(guard)
+    for symbol, (start, end) in bounds.items():
+        solver.add(variables[symbol] >= start, variables[symbol] <= end)
+    if solver.check() != sat:
+        return False, False
+    solver = Solver()
+    solver.add(Not(guard))
+    for symbol, (start, end) in bounds.items():
+        solver.add(variables[symbol] >= start, variables[symbol] <= end)
+    return True, solver.check() == unsat
+
+class TestGuardSolver(unittest.TestCase):
+    def setUp(self):
+        self.variables = {name: Real(name) for name in ['x', 'y']}
+        self.rng = np.random.RandomState(0)
+
+    def random_boxes(self, num):
+        for _ in range(num):
+            corners = self.rng.uniform(-5, 5, (2, 2))
+            corners[1] = corners[0] + self.rng.uniform(0, 2, 2) * self.rng.randint(0, 2, 2)
+            yield {'x': tuple(corners[:, 0].tolist()), 'y': tuple(corners[:, 1].tolist())}
+
+    def check_guard(self, guard, interval):
+        guard_solver = GuardSolver(guard)
+        self.assertEqual(guard_solver.interval_guard is not None, interval)
+        for bounds in self.random_boxes(200):
+            self.assertEqual(guard_solver.check(self.variables, bounds), baseline_check(guard, self.variables, bounds), bounds)
+
+    def test_linear_guard(self):
+        x, y = self.variables['x'], self.variables['y']
+        self.check_guard(Or(And(x + 2 * y <= 1, x - y > -2), Not(y / 2 >= 1.5), x == 0), True)
+
+    def test_nonlinear_guard(self):
+        x, y = self.variables['x'], self.variables['y']
+        self.check_guard(And(x * y <= 1, x + y >= 0), False)
+
+    def test_interval_precheck_agrees_with_z3(self):
+        x, y = self.variables['x'], self.variables['y']
+        guard = And(x - 0.5 * y < 2, y >= -1)
+        guard_solver = GuardSolver(guard)
+        z3_solver = GuardSolver(guard)
+        z3_solver.interval_guard = None
+        for bounds in self.random_boxes(200):
+            self.assertEqual(guard_solver.check(self.variables, bounds), z3_solver.check(self.variables, bounds))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import ast
+import itertools
+import unittest
+
+import numpy as np
+
+from verse.analysis.interval import Interval
+from verse.automaton.interval_guard import eval_interval_guard
+from ball_scenarios import two_balls, StepSensor, assert_trees_equal
+
+class TestIntervalGuards(unittest.TestCase):
+    def test_decided_boxes_agree_with_points(self):
+        rng = np.random.RandomState(0)
+        lo = rng.uniform(-3, 3, (2, 100))
+        hi = lo + rng.uniform(0, 1, (2, 100))
+        env = {'x': Interval(lo[0], hi[0]), 'y': Interval(lo[1], hi[1])}
+        for expr in ['x * y > 1 and not x - y < 0', 'x * x + y <= 2 or y > 2.5', 'x / (y + 4) > 0.2', '-x < 1 and (y > 0 or x > 0)']:
+            true, false = eval_interval_guard(ast.parse(expr, mode='eval').body, env, 100)
+            self.assertTrue(true.any() and false.any(), expr)
+            for i in range(100):
+                corners = itertools.product(*[np.linspace(lo[k, i], hi[k, i], 5) for k in range(2)])
+                values = [eval(expr, {'x': x, 'y': y}) for x, y in corners]
+                if true[i]:
+                    self.assertTrue(all(values), expr)
+                if false[i]:
+                    self.assertFalse(any(values), expr)
+
+    def test_verification_matches_step_by_step(self):
+        assert_trees_equal(self, two_balls(uncertain=True, sensor=StepSensor()).verify(12, 0.05), two_balls(uncertain=True).verify(12, 0.05))
+
+    def test_skipped_steps(self):
+        scenario = two_balls(uncertain=True)
+        root = scenario.verify(12, 0.05).root
+        guard_paths = {agent_id: scenario.agent_dict[agent_id].controller.mode_paths(root.mode[agent_id]) for agent_id in root.agent}
+        num_steps = len(root.trace['ball0']) // 2
+        skippable = scenario._skippable_verify_steps(root, guard_paths, num_steps)
+        # The first ball reaches the wall at x = 10 at the end of the node, far from it at the start
+        self.assertTrue(skippable[:num_steps // 2].all())
+        self.assertFalse(skippable[-1])
+
+if __name__ == '__main__':
+    unittest.main()
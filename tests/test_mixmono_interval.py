@@ -0,0 +1,69 @@
+import unittest
+import warnings
+from enum import Enum, auto
+
+import numpy as np
+from numpy import tan
+
+from verse import Scenario
+from verse.agents import BaseAgent
+from verse.parser.parser import ControllerIR
+
+class AgentMode(Enum):
+    Default = auto()
+
+class TanAgent(BaseAgent):
+    def __init__(self, id):
+        self.id = id
+        self.controller = ControllerIR.empty()
+        self.init_cont = self.init_disc = self.static_parameters = self.uncertain_parameters = None
+
+    def dynamics(self, x, args):
+        w1, w2, dt = args
+        x1, x2 = x
+        '''Begin Dynamic'''
+        x1_plus = x1+dt*(tan(x2)+w1)
+        x2_plus = x2+dt*(-x1+w2)
+        '''End Dynamic'''
+        return [x1_plus, x2_plus]
+
+class PolyAgent(BaseAgent):
+    def __init__(self, id):
+        self.id = id
+        self.controller = ControllerIR.empty()
+        self.init_cont = self.init_disc = self.static_parameters = self.uncertain_parameters = None
+
+    def dynamics(self, x, args):
+        w1, w2, dt = args
+        x1, x2 = x
+        '''Begin Dynamic'''
+        x1_plus = x1+dt*(x1*(1.1+w1-x1-0.1*x2))
+        x2_plus = x2+dt*(x2*(4+w2-3*x1-x2))
+        '''End Dynamic'''
+        return [x1_plus, x2_plus]
+
+def verify(agent, params):
+    scenario = Scenario()
+    scenario.add_agent(agent)
+    scenario.set_init([[[0.5, 0.2], [0.6, 0.3]]], [(AgentMode.Default,)], uncertain_param_list=[[[-0.1, -0.1], [0.1, 0.1]]])
+    tree = scenario.verify(0.5, 0.01, reachability_method='MIXMONO_DISC', params=params)
+    return np.asarray(tree.root.trace[agent.id])
+
+class TestIntervalDecomposition(unittest.TestCase):
+    def test_unsupported_functions_fall_back(self):
+        optimization = verify(TanAgent('car'), {})
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            interval = verify(TanAgent('car'), {'mixmono_decomposition': 'interval'})
+        self.assertTrue(any('falling back to optimization' in str(w.message) for w in caught))
+        np.testing.assert_allclose(interval, optimization)
+
+    def test_interval_contains_optimization(self):
+        optimization = verify(PolyAgent('car'), {})
+        interval = verify(PolyAgent('car'), {'mixmono_decomposition': 'interval'})
+        self.assertEqual(interval.shape, optimization.shape)
+        self.assertTrue(np.all(interval[0::2, 1:] <= optimization[0::2, 1:] + 1e-6))
+        self.assertTrue(np.all(interval[1::2, 1:] >= optimization[1::2, 1:] - 1e-6))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+from enum import Enum, auto
+
+import numpy as np
+from scipy.optimize import minimize
+from sympy import lambdify
+
+from verse import Scenario
+from verse.agents import BaseAgent
+from verse.analysis import mixmonotone
+from verse.parser.parser import ControllerIR
+
+class AgentMode(Enum):
+    Default = auto()
+
+class OscillatorAgent(BaseAgent):
+    def __init__(self, id):
+        self.id = id
+        self.controller = ControllerIR.empty()
+        self.init_cont = self.init_disc = self.static_parameters = self.uncertain_parameters = None
+
+    def dynamics(self, x, args):
+        w1, w2, dt = args
+        x1, x2 = x
+        '''Begin Dynamic'''
+        x1_plus = x1+dt*(x2+w1*x1)
+        x2_plus = x2+dt*(-x1-0.5*x2*x2+w2)
+        '''End Dynamic'''
+        return [x1_plus, x2_plus]
+
+def verify(agent):
+    scenario = Scenario()
+    scenario.add_agent(agent)
+    scenario.set_init([[[0.5, 0.2], [0.6, 0.3]]], [(AgentMode.Default,)], uncertain_param_list=[[[-0.1, -0.1], [0.1, 0.1]]])
+    tree = scenario.verify(0.5, 0.01, reachability_method='MIXMONO_DISC')
+    return np.asarray(tree.root.trace[agent.id])
+
+class TestSymbolicDynamics(unittest.TestCase):
+    def test_extracted_dynamics(self):
+        agent = OscillatorAgent('car')
+        symbol_x, symbol_w, exprs, neg_exprs = mixmonotone.extract_symbolic_dynamics(agent.dynamics, 0.01)
+        rng = np.random.RandomState(0)
+        for x1, x2, w1, w2 in rng.uniform(-1, 1, (10, 4)):
+            values = dict(zip(symbol_x + symbol_w, [x1, x2, w1, w2]))
+            expected = agent.dynamics([x1, x2], [w1, w2, 0.01])
+            np.testing.assert_allclose([float(expr.subs(values)) for expr in exprs], expected)
+            np.testing.assert_allclose([float(expr.subs(values)) for expr in neg_exprs], -np.array(expected))
+
+    def test_cached_functions_minimize_the_same(self):
+        symbol_x, symbol_w, exprs, _ = mixmonotone.extract_symbolic_dynamics(OscillatorAgent('car').dynamics, 0.01)
+        var_range = {var: (-0.5, 1.0) for var in symbol_x + symbol_w}
+        for expr in exprs:
+            # Minimized with functions built for this call, as before they were cached
+            vars = list(expr.free_symbols)
+            res = minimize(lambdify([vars], expr), [var_range[var][0] for var in vars], bounds=[var_range[var] for var in vars], method='L-BFGS-B')
+            self.assertAlmostEqual(mixmonotone.find_min_symbolic(expr, var_range), res.fun, places=6)
+
+    def test_cached_tube(self):
+        mixmonotone.extract_symbolic_dynamics.cache_clear()
+        mixmonotone.lambdify_with_jac.cache_clear()
+        tube = verify(OscillatorAgent('car'))
+        hits = mixmonotone.lambdify_with_jac.cache_info().hits
+        self.assertGreater(hits, 0)
+        np.testing.assert_array_equal(verify(OscillatorAgent('car')), tube)
+        self.assertGreater(mixmonotone.lambdify_with_jac.cache_info().hits, hits)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import itertools
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from verse.parser.parser import ControllerIR
+from ball_scenarios import CONTROLLER
+
+# Mode tests written in the different ways the paths can hold them, on two discrete variables
+TWO_MODES_CONTROLLER = '''
+from enum import Enum, auto
+import copy
+
+class BallMode(Enum):
+    Left = auto()
+    Right = auto()
+
+class LaneMode(Enum):
+    Top = auto()
+    Bottom = auto()
+
+class State:
+    x = 0.0
+    vx = 0.0
+    mode: BallMode
+    lane_mode: LaneMode
+
+    def __init__(self, x, vx, mode: BallMode, lane_mode: LaneMode):
+        pass
+
+def controller(ego: State):
+    output = copy.deepcopy(ego)
+    if ego.mode == 'Right' and ego.lane_mode == 'Top' and ego.x > 10:
+        output.mode = 'Left'
+    if 'Left' == ego.mode and ego.x < 0:
+        output.mode = 'Right'
+    if ego.x > 20 or ego.mode == 'Left':
+        output.lane_mode = 'Bottom'
+    if ego.mode != 'Left' and ego.vx > 5:
+        output.lane_mode = 'Top'
+    if ego.lane_mode == 'Bottom':
+        if ego.x > 5:
+            output.vx = 0
+    return output
+'''
+
+def brute_force_paths(controller: ControllerIR, mode, cont_values):
+    """The indices of the paths whose conditions hold at some of the states in mode, for all the combinations of
+    the values of the continuous variables in cont_values"""
+    state_def = controller.state_defs['State']
+    res = set()
+    for values in itertools.product(*[cont_values] * len(state_def.cont)):
+        ego = SimpleNamespace(**dict(zip(state_def.cont, values)), **dict(zip(state_def.disc, mode)))
+        res.update(i for i, path in enumerate(controller.paths) if eval(path.cond, {'ego': ego, 'others': []}))
+    return res
+
+class TestModePaths(unittest.TestCase):
+    def check_controller(self, controller: ControllerIR, modes, cont_values):
+        """Check that the paths of each mode include all the paths that can be taken in it"""
+        for mode in modes:
+            paths = controller.mode_paths(mode)
+            self.assertLessEqual(brute_force_paths(controller, mode, cont_values), set(paths), mode)
+            self.assertEqual(paths, sorted(paths))
+            self.assertIs(controller.mode_paths(list(mode)), paths)
+
+    def test_ball_controller(self):
+        controller = ControllerIR.parse(CONTROLLER)
+        values = np.linspace(-5, 15, 5)
+        self.check_controller(controller, [('Left',), ('Right',)], values)
+        # All the paths test the mode, so none is left that can't be taken
+        for mode in [('Left',), ('Right',)]:
+            self.assertEqual(set(controller.mode_paths(mode)), brute_force_paths(controller, mode, values))
+            self.assertEqual(len(controller.mode_paths(mode)), len(controller.paths) // 2)
+
+    def test_two_discrete_variables(self):
+        controller = ControllerIR.parse(TWO_MODES_CONTROLLER)
+        modes = list(itertools.product(['Left', 'Right'], ['Top', 'Bottom']))
+        self.check_controller(controller, modes, np.linspace(-5, 25, 7))
+        # Only the equality tests in conjunctions rule out paths, the ones with != or or are kept in every mode
+        vx = next(i for i, path in enumerate(controller.paths) if path.var == 'vx')
+        to_left, to_right, to_bottom, to_top = [
+            next(i for i, path in enumerate(controller.paths) if path.var == var and eval(path.val) == val)
+            for var, val in [('mode', 'Left'), ('mode', 'Right'), ('lane_mode', 'Bottom'), ('lane_mode', 'Top')]
+        ]
+        self.assertEqual(set(controller.mode_paths(('Left', 'Top'))), {to_right, to_bottom, to_top})
+        self.assertEqual(set(controller.mode_paths(('Left', 'Bottom'))), {vx, to_right, to_bottom, to_top})
+        self.assertEqual(set(controller.mode_paths(('Right', 'Top'))), {to_left, to_bottom, to_top})
+        self.assertEqual(set(controller.mode_paths(('Right', 'Bottom'))), {vx, to_bottom, to_top})
+
+if __name__ == '__main__':
+    unittest.main()
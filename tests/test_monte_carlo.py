@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from verse.analysis import AnalysisTree, MonteCarloResult
+from ball_scenarios import scenario, two_balls, BallMode
+
+# Velocities that don't bring the balls exactly onto the walls at a step, where the batched and the tree
+# simulations could round the guards differently
+def bouncing_balls():
+    return scenario([[[2, 0, 3.1, 0], [2.2, 0.2, 3.1, 0]], [[8, 5, -2.3, 0], [8.2, 5.2, -2.3, 0]]], [BallMode.Right, BallMode.Left])
+
+def colliding_balls():
+    return scenario([[[2, 0, 3, 0], [2, 0, 3, 0]], [[8.1, 0, -2, 0], [8.1, 0, -2, 0]]], [BallMode.Right, BallMode.Left])
+
+class TestMonteCarlo(unittest.TestCase):
+    def test_samples_match_simulations(self):
+        result = bouncing_balls().simulate_monte_carlo(12, 0.05, 4, seed=0)
+        self.assertIsInstance(result, MonteCarloResult)
+        self.assertEqual(result.num_samples, 4)
+        self.assertEqual(result.hit_samples(), [])
+        for i in range(result.num_samples):
+            # The sample simulated alone, from its initial point
+            init = [[result.traces[agent_id][i, 0, 1:].tolist()] * 2 for agent_id in ['ball0', 'ball1']]
+            tree = scenario(init, [BallMode.Right, BallMode.Left]).simulate(12, 0.05)
+            self.assertGreater(len(tree.nodes), 3)
+            transitions = []
+            for node in tree.nodes:
+                if node is not tree.root:
+                    changed = [agent_id for agent_id in node.mode if list(node.mode[agent_id]) != list(parent.mode[agent_id])]
+                    transitions += [(node.start_time, agent_id, tuple(node.mode[agent_id])) for agent_id in changed]
+                for agent_id, trace in node.trace.items():
+                    # The last step of a node with a child is the state before the reset, the samples keep the one after
+                    trace = trace if not node.child else trace[:-1]
+                    steps = np.rint(trace[:, 0] / 0.05).astype(int)
+                    np.testing.assert_allclose(result.traces[agent_id][i, steps], trace, atol=1e-9)
+                parent = node
+            self.assertEqual([(round(t, 10), agent_id, tuple(mode)) for t, agent_id, mode in result.transitions[i]], transitions)
+
+    def test_statistics(self):
+        result = two_balls(uncertain=True).simulate_monte_carlo(12, 0.05, 10, seed=1)
+        without_traces = two_balls(uncertain=True).simulate_monte_carlo(12, 0.05, 10, seed=1, keep_traces=False)
+        self.assertIsNone(without_traces.traces)
+        for agent_id, traces in result.traces.items():
+            np.testing.assert_allclose(result.mean[agent_id], np.nanmean(traces[:, :, 1:], axis=0))
+            np.testing.assert_array_equal(result.lower[agent_id], np.nanmin(traces[:, :, 1:], axis=0))
+            np.testing.assert_array_equal(result.upper[agent_id], np.nanmax(traces[:, :, 1:], axis=0))
+            np.testing.assert_allclose(without_traces.mean[agent_id], result.mean[agent_id])
+            np.testing.assert_array_equal(without_traces.lower[agent_id], result.lower[agent_id])
+
+    def test_assert_hits(self):
+        result = colliding_balls().simulate_monte_carlo(12, 0.05, 3, seed=0)
+        tree = colliding_balls().simulate(12, 0.05)
+        self.assertEqual(result.hit_samples(), [0, 1, 2])
+        for time, labels in result.assert_hits:
+            self.assertEqual(dict(labels), dict(tree.root.assert_hits))
+            self.assertAlmostEqual(time, tree.root.trace['ball0'][-1, 0])
+
+    def test_simulate_multi(self):
+        trees = two_balls(uncertain=True).simulate_multi(12, 3, 0.05)
+        self.assertEqual(len(trees), 3)
+        self.assertTrue(all(isinstance(tree, AnalysisTree) for tree in trees))
+
+if __name__ == '__main__':
+    unittest.main()
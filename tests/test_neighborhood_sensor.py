@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+
+from verse.parser.vectorize import NotVectorizable
+from verse.sensor import BaseSensor, NeighborhoodSensor
+from ball_scenarios import scenario, BallMode, assert_trees_equal
+
+class StepNeighborhoodSensor(NeighborhoodSensor):
+    """The neighborhood sensor without sense_trace, so the scenarios sense one step at a time"""
+    sense_trace = BaseSensor.sense_trace
+
+def random_states(num_agents, num_rows, seed):
+    rng = np.random.RandomState(seed)
+    state_dict = {}
+    for i in range(num_agents):
+        positions = rng.uniform(0, 50, 2) + np.cumsum(rng.uniform(-3, 3, (num_rows, 2)), axis=0)
+        state_dict[f'agent{i}'] = (np.hstack([np.arange(num_rows)[:, None], positions, np.zeros((num_rows, 1))]), ['Mode'], [])
+    return state_dict
+
+def boxes(state_dict, reachtube):
+    positions = np.stack([state[:, 1:3] for state, _, _ in state_dict.values()], axis=1)
+    if not reachtube:
+        return positions, positions
+    return np.minimum(positions[0::2], positions[1::2]), np.maximum(positions[0::2], positions[1::2])
+
+def brute_force_neighbors(state_dict, reachtube, radius, k):
+    """The neighbors of each agent at each row, checking every pair of agents"""
+    lower, upper = boxes(state_dict, reachtube)
+    centers = (lower + upper) / 2
+    num_agents = lower.shape[1]
+    res = []
+    for row in range(len(lower)):
+        neighbors = []
+        for i in range(num_agents):
+            others = [j for j in range(num_agents) if j != i]
+            if k is not None:
+                others = sorted(others, key=lambda j: np.linalg.norm(centers[row, j] - centers[row, i]))[:k]
+            if radius is not None:
+                gaps = [np.maximum(np.maximum(lower[row, j] - upper[row, i], lower[row, i] - upper[row, j]), 0) for j in others]
+                others = [j for j, gap in zip(others, gaps) if np.linalg.norm(gap) <= radius]
+            neighbors.append(set(others))
+        res.append(neighbors)
+    return res
+
+def bouncing_balls(sensor, uncertain=False):
+    """Balls on rows close to each other, which pass each other at different times"""
+    width = 0.1 if uncertain else 0
+    inits = [[[1 + 2 * i, 1.5 * i, 2 + 0.3 * i, 0], [1 + 2 * i + width, 1.5 * i + width, 2 + 0.3 * i, 0]] for i in range(6)]
+    return scenario(inits, [BallMode.Right if i % 2 else BallMode.Left for i in range(6)], sensor)
+
+class TestNeighborhoodSensor(unittest.TestCase):
+    def test_neighbors(self):
+        state_dict = random_states(30, 6, 0)
+        for radius, k in [(6, None), (None, 3), (4, 10), (8, 30)]:
+            for reachtube in [False, True]:
+                neighbors = NeighborhoodSensor(radius=radius, k=k).neighbors(state_dict, reachtube)
+                self.assertEqual(neighbors, brute_force_neighbors(state_dict, reachtube, radius, k), (radius, k, reachtube))
+
+    def test_cache_follows_the_contents(self):
+        state_dict = random_states(10, 2, 1)
+        sensor = NeighborhoodSensor(radius=10)
+        neighbors = sensor.neighbors(state_dict)
+        self.assertIs(sensor.neighbors(state_dict), neighbors)
+        # The same arrays, modified in place
+        for state, _, _ in state_dict.values():
+            state[:, 1:3] = 0
+        everyone = [set(range(10)) - {i} for i in range(10)]
+        self.assertEqual(sensor.neighbors(state_dict), [everyone] * 2)
+        # The same positions, as the bounds of a reachtube
+        self.assertEqual(sensor.neighbors(state_dict, reachtube=True), [everyone])
+
+    def test_changing_neighbors(self):
+        state_dict = {
+            'ball0': (np.array([[0, 0, 0, 0], [1, 0, 0, 0]]), ['Mode'], []),
+            'ball1': (np.array([[0, 1, 0, 0], [1, 5, 0, 0]]), ['Mode'], []),
+        }
+        sensor = NeighborhoodSensor(radius=2)
+        self.assertEqual(sensor.neighbors(state_dict), [[{1}, {0}], [set(), set()]])
+        ego = bouncing_balls(sensor).agent_dict['ball0']
+        with self.assertRaises(NotVectorizable):
+            sensor.sense_trace(None, ego, state_dict, None)
+        # As a reachtube, the box of the two rows stays within radius
+        sensor.sense_trace(None, ego, state_dict, None, reachtube=True)
+
+    def test_simulation(self):
+        tree = bouncing_balls(StepNeighborhoodSensor(radius=2)).simulate(10, 0.05)
+        assert_trees_equal(self, tree, bouncing_balls(NeighborhoodSensor(radius=2)).simulate(10, 0.05))
+        # The guards and asserts only depend on the balls within radius
+        assert_trees_equal(self, tree, bouncing_balls(BaseSensor()).simulate(10, 0.05))
+
+    def test_verification(self):
+        np.random.seed(0)
+        tree = bouncing_balls(StepNeighborhoodSensor(radius=2), uncertain=True).verify(6, 0.05)
+        np.random.seed(0)
+        assert_trees_equal(self, tree, bouncing_balls(NeighborhoodSensor(radius=2), uncertain=True).verify(6, 0.05))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+
+import numpy as np
+
+from verse.analysis import AnalysisTreeNode, Verifier
+from ball_scenarios import one_ball
+
+def verify(params):
+    np.random.seed(0)
+    return one_ball(uncertain=True).verify(20, 0.05, params=params)
+
+def node(init, start_time):
+    return AnalysisTreeNode(init={'car': init}, mode={'car': ['Normal']}, static={'car': []}, agent={'car': None}, start_time=start_time)
+
+class TestPruneCovered(unittest.TestCase):
+    def test_revisited_modes_are_pruned(self):
+        tree = verify({})
+        pruned = verify({'prune_covered': True})
+        self.assertLess(len(pruned.nodes), len(tree.nodes))
+        covered = [node for node in pruned.nodes if node.covered_by is not None]
+        self.assertEqual(len(covered), 1)
+        # The tree is the same up to the covered node, which isn't explored
+        explored = [node for node in pruned.nodes if node.covered_by is None]
+        for explored_node, tree_node in zip(explored, tree.nodes):
+            self.assertEqual(list(explored_node.mode['ball0']), list(tree_node.mode['ball0']))
+            self.assertEqual(explored_node.start_time, tree_node.start_time)
+            np.testing.assert_array_equal(explored_node.trace['ball0'], tree_node.trace['ball0'])
+        node = covered[0]
+        self.assertEqual(node.child, [])
+        self.assertEqual(list(node.mode['ball0']), list(node.covered_by.mode['ball0']))
+        self.assertLessEqual(node.covered_by.start_time, node.start_time)
+        # Only the box of the first step is kept, which is in the initial set of the covering node
+        box = node.trace['ball0'][:, 1:]
+        self.assertEqual(len(box), 2)
+        covering_init = np.array(node.covered_by.init['ball0'])
+        self.assertTrue(np.all(covering_init[:, 0].min(axis=0) <= box[0]) and np.all(box[1] <= covering_init[:, 1].max(axis=0)))
+
+    def test_containment_check(self):
+        verifier = Verifier()
+        verifier.visited = {}
+        visited = node([[[0, 0], [1, 1]], [[1, 0], [2, 2]]], 1)
+        verifier.add_visited(visited)
+        # Contained in the union of the boxes, each box in one of them
+        self.assertIs(verifier.find_covering_node(node([[[0.5, 0.5], [1, 1]], [[1.5, 1], [2, 2]]], 2)), visited)
+        self.assertIsNone(verifier.find_covering_node(node([[[0.5, 0.5], [1.5, 1]]], 2)))
+        # Nodes starting before the visited node aren't covered by it
+        self.assertIsNone(verifier.find_covering_node(node([[[0.5, 0.5], [1, 1]]], 0.5)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from verse.analysis.reset_merge import merge_reset_rects
+from ball_scenarios import scenario, BallMode
+
+def overlapping_bounces(params):
+    """Two balls reaching the wall at overlapping times, so the order of their bounces branches the tree"""
+    np.random.seed(0)
+    return scenario([[[2, 0, 3, 0], [2.6, 0, 3, 0]], [[7.8, 5, 0.8, 0], [8.4, 5, 0.8, 0]]], [BallMode.Right, BallMode.Right]).verify(6, 0.05, params=params)
+
+def contains(box, rect):
+    return np.all(np.array(box[0]) <= np.array(rect[0]) + 1e-12) and np.all(np.array(rect[1]) <= np.array(box[1]) + 1e-12)
+
+def assert_tube_contains(test, tube, other):
+    """Check that each step of other is contained in the step of tube starting at the same time"""
+    tube, other = np.asarray(tube), np.asarray(other)
+    for lower, upper in zip(other[0::2], other[1::2]):
+        step = np.flatnonzero(np.isclose(tube[0::2, 0], lower[0]))
+        test.assertEqual(len(step), 1)
+        test.assertTrue(contains(tube[2 * step[0]:2 * step[0] + 2, 1:], [lower[1:], upper[1:]]))
+
+class TestResetMerge(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        lower = rng.uniform(0, 10, (20, 3))
+        self.rects = np.stack((lower, lower + rng.uniform(0, 1, (20, 3))), axis=1).tolist()
+        self.times = np.linspace(0, 2, 20).tolist()
+
+    def test_policies_contain_the_rects(self):
+        for params, max_boxes in [({}, 20), ({'reset_merge': 'hull'}, 1), ({'reset_merge': 'kmeans', 'reset_merge_k': 3}, 3), ({'reset_merge': 'window', 'reset_merge_window': 0.5}, 5)]:
+            boxes = merge_reset_rects(self.rects, self.times, params)
+            self.assertLessEqual(len(boxes), max_boxes)
+            for rect in self.rects:
+                self.assertTrue(any(contains(box, rect) for box in boxes), params)
+        with self.assertRaises(ValueError):
+            merge_reset_rects(self.rects, self.times, {'reset_merge': 'unknown'})
+
+    def test_merged_resets_contain_the_tree(self):
+        tree = overlapping_bounces({})
+        merged = overlapping_bounces({'reset_merge': 'hull'})
+        self.assertEqual(len(merged.nodes), len(tree.nodes))
+        for node, merged_node in zip(tree.nodes, merged.nodes):
+            self.assertEqual(node.mode, merged_node.mode)
+            for agent_id, init in node.init.items():
+                self.assertEqual(len(merged_node.init[agent_id]), 1)
+                self.assertTrue(all(contains(merged_node.init[agent_id][0], rect) for rect in init))
+            for agent_id in node.trace:
+                assert_tube_contains(self, merged_node.trace[agent_id], node.trace[agent_id])
+
+    def test_merged_siblings_contain_them(self):
+        tree = overlapping_bounces({})
+        merged = overlapping_bounces({'merge_siblings': True})
+        covered = [node for node in merged.nodes if node.covered_by is not None]
+        self.assertEqual(len(covered), 2)
+        merged_node = covered[0].covered_by
+        self.assertIs(covered[1].covered_by, merged_node)
+        # The nodes in the tree without merging are the ones covered, which are not explored
+        leaves = [node for node in tree.nodes if not node.child and node.mode == merged_node.mode]
+        self.assertEqual(len(leaves), 2)
+        for leaf, covered_node in zip(leaves, covered):
+            self.assertEqual(covered_node.child, [])
+            self.assertGreaterEqual(leaf.start_time, merged_node.start_time)
+            for rect in leaf.init['ball0']:
+                self.assertTrue(any(contains(box, rect) for box in merged_node.init['ball0']))
+            for agent_id in leaf.trace:
+                assert_tube_contains(self, merged_node.trace[agent_id], leaf.trace[agent_id])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+import numpy as np
+
+from verse.agents.example_agent.ball_agent import BallAgent
+from verse.parser.vectorize import NotVectorizable
+from verse.sensor import BaseSensor
+from ball_scenarios import CONTROLLER, two_balls
+
+# The controller of the balls without the argument for the others
+EGO_ONLY_CONTROLLER = CONTROLLER.replace("def controller(ego: State, others: List[State]):", "def controller(ego: State):").replace(
+    "    assert not any(", "    # assert not any(")
+
+def trace_dict(tree):
+    """The traces of the root of tree, with the modes and statics of the agents"""
+    return {agent_id: (np.asarray(trace), tree.root.mode[agent_id], tree.root.static[agent_id]) for agent_id, trace in tree.root.trace.items()}
+
+def assert_sensed_equal(test, cont, other):
+    test.assertEqual(cont.keys(), other.keys())
+    for k in cont:
+        np.testing.assert_array_equal(np.asarray(cont[k], dtype=float), np.asarray(other[k], dtype=float))
+
+class TestSenseTrace(unittest.TestCase):
+    def setUp(self):
+        self.sensor = BaseSensor()
+
+    def test_simulation(self):
+        scenario = two_balls()
+        traces = trace_dict(scenario.simulate(2, 0.05))
+        for agent in scenario.agent_dict.values():
+            cont, disc, len_dict = self.sensor.sense_trace(scenario, agent, traces, scenario.map)
+            for row in range(len(traces[agent.id][0])):
+                state_dict = {agent_id: (trace[row], mode, static) for agent_id, (trace, mode, static) in traces.items()}
+                step_cont, step_disc, step_len_dict = self.sensor.sense(scenario, agent, state_dict, scenario.map)
+                assert_sensed_equal(self, BaseSensor.sense_step(cont, row), step_cont)
+                self.assertEqual(disc, step_disc)
+                self.assertEqual(len_dict, step_len_dict)
+
+    def test_reachtube(self):
+        scenario = two_balls(uncertain=True)
+        np.random.seed(0)
+        tubes = trace_dict(scenario.verify(2, 0.05))
+        for agent in scenario.agent_dict.values():
+            cont, disc, len_dict = self.sensor.sense_trace(scenario, agent, tubes, scenario.map, reachtube=True)
+            for step in range(len(tubes[agent.id][0]) // 2):
+                rows = slice(2 * step, 2 * step + 2)
+                state_dict = {agent_id: (tube[rows], mode, static) for agent_id, (tube, mode, static) in tubes.items()}
+                step_cont, step_disc, step_len_dict = self.sensor.sense(scenario, agent, state_dict, scenario.map)
+                assert_sensed_equal(self, BaseSensor.sense_step(cont, rows), step_cont)
+                self.assertEqual(disc, step_disc)
+                self.assertEqual(len_dict, step_len_dict)
+
+    def test_without_others(self):
+        scenario = two_balls()
+        traces = trace_dict(scenario.simulate(2, 0.05))
+        agent = BallAgent('ball0', code=EGO_ONLY_CONTROLLER)
+        # The others are skipped in simulations, as sense does
+        cont, _, _ = self.sensor.sense_trace(scenario, agent, traces, scenario.map)
+        self.assertTrue(all(k.startswith('ego.') for k in cont))
+        step_cont, _, _ = self.sensor.sense(scenario, agent, {agent_id: (trace[3], mode, static) for agent_id, (trace, mode, static) in traces.items()}, scenario.map)
+        assert_sensed_equal(self, BaseSensor.sense_step(cont, 3), step_cont)
+        # sense rejects the reachtubes of the others, so they are sensed one step at a time
+        with self.assertRaises(NotVectorizable):
+            self.sensor.sense_trace(scenario, agent, traces, scenario.map, reachtube=True)
+        self.sensor.sense_trace(scenario, agent, {'ball0': traces['ball0']}, scenario.map, reachtube=True)
+
+if __name__ == '__main__':
+    unittest.main()
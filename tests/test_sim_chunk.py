@@ -0,0 +1,23 @@
+import unittest
+
+from ball_scenarios import two_balls, colliding_balls, StepSensor, assert_trees_equal
+
+# The chunked traces are continued from the start time of each window, so their times can differ in the last bits
+class TestSimulationChunks(unittest.TestCase):
+    def test_same_tree(self):
+        tree = two_balls().simulate(12, 0.05)
+        for chunk in [0.05, 0.3, 1, 100]:
+            assert_trees_equal(self, tree, two_balls().simulate(12, 0.05, params={'sim_chunk': chunk}), atol=1e-9)
+
+    def test_per_step_sensor(self):
+        tree = two_balls(sensor=StepSensor()).simulate(12, 0.05)
+        assert_trees_equal(self, tree, two_balls(sensor=StepSensor()).simulate(12, 0.05, params={'sim_chunk': 0.3}), atol=1e-9)
+
+    def test_assert_hit(self):
+        tree = colliding_balls().simulate(12, 0.05)
+        chunked = colliding_balls().simulate(12, 0.05, params={'sim_chunk': 0.3})
+        assert_trees_equal(self, tree, chunked, atol=1e-9)
+        self.assertTrue(chunked.root.assert_hits)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from verse.analysis import TubeCache
+from ball_scenarios import two_balls, assert_trees_equal
+
+def verify(params):
+    # The tubes of DryVR depend on the sampled traces
+    np.random.seed(0)
+    return two_balls(uncertain=True).verify(12, 0.05, params=params)
+
+def tube(init, horizon, time_step=0.5):
+    lower, upper = np.array(init, dtype=float)[0]
+    times = np.arange(0, horizon, time_step)
+    tube = np.empty((2 * len(times), 1 + len(lower)))
+    tube[0::2, 0], tube[1::2, 0] = times, times + time_step
+    tube[0::2, 1:], tube[1::2, 1:] = lower - times[:, None], upper + times[:, None]
+    return tube
+
+class TestTubeCache(unittest.TestCase):
+    def test_verification_with_cache(self):
+        tree = verify({})
+        cache = TubeCache()
+        assert_trees_equal(self, tree, verify({'tube_cache': cache}), atol=1e-9)
+        misses = cache.misses
+        self.assertGreater(misses, 0)
+        assert_trees_equal(self, tree, verify({'tube_cache': cache}), atol=1e-9)
+        self.assertEqual(cache.misses, misses)
+        self.assertGreater(cache.hits, 0)
+
+    def test_superset_reuse(self):
+        cache = TubeCache()
+        init = [[[0, 0], [1, 1]]]
+        cache.put('group', init, 2, tube(init, 2))
+        np.testing.assert_array_equal(cache.get('group', init, 2), tube(init, 2))
+        # A shorter horizon truncates the tube
+        np.testing.assert_array_equal(cache.get('group', init, 1), tube(init, 1))
+        # Contained initial sets reuse the tube of the larger set
+        np.testing.assert_array_equal(cache.get('group', [[[0.2, 0.5], [0.4, 1]]], 1.5), tube(init, 1.5))
+        self.assertIsNone(cache.get('group', [[[0.2, 0.5], [0.4, 1.5]]], 1))
+        self.assertIsNone(cache.get('group', init, 3))
+        self.assertIsNone(cache.get('other group', init, 1))
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        exact = TubeCache(reuse_supersets=False)
+        exact.put('group', init, 2, tube(init, 2))
+        self.assertIsNone(exact.get('group', [[[0.2, 0.5], [0.4, 1]]], 1))
+
+    def test_directory(self):
+        init = [[[0, 0], [1, 1]]]
+        with tempfile.TemporaryDirectory() as directory:
+            TubeCache(directory=directory).put('group', init, 2, tube(init, 2))
+            np.testing.assert_array_equal(TubeCache(directory=directory).get('group', init, 2), tube(init, 2))
+
+if __name__ == '__main__':
+    unittest.main()
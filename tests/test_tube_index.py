@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+from verse.analysis.tube_index import TubeIndex
+from ball_scenarios import two_balls
+
+class TestTubeIndex(unittest.TestCase):
+    def test_hulls_bound_their_steps(self):
+        rng = np.random.RandomState(0)
+        for length in [1, 2, 7, 64, 100]:
+            lower = rng.uniform(-1, 1, (length, 3))
+            tube = np.empty((2 * length, 3))
+            tube[0::2] = lower
+            tube[1::2] = lower + rng.uniform(0, 1, (length, 3))
+            index = TubeIndex(tube)
+            self.assertEqual(index.num_blocks(index.depth), 1)
+            for level in range(index.depth + 1):
+                blocks = np.arange(index.num_blocks(level))
+                hulls = index.hulls(level, blocks)
+                covered = []
+                for block in blocks:
+                    start, stop = index.block_range(level, block)
+                    covered += range(start, stop)
+                    # The hull is the bounding box of the steps of the block, as computed directly from the tube
+                    np.testing.assert_array_equal(hulls[2 * block], tube[2 * start:2 * stop:2].min(axis=0))
+                    np.testing.assert_array_equal(hulls[2 * block + 1], tube[2 * start + 1:2 * stop:2].max(axis=0))
+                self.assertEqual(covered, list(range(length)))
+
+    def test_skipped_steps_match_every_step(self):
+        # Descending the index skips the same steps as checking the box of each step
+        scenario = two_balls(uncertain=True)
+        for node in scenario.verify(12, 0.05).nodes:
+            guard_paths = {agent_id: scenario.agent_dict[agent_id].controller.mode_paths(node.mode[agent_id]) for agent_id in node.agent}
+            num_steps = len(node.trace['ball0']) // 2
+            skippable = scenario._skippable_verify_steps(node, guard_paths, num_steps)
+            decided = scenario._decided_boxes(node, node.trace, guard_paths, num_steps, False)
+            np.testing.assert_array_equal(skippable, decided)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import ast
+import unittest
+
+import numpy as np
+
+from verse.parser.vectorize import compile_vectorized, eval_vectorized, NotVectorizable
+from ball_scenarios import two_balls, colliding_balls, StepSensor, assert_trees_equal
+
+def vectorize(expr):
+    return compile_vectorized(ast.parse(expr, mode='eval').body)
+
+class TestVectorizedGuards(unittest.TestCase):
+    def test_matches_pointwise_eval(self):
+        x = np.linspace(-3, 3, 25)
+        y = np.linspace(2, -2, 25)
+        funcs = {'f': lambda v: v if v > 0 else -2 * v}
+        for expr in ['x > 1 and not y < 0', '0 < x < 2 or y > 1', '(x if y > 0 else y) > 0.5', 'f(x) > 1 and f(y) < 3',
+                     'any(x > t for t in [1, 2]) and all(y < t for t in [1, 2])']:
+            expected = [eval(expr, {**funcs, 'x': u, 'y': v}) for u, v in zip(x.tolist(), y.tolist())]
+            res = eval_vectorized(vectorize(expr), {**funcs, 'x': x, 'y': y}, len(x))
+            np.testing.assert_array_equal(res, expected, err_msg=expr)
+
+    def test_constant_is_broadcast(self):
+        np.testing.assert_array_equal(eval_vectorized(vectorize('a > 1'), {'a': 2}, 4), [True] * 4)
+
+    def test_unvectorizable(self):
+        self.assertIsNone(vectorize('f(x, y=1)'))
+        with self.assertRaises(NotVectorizable):
+            eval_vectorized(vectorize('f(x)[0] > 1'), {'f': lambda v: [v, v], 'x': np.zeros(3)}, 3)
+
+    def test_simulation_matches_step_by_step(self):
+        assert_trees_equal(self, two_balls(sensor=StepSensor()).simulate(12, 0.05), two_balls().simulate(12, 0.05))
+
+    def test_assert_matches_step_by_step(self):
+        tree = colliding_balls().simulate(12, 0.05)
+        self.assertEqual(tree.root.assert_hits, {'ball0': ['collision'], 'ball1': ['collision']})
+        assert_trees_equal(self, colliding_balls(sensor=StepSensor()).simulate(12, 0.05), tree)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from ball_scenarios import scenario, two_balls, BallMode, StepSensor, assert_trees_equal
+
+def verify(params, sensor=None):
+    # The tubes of DryVR depend on the sampled traces
+    np.random.seed(0)
+    return two_balls(uncertain=True, sensor=sensor).verify(12, 0.05, params=params)
+
+def overlapping_bounces(params):
+    """Two balls reaching the wall at overlapping times, whose children are merged with merge_siblings"""
+    np.random.seed(0)
+    return scenario([[[2, 0, 3, 0], [2.6, 0, 3, 0]], [[7.8, 5, 0.8, 0], [8.4, 5, 0.8, 0]]], [BallMode.Right, BallMode.Right]).verify(6, 0.05, params=params)
+
+class TestVerificationWindows(unittest.TestCase):
+    def test_same_tree(self):
+        tree = verify({})
+        for window in [0.05, 0.5, 2, 100]:
+            assert_trees_equal(self, tree, verify({'verify_window': window}), atol=1e-9)
+
+    def test_per_step_sensor(self):
+        tree = verify({}, StepSensor())
+        assert_trees_equal(self, tree, verify({'verify_window': 0.5}, StepSensor()), atol=1e-9)
+
+    def test_merged_siblings(self):
+        # The tubes of the merged children are extended from their last box instead of recomputed
+        tree = overlapping_bounces({'merge_siblings': True})
+        windowed = overlapping_bounces({'merge_siblings': True, 'verify_window': 0.5})
+        assert_trees_equal(self, tree, windowed, atol=1e-9)
+        self.assertEqual([node.covered_by is None for node in windowed.nodes], [node.covered_by is None for node in tree.nodes])
+        self.assertTrue(any(node.covered_by is not None for node in windowed.nodes))
+
+if __name__ == '__main__':
+    unittest.main()
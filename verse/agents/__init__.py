@@ -1,2 +1,3 @@
 from verse.agents.base_agent import BaseAgent
 from verse.agents import base_agent
+from verse.agents import integrator
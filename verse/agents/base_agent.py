@@ -1,6 +1,6 @@
 from verse.parser.parser import ControllerIR
 import numpy as np 
-from scipy.integrate import ode
+from verse.agents.integrator import integrate_trace
 import copy
 
 class BaseAgent:
@@ -10,6 +10,11 @@ class BaseAgent:
         Methods
         -------
         TC_simulate
+        TC_simulate_batch (optional)
+            TC_simulate_batch(mode, initialSets, time_horizon, time_step, map=None) -> np.ndarray
+            Simulates all the rows of initialSets (shape (N, d)) together and returns the
+            traces as an array of shape (N, T, d+1). When an agent provides it, DryVR
+            uses it to simulate all the sampled initial points at once.
     """
     def __init__(self, id, code = None, file_name = None, initial_state = None, initial_mode = None, static_param = None, uncertain_param = None): 
         """
@@ -66,16 +71,4 @@ class BaseAgent:
             map: LaneMap, optional
                 Provided if the map is used 
         """
-        time_bound = float(time_horizon)
-        number_points = int(np.ceil(time_bound/time_step))
-        t = [round(i*time_step, 10) for i in range(0, number_points)]
-        # note: digit of time
-        init = initialSet
-        trace = [[0]+init]
-        for i in range(len(t)):
-            r = ode(self.dynamics)
-            r.set_initial_value(init)
-            res: np.ndarray = r.integrate(r.t + time_step)
-            init = res.flatten().tolist()
-            trace.append([t[i] + time_step] + init)
-        return np.array(trace)
\ No newline at end of file
+        return integrate_trace(self.dynamics, initialSet, time_horizon, time_step)
\ No newline at end of file
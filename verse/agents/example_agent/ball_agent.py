@@ -6,6 +6,7 @@ from scipy.integrate import ode
 
 from verse import BaseAgent
 from verse import LaneMap
+from verse.agents.integrator import integrate_trace
 
 
 class BallAgent(BaseAgent):
@@ -31,23 +32,39 @@ class BallAgent(BaseAgent):
         vy_dot = 0
         return [x_dot, y_dot, vx_dot, vy_dot]
 
+    @staticmethod
+    def dynamic_batch(t, state):
+        '''Vectorized RHS for a batch of balls, state has shape (N, 4)'''
+        x, y, vx, vy = state.T
+        x_dot = vx
+        y_dot = vy
+        vx_dot = np.zeros_like(vx)
+        vy_dot = np.zeros_like(vy)
+        return np.column_stack((x_dot, y_dot, vx_dot, vy_dot))
+
     def TC_simulate(self, mode: List[str], initialCondition, time_bound, time_step, lane_map: LaneMap = None) -> np.ndarray:
         # TODO: P1. Should TC_simulate really be part of the agent definition or should it be something more generic?
         # TODO: P2. Looks like this should be a global parameter; some config file should be setting this.
+        return integrate_trace(self.dynamic, initialCondition, time_bound, time_step)
+
+    def TC_simulate_batch(self, mode: List[str], initialSets, time_bound, time_step, lane_map: LaneMap = None) -> np.ndarray:
         time_bound = float(time_bound)
         number_points = int(np.ceil(time_bound/time_step))
         t = [round(i*time_step, 10) for i in range(0, number_points)]
 
-        init = initialCondition
-        trace = [[0]+init]
+        init = np.array(initialSets, dtype=float)
+        num_traces, num_dim = init.shape
+        trace = np.zeros((num_traces, len(t) + 1, num_dim + 1))
+        trace[:, 0, 1:] = init
+        # All the balls are integrated as one system
+        r = ode(lambda t, state: self.dynamic_batch(t, state.reshape(num_traces, num_dim)).ravel())
+        r.set_initial_value(init.ravel())
         for i in range(len(t)):
-            r = ode(self.dynamic)
-            r.set_initial_value(init)
             res: np.ndarray = r.integrate(r.t + time_step)
-            init = res.flatten().tolist()
-            trace.append([t[i] + time_step] + init)
+            trace[:, i + 1, 0] = t[i] + time_step
+            trace[:, i + 1, 1:] = res.reshape(num_traces, num_dim)
 
-        return np.array(trace)
+        return trace
 
 
 if __name__ == '__main__':
@@ -2,11 +2,11 @@
 from typing import Tuple, List
 
 import numpy as np 
-from scipy.integrate import ode
 
 from verse import BaseAgent
 from verse import LaneMap
 from verse.parser import ControllerIR
+from verse.agents.integrator import integrate_trace
 
 class NPCAgent(BaseAgent):
     def __init__(self, id, initial_state=None, initial_mode=None):
@@ -42,21 +42,10 @@ class NPCAgent(BaseAgent):
         return steering, a  
 
     def TC_simulate(self, mode: List[str], initialCondition, time_bound, time_step, lane_map:LaneMap=None)->np.ndarray:
-        time_bound = float(time_bound)
-        number_points = int(np.ceil(time_bound/time_step))
-        t = [i*time_step for i in range(0,number_points)]
-
-        init = initialCondition
-        trace = [[0]+init]
-        for i in range(len(t)):
-            steering, a = self.action_handler(mode, init, lane_map)
-            r = ode(self.dynamic)    
-            r.set_initial_value(init).set_f_params([steering, a])      
-            res:np.ndarray = r.integrate(r.t + time_step)
-            init = res.flatten().tolist()
-            trace.append([t[i] + time_step] + init) 
-
-        return np.array(trace)
+        return integrate_trace(
+            self.dynamic, initialCondition, time_bound, time_step,
+            control=lambda state: self.action_handler(mode, state, lane_map)
+        )
 
 class CarAgent(BaseAgent):
     def __init__(self, id, code = None, file_name = None, initial_state = None, initial_mode = None):
@@ -108,24 +97,18 @@ class CarAgent(BaseAgent):
         steering = np.clip(steering, -0.61, 0.61)
         return steering, a  
 
-    def TC_simulate(self, mode: List[str], initialCondition, time_bound, time_step, lane_map:LaneMap=None)->np.ndarray:
-        time_bound = float(time_bound)
-        number_points = int(np.ceil(time_bound/time_step))
-        t = [round(i*time_step,10) for i in range(0,number_points)]
-
-        init = initialCondition
-        trace = [[0]+init]
-        for i in range(len(t)):
-            steering, a = self.action_handler(mode, init, lane_map)
-            r = ode(self.dynamic)    
-            r.set_initial_value(init).set_f_params([steering, a])      
-            res:np.ndarray = r.integrate(r.t + time_step)
-            init = res.flatten().tolist()
-            if init[3] < 0:
-                init[3] = 0
-            trace.append([t[i] + time_step] + init) 
+    @staticmethod
+    def _clip_speed(state):
+        if state[3] < 0:
+            state[3] = 0
+        return state
 
-        return np.array(trace)
+    def TC_simulate(self, mode: List[str], initialCondition, time_bound, time_step, lane_map:LaneMap=None)->np.ndarray:
+        return integrate_trace(
+            self.dynamic, initialCondition, time_bound, time_step,
+            control=lambda state: self.action_handler(mode, state, lane_map),
+            post_step=self._clip_speed
+        )
 
 class WeirdCarAgent(CarAgent):
     def __init__(self, id, code = None, file_name = None):
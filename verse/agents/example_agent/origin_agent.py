@@ -6,6 +6,7 @@ from scipy.integrate import ode
 
 from verse import BaseAgent
 from verse import LaneMap
+from verse.agents.integrator import integrate_trace
 
 
 class vanderpol_agent(BaseAgent):
@@ -23,19 +24,7 @@ class vanderpol_agent(BaseAgent):
         return [x_dot, y_dot]
 
     def TC_simulate(self, mode: List[str], initialCondition, time_bound, time_step, lane_map: LaneMap = None) -> np.ndarray:
-        time_bound = float(time_bound)
-        number_points = int(np.ceil(time_bound/time_step))
-        t = [round(i*time_step, 10) for i in range(0, number_points)]
-        # note: digit of time
-        init = initialCondition
-        trace = [[0]+init]
-        for i in range(len(t)):
-            r = ode(self.dynamic)
-            r.set_initial_value(init)
-            res: np.ndarray = r.integrate(r.t + time_step)
-            init = res.flatten().tolist()
-            trace.append([t[i] + time_step] + init)
-        return np.array(trace)
+        return integrate_trace(self.dynamic, initialCondition, time_bound, time_step)
 
 
 class thermo_agent(BaseAgent):
@@ -65,20 +54,8 @@ class thermo_agent(BaseAgent):
         return rate
 
     def TC_simulate(self, mode: List[str], initialCondition, time_bound, time_step, lane_map: LaneMap = None) -> np.ndarray:
-        time_bound = float(time_bound)
-        number_points = int(np.ceil(time_bound/time_step))
-        t = [round(i*time_step, 10) for i in range(0, number_points)]
-
-        init = initialCondition
-        trace = [[0]+init]
-        for i in range(len(t)):
-            rate = self.action_handler(mode[0])
-            r = ode(self.dynamic)
-            r.set_initial_value(init).set_f_params(rate)
-            res: np.ndarray = r.integrate(r.t + time_step)
-            init = res.flatten().tolist()
-            trace.append([t[i] + time_step] + init)
-        return np.array(trace)
+        rate = self.action_handler(mode[0])
+        return integrate_trace(self.dynamic, initialCondition, time_bound, time_step, control=lambda state: rate)
 
 
 class craft_agent(BaseAgent):
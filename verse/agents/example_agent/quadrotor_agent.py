@@ -103,8 +103,8 @@ class QuadrotorAgent(BaseAgent):
     def runModel(self, mode, initalCondition, time_bound, time_step, ref_input, lane_map: LaneMap_3d):
         init = initalCondition
         trajectory = [init]
+        # a single solver is restarted from the current state at every step
         r = ode(self.dynamic)
-        # r.set_initial_value(init)
         ex_list = []
         ey_list = []
         ez_list = []
@@ -143,7 +143,6 @@ class QuadrotorAgent(BaseAgent):
             df = self.action_handler(mode[0], init, lane_map)
             u = u+[df]
             init = trajectory[i]  # len 11
-            r = ode(self.dynamic)
             r.set_initial_value(init)
             r.set_f_params(u)
             val = r.integrate(r.t + time_step)
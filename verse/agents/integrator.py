@@ -0,0 +1,106 @@
+from typing import Callable, Optional
+
+import numpy as np
+from scipy.integrate import ode
+
+def euler_step(dynamics: Callable, t: float, state: np.ndarray, time_step: float, args=()) -> np.ndarray:
+    """
+    Advance the state by one explicit Euler step
+
+    Parameters
+    ----------
+        dynamics: Callable
+            Right hand side of the ode, called as dynamics(t, state, *args)
+        t: float
+            Time at the beginning of the step
+        state: np.ndarray
+            State at the beginning of the step
+        time_step: float
+            Length of the step
+        args: tuple
+            Extra arguments passed to dynamics, e.g. the control input
+    """
+    return state + time_step * np.asarray(dynamics(t, state, *args), dtype=float)
+
+def rk4_step(dynamics: Callable, t: float, state: np.ndarray, time_step: float, args=()) -> np.ndarray:
+    """
+    Advance the state by one classical Runge-Kutta (RK4) step, see euler_step for the parameters
+    """
+    half_step = time_step / 2
+    k1 = np.asarray(dynamics(t, state, *args), dtype=float)
+    k2 = np.asarray(dynamics(t + half_step, state + half_step * k1, *args), dtype=float)
+    k3 = np.asarray(dynamics(t + half_step, state + half_step * k2, *args), dtype=float)
+    k4 = np.asarray(dynamics(t + time_step, state + time_step * k3, *args), dtype=float)
+    return state + time_step / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+FIXED_STEP_KERNELS = {
+    'euler': euler_step,
+    'rk4': rk4_step,
+}
+
+def integrate_trace(
+    dynamics: Callable,
+    init,
+    time_horizon: float,
+    time_step: float,
+    control: Optional[Callable] = None,
+    post_step: Optional[Callable] = None,
+    method: str = 'vode'
+) -> np.ndarray:
+    """
+    Simulate dynamics with a control input that is held constant during each time step
+
+    Parameters
+    ----------
+        dynamics: Callable
+            Right hand side of the ode. Called as dynamics(t, state, u) if control is provided
+            and as dynamics(t, state) otherwise
+        init: List[float]
+            The initial condition of the simulation
+        time_horizon: float
+            The time horizon for simulation
+        time_step: float
+            The time step of the simulation, also the period of the control input
+        control: Callable, optional
+            Called as control(state) at the beginning of each time step, returns the control input
+            u used during that step (e.g. a wrapped action_handler)
+        post_step: Callable, optional
+            Called as post_step(state) after each step, returns the (possibly modified) state,
+            e.g. for clipping the state
+        method: str
+            'euler' and 'rk4' use the fixed step kernels. Any other value is passed to scipy's
+            ode.set_integrator. The solver object is built once, but restarted from the state at
+            each step (which resets its step size history), as a new solver per step would be
+
+    Returns
+    -------
+        The trace as an array, each row is the time followed by the state
+    """
+    time_bound = float(time_horizon)
+    number_points = int(np.ceil(time_bound/time_step))
+    t = [round(i*time_step, 10) for i in range(0, number_points)]
+    state = np.array(init, dtype=float)
+    trace = np.zeros((number_points + 1, state.shape[0] + 1))
+    trace[0, 1:] = state
+
+    kernel = FIXED_STEP_KERNELS.get(method)
+    solver = None
+    if kernel is None:
+        solver = ode(dynamics).set_integrator(method)
+
+    args = ()
+    for i in range(number_points):
+        if control is not None:
+            args = (control(state),)
+        if kernel is not None:
+            state = kernel(dynamics, t[i], state, time_step, args)
+        else:
+            # Restarting the same solver from the current state is equivalent to
+            # creating a new one, without the cost of building it every step
+            solver.set_initial_value(state).set_f_params(*args)
+            state = solver.integrate(solver.t + time_step)
+        if post_step is not None:
+            state = post_step(state)
+        trace[i + 1, 0] = t[i] + time_step
+        trace[i + 1, 1:] = state
+    return trace
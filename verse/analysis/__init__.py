@@ -1,5 +1,7 @@
 from .analysis_tree import *
 from .simulator import Simulator
 from .verifier import Verifier
+from .monte_carlo import MonteCarloSimulator, MonteCarloResult
+from .tube_cache import TubeCache
 
 from . import simulator, verifier, analysis_tree
@@ -1,13 +1,21 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import json
+import struct
+
+import numpy as np
 
 class AnalysisTreeNode:
     """AnalysisTreeNode class
     A AnalysisTreeNode stores the continous execution of the system without transition happening"""
     trace: Dict
     """The trace for each agent. 
-    The key of the dict is the agent id and the value of the dict is simulated traces for each agent"""
+    The key of the dict is the agent id and the value of the dict is simulated traces for each agent.
+    Each trace is a float64 array with the time in the first column and the states in the other columns.
+    For reachtubes, the rows alternate between the lower and upper bound of each time step"""
     init: Dict 
+    covered_by: Optional["AnalysisTreeNode"]
+    """For the nodes pruned by the containment check of the verifier, the node whose initial set contained theirs.
+    Pruned nodes are leaves, their trace is only the box of their first time step"""
     
     def __init__(
         self,
@@ -35,8 +43,9 @@ class AnalysisTreeNode:
         self.static: Dict[str, List[str]] = static
         self.uncertain_param: Dict[str, List[str]] = uncertain_param
         self.id: int = id
+        self.covered_by: Optional[AnalysisTreeNode] = None
 
-    def to_dict(self):
+    def to_dict(self, include_trace: bool = True):
         rst_dict = {
             'id': self.id, 
             'parent': None, 
@@ -46,10 +55,12 @@ class AnalysisTreeNode:
             'mode': self.mode, 
             'static': self.static, 
             'start_time': self.start_time,
-            'trace': self.trace, 
             'type': self.type, 
-            'assert_hits': self.assert_hits
+            'assert_hits': self.assert_hits,
+            'covered_by': None if self.covered_by is None else self.covered_by.id
         }
+        if include_trace:
+            rst_dict['trace'] = {agent_id: np.asarray(trace).tolist() for agent_id, trace in self.trace.items()}
         agent_dict = {}
         for agent_id in self.agent:
             agent_dict[agent_id] = f'{type(self.agent[agent_id])}'
@@ -60,7 +71,7 @@ class AnalysisTreeNode:
     @staticmethod
     def from_dict(data) -> "AnalysisTreeNode":
         return AnalysisTreeNode(
-            trace = data['trace'],
+            trace = {agent_id: np.array(trace, dtype=float) for agent_id, trace in data.get('trace', {}).items()},
             init = data['init'],
             mode = data['mode'],
             static = data['static'],
@@ -71,6 +82,69 @@ class AnalysisTreeNode:
             type = data['type'],
         )
 
+# Binary tree file layout: the magic bytes, the float64 trace data of all the nodes in the order they are written,
+# the json index with the metadata of every node, and a footer with the offset of the index followed by the magic bytes
+_MAGIC = b'VERSETR1'
+_FOOTER = struct.Struct('<Q8s')
+
+class AnalysisTreeWriter:
+    """Write an analysis tree to a binary file one node at a time.
+    Traces are appended as raw float64 data as soon as a node is written, only the small
+    metadata index is kept in memory until close. A parent must be written before its children, covered_by is
+    saved as the index of the covering node if it was written to the same file."""
+    def __init__(self, fn):
+        self.f = open(fn, 'wb')
+        self.f.write(_MAGIC)
+        self.offset = 0
+        self.index = []
+        # Index in the file of the nodes written, and the nodes covering them, resolved to indices on close
+        self.indices = {}
+        self.covered_by = []
+
+    def write_node(self, node: AnalysisTreeNode, parent: Optional[int] = None) -> int:
+        """Append node to the file and return its index in the file, which is used as the parent of its children"""
+        node_dict = node.to_dict(include_trace = False)
+        node_dict['id'] = len(self.index)
+        node_dict['parent'] = parent
+        node_dict['covered_by'] = None
+        self.indices[id(node)] = node_dict['id']
+        if node.covered_by is not None:
+            self.covered_by.append((node_dict, node.covered_by))
+        trace_dict = {}
+        for agent_id, trace in node.trace.items():
+            trace = np.ascontiguousarray(trace, dtype='<f8')
+            self.f.write(trace.tobytes())
+            trace_dict[agent_id] = [self.offset, list(trace.shape)]
+            self.offset += trace.size
+        node_dict['trace'] = trace_dict
+        if parent is not None:
+            self.index[parent]['child'].append(node_dict['id'])
+        self.index.append(node_dict)
+        return node_dict['id']
+
+    def write_children(self, nodes: List[AnalysisTreeNode]) -> List[AnalysisTreeNode]:
+        """Write the children of nodes, which must have been written already, and return them"""
+        children = []
+        for node in nodes:
+            for child in node.child:
+                self.write_node(child, self.indices[id(node)])
+                children.append(child)
+        return children
+
+    def close(self):
+        for node_dict, covered_by in self.covered_by:
+            node_dict['covered_by'] = self.indices.get(id(covered_by))
+        index_offset = self.f.tell()
+        self.f.write(json.dumps(self.index).encode())
+        self.f.write(_FOOTER.pack(index_offset, _MAGIC))
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
 class AnalysisTree:
     def __init__(self, root):
         self.root:AnalysisTreeNode = root
@@ -106,6 +180,50 @@ class AnalysisTree:
         with open(fn,'w+') as f:           
             json.dump(res_dict,f, indent=4, sort_keys=True)
 
+    def dump_binary(self, fn):
+        """Save the tree in the binary format, which can be loaded lazily by load_binary"""
+        with AnalysisTreeWriter(fn) as writer:
+            queue = [(self.root, None)]
+            while queue:
+                node, parent = queue.pop(0)
+                node_idx = writer.write_node(node, parent)
+                queue += [(child_node, node_idx) for child_node in node.child]
+
+    def attach_binary(self, fn):
+        """Replace the traces of the nodes with the memory mapped ones of fn, which holds the same tree, e.g. when
+        the nodes were streamed to fn and their traces dropped from memory"""
+        for node, saved_node in zip(self.nodes, AnalysisTree.load_binary(fn).nodes):
+            node.trace = saved_node.trace
+
+    @staticmethod
+    def load_binary(fn) -> "AnalysisTree":
+        """Load a tree saved by dump_binary or AnalysisTreeWriter.
+        Only the metadata is parsed, the traces are memory mapped and read from disk when accessed"""
+        with open(fn, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{fn} is not an analysis tree file")
+            f.seek(-_FOOTER.size, 2)
+            index_offset, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"{fn} is truncated, the writer may not have been closed")
+            f.seek(index_offset)
+            index = json.loads(f.read()[:-_FOOTER.size])
+        data_size = (index_offset - len(_MAGIC)) // 8
+        data = np.memmap(fn, dtype = '<f8', mode = 'r', offset = len(_MAGIC), shape = (data_size,)) if data_size > 0 else np.zeros(0)
+        nodes = []
+        for node_dict in index:
+            trace_index = node_dict.pop('trace')
+            node = AnalysisTreeNode.from_dict(node_dict)
+            for agent_id, (offset, shape) in trace_index.items():
+                node.trace[agent_id] = data[offset:offset+int(np.prod(shape))].reshape(shape)
+            if node_dict['parent'] is not None:
+                nodes[node_dict['parent']].child.append(node)
+            nodes.append(node)
+        for node, node_dict in zip(nodes, index):
+            if node_dict.get('covered_by') is not None:
+                node.covered_by = nodes[node_dict['covered_by']]
+        return AnalysisTree(nodes[0])
+
     @staticmethod 
     def load(fn):
         f = open(fn, 'r')
@@ -113,6 +231,7 @@ class AnalysisTree:
         f.close()
         root_node_dict = data[str(0)]
         root = AnalysisTreeNode.from_dict(root_node_dict)
+        nodes = {0: root}
         queue = [(root_node_dict, root)]
         while queue:
             parent_node_dict, parent_node = queue.pop(0)
@@ -120,5 +239,10 @@ class AnalysisTree:
                 child_node_dict = data[str(child_node_idx)]
                 child_node = AnalysisTreeNode.from_dict(child_node_dict)
                 parent_node.child.append(child_node)
+                nodes[child_node_idx] = child_node
                 queue.append((child_node_dict, child_node))
+        for node_idx, node in nodes.items():
+            covered_by = data[str(node_idx)].get('covered_by')
+            if covered_by is not None:
+                node.covered_by = nodes[covered_by]
         return AnalysisTree(root)
\ No newline at end of file
@@ -6,11 +6,25 @@ _TRUE_MIN_CONST = -10
 _EPSILON = 1.0e-6
 _SMALL_EPSILON = 1e-10
 SIMTRACENUM = 10
+SENSITIVITY_CHUNK_LEN = 2000
 
 PW = "PW"
 GLOBAL = "GLOBAL"
 
-def all_sensitivities_calc(training_traces: np.ndarray, initial_radii: np.ndarray):
+def all_sensitivities_calc(training_traces: np.ndarray, initial_radii: np.ndarray, chunk_len: int = None):
+    """
+    Compute the sensitivity of every dimension at every time step, i.e. the largest ratio between the
+    distance of two traces at that time step and the distance of their initial points
+
+    Args:
+        training_traces (np.ndarray): simulated traces, shape (num_traces, trace_len, ndims)
+        initial_radii (np.ndarray): radii of the initial set
+        chunk_len (int or None): number of time steps processed at once. The whole trace is
+            processed at once if None, which needs memory proportional to num_traces^2 * trace_len
+
+    Returns:
+        sensitivities (np.ndarray), shape (ndims - 1, trace_len - 1)
+    """
     num_traces: int
     trace_len: int
     ndims: int
@@ -20,17 +34,19 @@ def all_sensitivities_calc(training_traces: np.ndarray, initial_radii: np.ndarra
         (normalizing_initial_set_radii.shape[0], trace_len - 1))
     normalizing_initial_set_radii[np.where(
         normalizing_initial_set_radii == 0)] = 1.0
-    for cur_dim_ind in range(1, ndims):
-        # keyi: move out of loop
-        normalized_initial_points: np.array = training_traces[:,
-                                                              0, 1:] / normalizing_initial_set_radii
-        initial_distances = spatial.distance.pdist(
-            normalized_initial_points, 'chebyshev') + _SMALL_EPSILON
-        for cur_time_ind in range(1, trace_len):
-            y_points[cur_dim_ind - 1, cur_time_ind - 1] = np.max((spatial.distance.pdist(
-                np.reshape(training_traces[:, cur_time_ind, cur_dim_ind],
-                           (training_traces.shape[0], 1)), 'chebychev'
-            ) / normalizing_initial_set_radii[cur_dim_ind - 1]) / initial_distances)
+    normalized_initial_points: np.array = training_traces[:, 0, 1:] / normalizing_initial_set_radii
+    initial_distances = spatial.distance.pdist(
+        normalized_initial_points, 'chebyshev') + _SMALL_EPSILON
+    # Same pair ordering as pdist
+    first_idx, second_idx = np.triu_indices(num_traces, k=1)
+    if chunk_len is None:
+        chunk_len = trace_len - 1
+    for chunk_start in range(1, trace_len, chunk_len):
+        chunk_end = min(chunk_start + chunk_len, trace_len)
+        chunk = training_traces[:, chunk_start:chunk_end, 1:]
+        pair_distances = np.abs(chunk[first_idx] - chunk[second_idx])
+        sensitivities = (pair_distances / normalizing_initial_set_radii) / initial_distances[:, None, None]
+        y_points[:, chunk_start - 1:chunk_end - 1] = np.max(sensitivities, axis=0).T
     return y_points
 
 def get_reachtube_segment(training_traces: np.ndarray, initial_radii: np.ndarray, method='PWGlobal') -> np.array:
@@ -41,7 +57,7 @@ def get_reachtube_segment(training_traces: np.ndarray, initial_radii: np.ndarray
     trace_initial_time = center_trace[0, 0]
     x_points: np.ndarray = center_trace[:, 0] - trace_initial_time
     assert np.all(training_traces[0, :, 0] == training_traces[1:, :, 0])
-    y_points: np.ndarray = all_sensitivities_calc(training_traces, initial_radii)
+    y_points: np.ndarray = all_sensitivities_calc(training_traces, initial_radii, SENSITIVITY_CHUNK_LEN)
     points: np.ndarray = np.zeros((ndims - 1, trace_len, 2))
     points[np.where(initial_radii != 0), 0, 1] = 1.0
     points[:, :, 0] = np.reshape(x_points, (1, x_points.shape[0]))
@@ -209,7 +225,8 @@ def calc_bloated_tube(
         sim_trace_num,
         guard_checker=None,
         guard_str="",
-        lane_map = None
+        lane_map = None,
+        batch_sim_func = None
     ):
     """
     This function calculate the reach tube for single given mode
@@ -224,6 +241,8 @@ def calc_bloated_tube(
         kvalue (list): list of float used when bloating method set to PW
         guard_checker (verse.core.guard.Guard or None): guard check object
         guard_str (str): guard string
+        batch_sim_func (function or None): batched simulation function, simulates all the sampled
+            initial points at once. sim_func is called on each point if not provided
        
     Returns:
         Bloated reach tube
@@ -233,14 +252,17 @@ def calc_bloated_tube(
     random.seed(4)
     cur_center = calcCenterPoint(initial_set[0], initial_set[1])
     cur_delta = calcDelta(initial_set[0], initial_set[1])
-    traces = [sim_func(mode_label, cur_center, time_horizon, time_step, lane_map)]
     # Simulate SIMTRACENUM times to learn the sensitivity
+    init_points = [cur_center]
     for i in range(sim_trace_num):
-        new_init_point = randomPoint(initial_set[0], initial_set[1], i)
-        traces.append(sim_func(mode_label, new_init_point, time_horizon, time_step, lane_map))
+        init_points.append(randomPoint(initial_set[0], initial_set[1], i))
 
-    # Trim the trace to the same length
-    traces = trimTraces(traces)
+    if batch_sim_func is not None:
+        traces = list(batch_sim_func(mode_label, np.array(init_points), time_horizon, time_step, lane_map))
+    else:
+        traces = [sim_func(mode_label, init_point, time_horizon, time_step, lane_map) for init_point in init_points]
+        # Trim the trace to the same length
+        traces = trimTraces(traces)
     if guard_checker is not None:
         # pre truncated traces to get better bloat result
         max_idx = -1
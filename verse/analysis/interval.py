@@ -0,0 +1,109 @@
+"""Interval arithmetic on numpy arrays.
+
+An Interval holds arrays (or scalars) of lower and upper bounds, and the operators and
+INTERVAL_FUNCTIONS return intervals containing all the possible results, so that evaluating
+an expression on intervals gives its natural interval extension.
+"""
+
+import numpy as np
+
+class Interval:
+    def __init__(self, lo, hi):
+        self.lo = lo
+        self.hi = hi
+
+    @staticmethod
+    def coerce(value) -> "Interval":
+        if isinstance(value, Interval):
+            return value
+        return Interval(value, value)
+
+    def __add__(self, o) -> "Interval":
+        o = Interval.coerce(o)
+        return Interval(self.lo + o.lo, self.hi + o.hi)
+
+    __radd__ = __add__
+
+    def __sub__(self, o) -> "Interval":
+        o = Interval.coerce(o)
+        return Interval(self.lo - o.hi, self.hi - o.lo)
+
+    def __rsub__(self, o) -> "Interval":
+        return Interval.coerce(o) - self
+
+    def __mul__(self, o) -> "Interval":
+        o = Interval.coerce(o)
+        products = [self.lo * o.lo, self.lo * o.hi, self.hi * o.lo, self.hi * o.hi]
+        return Interval(np.minimum.reduce(products), np.maximum.reduce(products))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, o) -> "Interval":
+        o = Interval.coerce(o)
+        if not np.all((o.lo > 0) | (o.hi < 0)):
+            raise ZeroDivisionError("interval division by an interval containing 0")
+        return self * Interval(1 / o.hi, 1 / o.lo)
+
+    def __rtruediv__(self, o) -> "Interval":
+        return Interval.coerce(o) / self
+
+    def __neg__(self) -> "Interval":
+        return Interval(-self.hi, -self.lo)
+
+    def __pos__(self) -> "Interval":
+        return self
+
+    def __pow__(self, n) -> "Interval":
+        if isinstance(n, Interval):
+            raise ValueError("interval exponents are not supported")
+        if float(n).is_integer() and n >= 0:
+            n = int(n)
+            lo, hi = self.lo ** n, self.hi ** n
+            if n % 2 == 1:
+                return Interval(lo, hi)
+            contains_zero = (self.lo <= 0) & (self.hi >= 0)
+            return Interval(np.where(contains_zero, 0, np.minimum(lo, hi)), np.maximum(lo, hi))
+        if np.all(self.lo >= 0):
+            lo, hi = self.lo ** float(n), self.hi ** float(n)
+            return Interval(np.minimum(lo, hi), np.maximum(lo, hi))
+        raise ValueError(f"power {n} of an interval with negative values is not supported")
+
+    def magnitude(self):
+        return np.maximum(np.abs(self.lo), np.abs(self.hi))
+
+    def midpoint(self):
+        return (self.lo + self.hi) / 2
+
+def _monotone(func):
+    def interval_func(x):
+        if isinstance(x, Interval):
+            return Interval(func(x.lo), func(x.hi))
+        return func(x)
+    return interval_func
+
+def _cos(x):
+    if not isinstance(x, Interval):
+        return np.cos(x)
+    lo, hi = np.cos(x.lo), np.cos(x.hi)
+    # The maxima of cos are at 2k*pi and the minima at (2k+1)*pi
+    has_max = 2 * np.pi * np.ceil(x.lo / (2 * np.pi)) <= x.hi
+    has_min = 2 * np.pi * np.ceil((x.lo - np.pi) / (2 * np.pi)) + np.pi <= x.hi
+    return Interval(np.where(has_min, -1.0, np.minimum(lo, hi)), np.where(has_max, 1.0, np.maximum(lo, hi)))
+
+def _sin(x):
+    return _cos(x - np.pi / 2)
+
+def _abs(x):
+    if not isinstance(x, Interval):
+        return np.abs(x)
+    contains_zero = (x.lo <= 0) & (x.hi >= 0)
+    return Interval(np.where(contains_zero, 0, np.minimum(np.abs(x.lo), np.abs(x.hi))), x.magnitude())
+
+INTERVAL_FUNCTIONS = {
+    'exp': _monotone(np.exp),
+    'log': _monotone(np.log),
+    'sqrt': _monotone(np.sqrt),
+    'sin': _sin,
+    'cos': _cos,
+    'Abs': _abs,
+}
@@ -1,12 +1,15 @@
 import numpy as np
 from scipy.optimize import minimize
 import inspect, ast, textwrap, inspect, astunparse
+import functools
 import warnings
 from sympy import Symbol, diff
 from sympy.utilities.lambdify import lambdify
 from sympy.core import *
 
-from scipy.integrate import ode
+from scipy.integrate import solve_ivp
+
+from verse.analysis.interval import Interval, INTERVAL_FUNCTIONS
 
 def find_min(expr_func, jac_func, var_range, num_var, args, idx):
     bounds = []
@@ -33,17 +36,21 @@ def find_max(expr_func, jac_func, var_range, num_var, args, idx):
     res = find_min(neg_expr_func, neg_jac_func, var_range, num_var, args, idx)
     return -res
 
+@functools.lru_cache(maxsize=None)
+def lambdify_with_jac(expr):
+    """Lambdify expr and its gradient, both called with the list of values of the free symbols of expr.
+    Cached, as the same expressions are minimized at every step of every reachtube"""
+    vars = list(expr.free_symbols)
+    jac = [diff(expr, var) for var in vars]
+    return vars, lambdify([vars], expr), lambdify([vars], jac)
+
 def find_min_symbolic(expr, var_range):
     bounds = []
-    vars = list(expr.free_symbols)
     x0 = []
-    jac = []
+    vars, expr_func, jac_func = lambdify_with_jac(expr)
     for var in vars:
         bounds.append(var_range[var])
         x0.append(var_range[var][0])
-        jac.append(diff(expr, var))
-    expr_func = lambdify([vars], expr)
-    jac_func = lambdify([vars], jac)
     res = minimize(
         expr_func, 
         x0,
@@ -58,6 +65,113 @@ def find_max_symbolic(expr, var_range):
     res = find_min_symbolic(tmp, var_range)
     return -res
 
+@functools.lru_cache(maxsize=None)
+def extract_symbolic_dynamics(dynamics_func, time_step):
+    """
+    Extract the sympy expressions of the dynamics between the 'Begin Dynamic' and 'End Dynamic'
+    markers of dynamics_func, with dt replaced by time_step.
+    Cached, so that the source is only parsed once per dynamics and time step
+
+    Returns:
+        The symbols of the state and uncertain variables, the expressions and their negations
+    """
+    lines = inspect.getsource(dynamics_func)
+    function_body = ast.parse(textwrap.dedent(lines)).body[0].body
+    if not isinstance(function_body, list):
+        raise ValueError(f'Failed to extract dynamics from {dynamics_func}')
+
+    text_exprs = []
+    extract = False
+    x_var = []
+    w_var = []
+    for i, elem in enumerate(function_body):
+        if isinstance(elem, ast.Expr):
+            if isinstance(elem.value, ast.Constant) and elem.value.value == 'Begin Dynamic':
+                extract = True
+        elif isinstance(elem, ast.Expr):
+            if isinstance(elem.value, ast.Constant) and elem.value.value == 'End Dynamic':
+                extract = False
+        elif extract:
+            if isinstance(elem, ast.Assign):
+                text_exprs.append(astunparse.unparse(elem.value))
+                # x_var_name = elem.targets[0].id.replace('_plus','')
+                # x_var.append(x_var_name)
+        else:
+            if isinstance(elem, ast.Assign):
+                if elem.value.id == 'args':
+                    var_list = elem.targets[0].elts
+                    for var in var_list[:-1]:
+                        w_var.append(var.id)
+                elif elem.value.id == 'x':
+                    var_list = elem.targets[0].elts
+                    for var in var_list:
+                        x_var.append(var.id)
+
+    if len(text_exprs) != len(x_var):
+        raise ValueError(f'Failed to extract dynamics from {dynamics_func}')
+
+    symbol_x = [Symbol(elem,real=True) for elem in x_var]
+    symbol_w = [Symbol(elem,real=True) for elem in w_var]
+    dt = Symbol("dt", real=True)
+
+    tmp = [sympify(elem).subs("dt", time_step) for elem in text_exprs]
+    expr_symbol = []
+    for expr in tmp:
+        for symbol in symbol_x:
+            expr =  expr.subs(symbol.name, symbol) 
+        for symbol in symbol_w:
+            expr =  expr.subs(symbol.name, symbol) 
+        expr_symbol.append(expr)
+    exprs = expr_symbol
+    return symbol_x, symbol_w, exprs, [-expr for expr in exprs]
+
+def interval_supported(exprs) -> bool:
+    """Whether all the functions called in exprs have an interval version in INTERVAL_FUNCTIONS"""
+    return all(type(func).__name__ in INTERVAL_FUNCTIONS for expr in exprs for func in expr.atoms(Function))
+
+def interval_decomposition(symbol_x, symbol_w, exprs):
+    """
+    Build a decomposition function for compute_reachtube_mixmono_disc from the sympy expressions of the
+    dynamics, with closed form bounds instead of optimizations. For each expression, the bound over the
+    box is its value at a corner of the box if the Jacobian bounds show that it's monotone in every
+    variable, otherwise the tighter of its natural interval extension and its mean value form
+    """
+    vars = symbol_x + symbol_w
+    modules = [INTERVAL_FUNCTIONS, 'numpy']
+    expr_func = lambdify([vars], exprs, modules=modules)
+    jac_func = lambdify([vars], [[diff(expr, var) for var in vars] for expr in exprs], modules=modules)
+
+    def bound(lower, upper, lower_bound):
+        lower, upper = np.array(lower, dtype=float), np.array(upper, dtype=float)
+        box = [Interval(l, u) for l, u in zip(lower, upper)]
+        center = (lower + upper) / 2
+        natural = [Interval.coerce(v) for v in expr_func(box)]
+        jac = [[Interval.coerce(v) for v in row] for row in jac_func(box)]
+        center_value = expr_func(center)
+        res = []
+        for i in range(len(exprs)):
+            increasing = np.array([j.lo >= 0 for j in jac[i]])
+            decreasing = np.array([j.hi <= 0 for j in jac[i]])
+            if np.all(increasing | decreasing):
+                corner = np.where(increasing == lower_bound, lower, upper)
+                res.append(float(expr_func(corner)[i]))
+                continue
+            mean_value = center_value[i] + sum(jac[i][j] * Interval(lower[j] - center[j], upper[j] - center[j]) for j in range(len(vars)))
+            if lower_bound:
+                res.append(float(max(natural[i].lo, mean_value.lo)))
+            else:
+                res.append(float(min(natural[i].hi, mean_value.hi)))
+        return res
+
+    def decomposition(x, w, xhat, what, dt):
+        if all(a<=b for a,b in zip(x, xhat)) and all(a<=b for a,b in zip(w,what)):
+            return bound(x + w, xhat + what, True)
+        elif all(a>=b for a,b in zip(x,xhat)) and all(a>=b for a,b in zip(w,what)):
+            return bound(xhat + what, x + w, False)
+        else:
+            raise ValueError(f"Condition for x, w, x_hat, w_hat not satisfied: {[x, w, xhat, what]}")
+    return decomposition
+
 def compute_reachtube_mixmono_disc(
     initial_set,
     uncertain_var_bound,
@@ -101,41 +215,49 @@ def compute_reachtube_mixmono_cont(
     time_step,
     decomposition
 ):
-    initial_set = initial_set[0]
-    num_var = len(initial_set[0])
+    """
+    Compute the reachtube with the continuous time mixed monotone embedding system.
+    initial_set is a list of boxes (e.g. a partition of the initial set), the embedding systems
+    of all of them are stacked and integrated together, and the tube contains the tubes of all of them
+    """
+    boxes = np.array(initial_set, dtype=float)
+    num_partitions, _, num_var = boxes.shape
     num_uncertain_var = len(uncertain_var_bound[0])
-    def decomposition_dynamics(t, state, u):
-        x, xhat = state[:num_var], state[num_var:]
-        w, what = u[:num_uncertain_var], u[num_uncertain_var:]
+    uncertain = uncertain_var_bound[0] + uncertain_var_bound[1]
+    w, what = uncertain[:num_uncertain_var], uncertain[num_uncertain_var:]
+    def decomposition_dynamics(t, state):
+        state = state.reshape(num_partitions, 2 * num_var)
+        res = np.empty(state.shape)
+        for i in range(num_partitions):
+            x, xhat = state[i, :num_var], state[i, num_var:]
 
-        d = decomposition(x,w,xhat,what)
-        dhat = decomposition(xhat,what,x,w)
+            d = decomposition(x,w,xhat,what)
+            dhat = decomposition(xhat,what,x,w)
 
-        return np.concatenate((d, dhat))
+            res[i] = np.hstack((*d, *dhat))
+        return res.ravel()
     time_bound = float(time_horizon)
     number_points = int(np.ceil(time_bound/time_step))
     t = [round(i*time_step, 10) for i in range(0, number_points)]
-    init = initial_set[0] + initial_set[1]
-    uncertain = uncertain_var_bound[0] + uncertain_var_bound[1]
-    trace = [[0]+init]
-    r = ode(decomposition_dynamics).set_integrator('dopri5', nsteps=2000).set_initial_value(init).set_f_params(uncertain)
-    for i in range(len(t)):
-        res: np.ndarray = r.integrate(r.t+time_step)
-        res = res.flatten().tolist()
-        trace.append([t[i]+time_step]+res)
+    times = np.array([0] + [t[i]+time_step for i in range(len(t))])
+    # A single call for the whole horizon, with the same tolerances as scipy's dopri5
+    sol = solve_ivp(
+        decomposition_dynamics, (0, times[-1]), boxes.reshape(-1), method='RK45',
+        t_eval=times, rtol=1e-6, atol=1e-12
+    )
+    if not sol.success:
+        # The solution stops where the integration failed, it doesn't bound the reachable set over the horizon
+        raise RuntimeError(f"Integration of the embedding system failed after t={sol.t[-1]}: {sol.message}")
+    states = sol.y.T.reshape(-1, num_partitions, 2, num_var)
+    lower = states.min(axis=(1, 2))
+    upper = states.max(axis=(1, 2))
 
-    res = []
-    for i in range(len(trace) - 1):
-        res0 = [trace[i][0]] + np.minimum.reduce(
-            [trace[i][1:1 + num_var], trace[i + 1][1:1 + num_var], trace[i][1 + num_var:],
-            trace[i + 1][1 + num_var:]]
-        ).tolist()
-        res.append(res0)
-        res1 = [trace[i + 1][0]] + np.maximum.reduce(
-            [trace[i][1:1 + num_var], trace[i + 1][1:1 + num_var], trace[i][1 + num_var:],
-            trace[i + 1][1 + num_var:]]
-        ).tolist()
-        res.append(res1)
+    num_steps = len(lower) - 1
+    res = np.empty((2 * num_steps, num_var + 1))
+    res[0::2, 0] = times[:num_steps]
+    res[1::2, 0] = times[1:num_steps + 1]
+    res[0::2, 1:] = np.minimum(lower[:-1], lower[1:])
+    res[1::2, 1:] = np.maximum(upper[:-1], upper[1:])
     return res
 
 
@@ -162,8 +284,28 @@ def calculate_bloated_tube_mixmono_disc(
             time_horizon,
             time_step,
             agent,
-            lane_map
+            lane_map,
+            params = {}
     ):
+        symbolic_dynamics = None
+        if params.get('mixmono_decomposition') == 'interval' and hasattr(agent, 'dynamics') and not hasattr(agent, 'decomposition'):
+            try:
+                symbolic_dynamics = extract_symbolic_dynamics(getattr(agent.dynamics, '__func__', agent.dynamics), time_step)
+            except Exception:
+                warnings.warn(f"Can't extract the dynamics of {agent.id} for the interval decomposition, falling back to optimization")
+            if symbolic_dynamics is not None and not interval_supported(symbolic_dynamics[2]):
+                warnings.warn(f"The dynamics of {agent.id} call functions without an interval version, falling back to optimization")
+                symbolic_dynamics = None
+
+        if symbolic_dynamics is not None:
+            symbol_x, symbol_w, exprs, _ = symbolic_dynamics
+            try:
+                return compute_reachtube_mixmono_disc(init, uncertain_param, time_horizon, time_step,
+                                                      interval_decomposition(symbol_x, symbol_w, exprs))
+            except (ZeroDivisionError, ValueError, TypeError, AttributeError) as e:
+                # e.g. a division by an interval containing 0, or a numpy function called on intervals
+                warnings.warn(f"Interval decomposition of {agent.id} failed ({e}), falling back to optimization")
+
         if hasattr(agent, 'dynamics') and hasattr(agent, 'decomposition'):
             decomposition = agent.decomposition
             res = compute_reachtube_mixmono_disc(init, uncertain_param, time_horizon, time_step, decomposition)
@@ -195,59 +337,11 @@ def calculate_bloated_tube_mixmono_disc(
             res = compute_reachtube_mixmono_disc(init, uncertain_param, time_horizon, time_step,
                                                       decomposition_func)
         elif hasattr(agent, 'dynamics'):
-            dynamics_func = agent.dynamics
-            lines = inspect.getsource(dynamics_func)
-            function_body = ast.parse(textwrap.dedent(lines)).body[0].body
-            if not isinstance(function_body, list):
-                raise ValueError(f'Failed to extract dynamics for {agent}')
-            
-            text_exprs = []
-            extract = False
-            x_var = []
-            w_var = []
-            for i, elem in enumerate(function_body):
-                if isinstance(elem, ast.Expr):
-                    if isinstance(elem.value, ast.Constant) and elem.value.value == 'Begin Dynamic':
-                        extract = True
-                elif isinstance(elem, ast.Expr):
-                    if isinstance(elem.value, ast.Constant) and elem.value.value == 'End Dynamic':
-                        extract = False
-                elif extract:
-                    if isinstance(elem, ast.Assign):
-                        text_exprs.append(astunparse.unparse(elem.value))
-                        # x_var_name = elem.targets[0].id.replace('_plus','')
-                        # x_var.append(x_var_name)
-                else:
-                    if isinstance(elem, ast.Assign):
-                        if elem.value.id == 'args':
-                            var_list = elem.targets[0].elts
-                            for var in var_list[:-1]:
-                                w_var.append(var.id)
-                        elif elem.value.id == 'x':
-                            var_list = elem.targets[0].elts
-                            for var in var_list:
-                                x_var.append(var.id)
-
-            if len(text_exprs) != len(x_var):
-                raise ValueError(f'Failed to extract dynamics for {agent}')
-
-            symbol_x = [Symbol(elem,real=True) for elem in x_var]
-            symbol_w = [Symbol(elem,real=True) for elem in w_var]
-            dt = Symbol("dt", real=True)
-
-            tmp = [sympify(elem).subs("dt", time_step) for elem in text_exprs]
-            expr_symbol = []
-            for expr in tmp:
-                for symbol in symbol_x:
-                    expr =  expr.subs(symbol.name, symbol) 
-                for symbol in symbol_w:
-                    expr =  expr.subs(symbol.name, symbol) 
-                expr_symbol.append(expr)
-            exprs = expr_symbol 
+            symbol_x, symbol_w, exprs, neg_exprs = extract_symbolic_dynamics(getattr(agent.dynamics, '__func__', agent.dynamics), time_step)
 
             def computeD(x, w, x_hat, w_hat, dt):
                 d = []
-                for expr in exprs:
+                for expr, neg_expr in zip(exprs, neg_exprs):
                     if all(a<=b for a,b in zip(x, x_hat)) and all(a<=b for a,b in zip(w,w_hat)):
                         var_range = {}
                         for i, var in enumerate(symbol_x):
@@ -262,7 +356,7 @@ def calculate_bloated_tube_mixmono_disc(
                             var_range[var] = (x_hat[i], x[i])
                         for i, var in enumerate(symbol_w):
                             var_range[var] = (w_hat[i], w[i])
-                        res = find_max_symbolic(expr, var_range)
+                        res = -find_min_symbolic(neg_expr, var_range)
                         d.append(res)
                     else:
                         raise ValueError(f"Condition for x, w, x_hat, w_hat not satisfied: {[x, w, x_hat, w_hat]}")
@@ -0,0 +1,301 @@
+from typing import List, Dict, Optional, Tuple
+import itertools
+import warnings
+from collections import defaultdict
+
+import numpy as np
+
+from verse.analysis.analysis_tree import AnalysisTreeNode
+from verse.parser.vectorize import VECTORIZED_ERRORS
+
+class MonteCarloResult:
+    """Result of a Monte Carlo simulation of a scenario"""
+    times: np.ndarray
+    """The times of the steps, shared by all the samples"""
+    traces: Optional[Dict[str, np.ndarray]]
+    """For each agent, the traces of all the samples as an array of shape (samples, steps, 1 + dimensions), in the
+    format of the simulation traces. The steps after an assert hit are nan. None if the traces weren't kept"""
+    mean: Dict[str, np.ndarray]
+    lower: Dict[str, np.ndarray]
+    upper: Dict[str, np.ndarray]
+    """For each agent, the mean, minimum and maximum of its states at each step over the samples, of shape (steps, dimensions)"""
+    transitions: List[List[Tuple[float, str, Tuple[str]]]]
+    """For each sample, its mode transitions as (time, agent id, destination mode)"""
+    assert_hits: List[Optional[Tuple[float, Dict[str, List[str]]]]]
+    """For each sample, the time and labels of the assert it hit, None if it didn't hit any"""
+
+    def __init__(self, times, traces, mean, lower, upper, transitions, assert_hits):
+        self.times = times
+        self.traces = traces
+        self.mean = mean
+        self.lower = lower
+        self.upper = upper
+        self.transitions = transitions
+        self.assert_hits = assert_hits
+
+    @property
+    def num_samples(self) -> int:
+        return len(self.assert_hits)
+
+    def hit_samples(self) -> List[int]:
+        """The samples that hit an assert"""
+        return [i for i, hit in enumerate(self.assert_hits) if hit is not None]
+
+class _SampleBatch:
+    """State of the samples simulated together"""
+    def __init__(self, agents, inits, init_modes, times):
+        num_samples = len(next(iter(inits.values())))
+        self.times = times
+        self.num_steps = len(times) - 1
+        # The traces of the agents in each sample, over the whole time grid
+        self.buffers = {}
+        for agent_id in agents:
+            self.buffers[agent_id] = np.full((num_samples, self.num_steps + 1, 1 + inits[agent_id].shape[1]), np.nan)
+            self.buffers[agent_id][:, :, 0] = times
+        self.modes = [dict(init_modes) for _ in range(num_samples)]
+        self.transitions = [[] for _ in range(num_samples)]
+        self.assert_hits = [None] * num_samples
+        # The step each sample is at, and the agents whose trace has to be simulated from their state there
+        self.current = np.zeros(num_samples, dtype=int)
+        self.states = dict(inits)
+        self.to_simulate = {agent_id: np.ones(num_samples, dtype=bool) for agent_id in agents}
+        self.same_step_transitions = np.zeros(num_samples, dtype=int)
+        self.active = np.ones(num_samples, dtype=bool)
+
+class MonteCarloSimulator:
+    """
+    Simulate many samples of the initial sets together.
+
+    All the samples are simulated on a common time grid. The samples in the same mode are integrated as one
+    batch (with TC_simulate_batch when the agent provides it), and the guards and asserts are evaluated
+    vectorized across the samples in the same modes, over windows of steps, to find the first step where each
+    sample can take a transition. The transitions of each sample are then found and applied exactly as in the
+    simulation tree, so each sample splits from the batch of its modes. Where several transitions are possible,
+    a sample follows one of them at random.
+    """
+    # Number of steps of the windows where the guards are evaluated
+    WINDOW = 32
+    # Transitions a sample can take without time advancing, before it's considered stuck in a loop of transitions
+    MAX_SAME_STEP_TRANSITIONS = 100
+
+    def __init__(self):
+        self.result = None
+
+    def _simulate_group(self, agent, mode, inits, time_bound, time_step, lane_map) -> np.ndarray:
+        batch_sim_func = getattr(agent, 'TC_simulate_batch', None)
+        if batch_sim_func is not None:
+            return np.asarray(batch_sim_func(mode, inits, time_bound, time_step, lane_map), dtype=float)
+        traces = [np.asarray(agent.TC_simulate(mode, init.tolist(), time_bound, time_step, lane_map), dtype=float) for init in inits]
+        length = min(len(trace) for trace in traces)
+        return np.stack([trace[:length] for trace in traces])
+
+    def simulate(
+        self,
+        init_list,
+        init_mode_list,
+        static_list,
+        uncertain_param_list,
+        agent_list,
+        transition_graph,
+        time_horizon,
+        time_step,
+        lane_map,
+        num_samples,
+        seed = None,
+        keep_traces = True,
+        batch_size = 4096
+    ) -> MonteCarloResult:
+        """
+        Simulate num_samples points sampled uniformly in the initial sets, batch_size samples at a time.
+        If keep_traces is False, only the statistics of the traces are kept, so that the memory doesn't grow
+        with the number of samples
+        """
+        rng = np.random.default_rng(seed)
+        agent_ids = [agent.id for agent in agent_list]
+        agents = {agent.id: agent for agent in agent_list}
+        init_modes = {agent.id: tuple(elem.name for elem in init_mode_list[i]) for i, agent in enumerate(agent_list)}
+        statics = {agent.id: [elem.name for elem in static_list[i]] for i, agent in enumerate(agent_list)}
+        num_steps = int(np.ceil(time_horizon / time_step - 1e-9))
+        times = np.round(np.arange(num_steps + 1) * time_step, 10)
+
+        traces = {agent_id: [] for agent_id in agent_ids}
+        sums, counts, lower, upper = {}, {}, {}, {}
+        all_transitions, all_assert_hits = [], []
+        for batch_start in range(0, num_samples, batch_size):
+            num_batch = min(batch_size, num_samples - batch_start)
+            inits = {}
+            for i, agent in enumerate(agent_list):
+                rect = np.array(init_list[i], dtype=float)
+                inits[agent.id] = rng.uniform(rect[0], rect[1], size=(num_batch, rect.shape[1]))
+            buffers, transitions, assert_hits = self._simulate_batch(
+                agents, inits, init_modes, statics, transition_graph, times, time_step, lane_map, rng)
+            all_transitions += transitions
+            all_assert_hits += assert_hits
+            for agent_id, buffer in buffers.items():
+                states = buffer[:, :, 1:]
+                valid = ~np.isnan(states)
+                if agent_id not in sums:
+                    sums[agent_id] = np.zeros(states.shape[1:])
+                    counts[agent_id] = np.zeros(states.shape[1:])
+                    lower[agent_id] = np.full(states.shape[1:], np.inf)
+                    upper[agent_id] = np.full(states.shape[1:], -np.inf)
+                sums[agent_id] += np.where(valid, states, 0).sum(axis=0)
+                counts[agent_id] += valid.sum(axis=0)
+                lower[agent_id] = np.minimum(lower[agent_id], np.where(valid, states, np.inf).min(axis=0))
+                upper[agent_id] = np.maximum(upper[agent_id], np.where(valid, states, -np.inf).max(axis=0))
+                if keep_traces:
+                    traces[agent_id].append(buffer)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = {agent_id: sums[agent_id] / counts[agent_id] for agent_id in sums}
+        self.result = MonteCarloResult(
+            times = times,
+            traces = {agent_id: np.concatenate(traces[agent_id]) for agent_id in agent_ids} if keep_traces else None,
+            mean = mean,
+            lower = lower,
+            upper = upper,
+            transitions = all_transitions,
+            assert_hits = all_assert_hits
+        )
+        return self.result
+
+    def _simulate_batch(self, agents, inits, init_modes, statics, transition_graph, times, time_step, lane_map, rng):
+        batch = _SampleBatch(agents, inits, init_modes, times)
+        agent_ids = list(agents)
+        num_steps = batch.num_steps
+        vectorized_agents = transition_graph._vectorized_agents(
+            [agent_id for agent_id in agent_ids if len(agents[agent_id].controller.args) > 0])
+
+        while batch.active.any():
+            # Integrate the samples in the same mode and starting at the same step as one batch
+            for agent_id in agent_ids:
+                samples = np.flatnonzero(batch.active & batch.to_simulate[agent_id])
+                groups = defaultdict(list)
+                for i in samples:
+                    groups[(batch.modes[i][agent_id], batch.current[i])].append(i)
+                for (mode, start), group in groups.items():
+                    group = np.array(group)
+                    time_bound = round((num_steps - start) * time_step, 10)
+                    traces = self._simulate_group(agents[agent_id], list(mode), batch.states[agent_id][group], time_bound, time_step, lane_map)
+                    length = min(traces.shape[1], num_steps + 1 - start)
+                    batch.buffers[agent_id][group, start:start + length, 1:] = traces[:, :length, 1:]
+                batch.to_simulate[agent_id][samples] = False
+
+            # Find the first step where each sample can take a transition, with the samples in the same modes together
+            groups = defaultdict(list)
+            for i in np.flatnonzero(batch.active):
+                groups[tuple(batch.modes[i][agent_id] for agent_id in agent_ids)].append(i)
+            for mode_key, group in groups.items():
+                group = np.array(group)
+                modes = dict(zip(agent_ids, mode_key))
+                candidates = self._first_candidates(
+                    transition_graph, vectorized_agents, agents, statics, batch.buffers, modes, group, batch.current[group], num_steps)
+                batch.active[group[candidates > num_steps]] = False
+                group, candidates = group[candidates <= num_steps], candidates[candidates <= num_steps]
+
+                # The transitions of all the samples at their candidate step, or one sample at a time if they can't be vectorized
+                one_by_one = np.arange(len(group))
+                if vectorized_agents is not None and len(group) > 0:
+                    state_dict = {
+                        agent_id: (batch.buffers[agent_id][group, candidates], list(modes[agent_id]), statics[agent_id])
+                        for agent_id in agent_ids
+                    }
+                    try:
+                        asserts, agent_transitions = transition_graph.get_transition_simulate_batch(state_dict, len(group))
+                    except VECTORIZED_ERRORS:
+                        pass
+                    else:
+                        one_by_one = np.flatnonzero(asserts)
+                        sample_transitions = [{} for _ in group]
+                        for agent_id, pattern_transitions in agent_transitions.items():
+                            for samples, transitions in pattern_transitions:
+                                for row, j in enumerate(samples):
+                                    sample_transitions[j][agent_id] = [
+                                        (transit_agent_id, dest_mode, next_init[row])
+                                        for transit_agent_id, _, dest_mode, next_init in transitions
+                                    ]
+                        for j in np.flatnonzero(~asserts):
+                            self._take_transition(batch, group[j], candidates[j], sample_transitions[j], rng)
+                for j in one_by_one:
+                    i, step = group[j], candidates[j]
+                    # Only the candidate step is checked, if it's a false positive the sample goes on from the next step
+                    node = AnalysisTreeNode(
+                        trace = {agent_id: batch.buffers[agent_id][i, step:step + 1] for agent_id in agent_ids},
+                        init = {},
+                        mode = {agent_id: list(modes[agent_id]) for agent_id in agent_ids},
+                        static = statics,
+                        uncertain_param = {},
+                        agent = agents,
+                        child = [],
+                        start_time = times[step],
+                        type = 'simtrace'
+                    )
+                    asserts, transitions, _ = transition_graph.get_transition_simulate_new(node)
+                    if asserts is not None:
+                        batch.assert_hits[i] = (times[step], dict(asserts))
+                        for agent_id in agent_ids:
+                            batch.buffers[agent_id][i, step + 1:, 1:] = np.nan
+                        batch.active[i] = False
+                        continue
+                    sample_transitions = {
+                        agent_id: [(transit_agent_id, dest_mode, next_init) for transit_agent_id, _, dest_mode, next_init, _ in agent_transitions]
+                        for agent_id, agent_transitions in transitions.items()
+                    }
+                    self._take_transition(batch, i, step, sample_transitions, rng)
+        return batch.buffers, batch.transitions, batch.assert_hits
+
+    def _take_transition(self, batch: "_SampleBatch", i: int, step: int, sample_transitions, rng):
+        """Make sample i take one of the combinations of the transitions of its agents at step"""
+        if step >= batch.num_steps:
+            batch.active[i] = False
+            return
+        if not sample_transitions:
+            batch.current[i] = step + 1
+            return
+        batch.same_step_transitions[i] = batch.same_step_transitions[i] + 1 if step == batch.current[i] else 0
+        if batch.same_step_transitions[i] > self.MAX_SAME_STEP_TRANSITIONS:
+            warnings.warn(f"Sample {i} keeps taking transitions at time {batch.times[step]}, its simulation is stopped there")
+            batch.active[i] = False
+            return
+        combinations = list(itertools.product(*sample_transitions.values()))
+        changed = False
+        for transit_agent_id, dest_mode, next_init in combinations[rng.integers(len(combinations))]:
+            if dest_mode is None:
+                continue
+            batch.modes[i][transit_agent_id] = tuple(dest_mode)
+            batch.states[transit_agent_id][i] = next_init
+            batch.to_simulate[transit_agent_id][i] = True
+            batch.transitions[i].append((batch.times[step], transit_agent_id, tuple(dest_mode)))
+            changed = True
+        if not changed:
+            batch.active[i] = False
+            return
+        batch.current[i] = step
+
+    def _first_candidates(self, transition_graph, vectorized_agents, agents, statics, buffers, modes, samples, current, num_steps) -> np.ndarray:
+        """The first step from current where each of the samples (all in modes) can take a transition, num_steps + 1 if none"""
+        if vectorized_agents is None:
+            # Every step has to be checked
+            return current
+        res = np.full(len(samples), num_steps + 1)
+        undecided = np.arange(len(samples))
+        start = int(current.min())
+        try:
+            while start <= num_steps and len(undecided) > 0:
+                stop = min(start + self.WINDOW, num_steps + 1)
+                window = stop - start
+                state_dict = {}
+                for agent_id in agents:
+                    rows = buffers[agent_id][samples[undecided], start:stop].reshape(-1, buffers[agent_id].shape[2])
+                    state_dict[agent_id] = (rows, list(modes[agent_id]), statics[agent_id])
+                hit = transition_graph._transition_candidates(vectorized_agents, state_dict, len(undecided) * window)
+                hit = hit.reshape(len(undecided), window)
+                # Steps before the current step of a sample are from its previous modes
+                hit &= np.arange(start, stop)[None, :] >= current[undecided][:, None]
+                found = hit.any(axis=1)
+                res[undecided[found]] = start + np.argmax(hit[found], axis=1)
+                undecided = undecided[~found]
+                start = stop
+        except VECTORIZED_ERRORS:
+            return current
+        return res
@@ -0,0 +1,65 @@
+"""Policies to aggregate the reset rectangles of a transition into fewer initial boxes.
+
+A transition hit at several time steps carries one reset rectangle per hit, and the tube of the
+child is computed from all of them. Merging them into fewer, larger boxes trades precision for
+fewer (or cheaper) tube computations. The policy is chosen by params['reset_merge']:
+    'hull': a single box containing all the rectangles
+    'kmeans': params['reset_merge_k'] boxes, clustering the rectangles by their center
+    'window': one box per params['reset_merge_window'] seconds of hit times
+"""
+
+from typing import List
+
+import numpy as np
+
+RESET_MERGE_METHODS = ('hull', 'kmeans', 'window')
+
+def _hulls(rects: np.ndarray, labels: np.ndarray) -> List:
+    return [
+        [rects[labels == label, 0, :].min(axis=0).tolist(), rects[labels == label, 1, :].max(axis=0).tolist()]
+        for label in np.unique(labels)
+    ]
+
+def _kmeans_labels(points: np.ndarray, k: int, max_iterations: int = 100) -> np.ndarray:
+    # Deterministic initialization with points spread over the hit order, which follows time
+    centers = points[np.linspace(0, len(points) - 1, k).round().astype(int)]
+    labels = np.zeros(len(points), dtype=int)
+    for iteration in range(max_iterations):
+        distances = np.linalg.norm(points[:, None, :] - centers[None, :, :], axis=2)
+        new_labels = np.argmin(distances, axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for label in range(k):
+            if np.any(labels == label):
+                centers[label] = points[labels == label].mean(axis=0)
+    return labels
+
+def merge_reset_rects(rects: List, times: List[float], params) -> List:
+    """
+    Aggregate the reset rectangles of a transition, hit at times, with the policy in params
+
+    Returns:
+        The list of boxes, each one containing some of the rectangles, in the same format as rects
+    """
+    method = params.get('reset_merge')
+    if method is None or len(rects) <= 1:
+        return rects
+    rects = np.array(rects, dtype=float)
+    if method == 'hull':
+        labels = np.zeros(len(rects), dtype=int)
+    elif method == 'kmeans':
+        k = params.get('reset_merge_k', 4)
+        if len(rects) <= k:
+            return rects.tolist()
+        centers = (rects[:, 0, :] + rects[:, 1, :]) / 2
+        # Scale the dimensions so that the clusters don't only follow the widest one
+        scale = centers.max(axis=0) - centers.min(axis=0)
+        scale[scale == 0] = 1
+        labels = _kmeans_labels(centers / scale, k)
+    elif method == 'window':
+        times = np.asarray(times, dtype=float)
+        labels = np.floor((times - times.min()) / params.get('reset_merge_window', 1.0) + 1e-9).astype(int)
+    else:
+        raise ValueError(f"Reset merge method {method} not available, use one of {RESET_MERGE_METHODS}")
+    return _hulls(rects, labels)
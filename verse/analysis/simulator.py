@@ -3,11 +3,12 @@ import copy
 import itertools
 import functools
 
+import numpy as np
 import pprint
 pp = functools.partial(pprint.pprint, compact=True, width=100)
 
 # from verse.agents.base_agent import BaseAgent
-from verse.analysis.analysis_tree import AnalysisTreeNode, AnalysisTree
+from verse.analysis.analysis_tree import AnalysisTreeNode, AnalysisTree, AnalysisTreeWriter
 
 class Simulator:
     def __init__(self):
@@ -23,8 +24,25 @@ class Simulator:
         transition_graph, 
         time_horizon, 
         time_step, 
-        lane_map
+        lane_map,
+        params={}
     ):
+        """
+        Simulate the agents and build the tree of the transitions. With params['sim_chunk'] (in seconds), the
+        agents are simulated in windows of that length, the guards are checked on each window as it is computed
+        and the simulation of a node stops at the first hit. Without it, each node simulates the agents over the
+        whole remaining time before checking the guards.
+
+        The windows are continued from the last state of the trace, so the chunked traces only equal the whole
+        ones if TC_simulate depends on nothing but the mode and the state, e.g. the agents using integrate_trace
+
+        With params['stream_to'], each node is written to that file with AnalysisTreeWriter as soon as it's
+        simulated and its traces are dropped from memory. The traces of the returned tree are memory mapped from
+        the file
+        """
+        chunk = params.get('sim_chunk')
+        if chunk is not None:
+            chunk = max(1, int(round(chunk / time_step))) * time_step
         # Setup the root of the simulation tree
         root = AnalysisTreeNode(
             trace={},
@@ -46,6 +64,18 @@ class Simulator:
             root.agent[agent.id] = agent
             root.type = 'simtrace'
 
+        stream_to = params.get('stream_to')
+        writer = None if stream_to is None else AnalysisTreeWriter(stream_to)
+        # Index in the file of the parents of the nodes to write
+        parent_index = {}
+
+        def finish(node: AnalysisTreeNode):
+            if writer is None:
+                return
+            node_idx = writer.write_node(node, parent_index.pop(id(node), None))
+            parent_index.update((id(child), node_idx) for child in node.child)
+            node.trace = {}
+
         simulation_queue = []
         simulation_queue.append(root)
         # Perform BFS through the simulation tree to loop through all possible transitions
@@ -54,20 +84,26 @@ class Simulator:
             pp((node.start_time, node.mode))
             remain_time = round(time_horizon - node.start_time, 10)
             if remain_time <= 0:
+                finish(node)
                 continue
-            # For trace not already simulated
-            for agent_id in node.agent:
-                if agent_id not in node.trace:
-                    # Simulate the trace starting from initial condition
-                    mode = node.mode[agent_id]
-                    init = node.init[agent_id]
-                    trace = node.agent[agent_id].TC_simulate(
-                        mode, init, remain_time, time_step, lane_map)
-                    trace[:, 0] += node.start_time
-                    node.trace[agent_id] = trace.tolist()
-
-            asserts, transitions, transition_idx = transition_graph.get_transition_simulate_new(
-                node)
+            if chunk is None:
+                # For trace not already simulated
+                for agent_id in node.agent:
+                    if agent_id not in node.trace:
+                        # Simulate the trace starting from initial condition
+                        mode = node.mode[agent_id]
+                        init = node.init[agent_id]
+                        trace = node.agent[agent_id].TC_simulate(
+                            mode, init, remain_time, time_step, lane_map)
+                        trace = np.asarray(trace, dtype=float)
+                        trace[:, 0] += node.start_time
+                        node.trace[agent_id] = trace
+
+                asserts, transitions, transition_idx = transition_graph.get_transition_simulate_new(
+                    node)
+            else:
+                asserts, transitions, transition_idx = self.simulate_chunks(
+                    node, transition_graph, time_horizon, time_step, lane_map, chunk)
 
             node.assert_hits = asserts
             pp({a: trace[transition_idx] for a, trace in node.trace.items()})
@@ -80,6 +116,7 @@ class Simulator:
 
             # If there's no transitions (returned transitions is empty), continue
             if not transitions:
+                finish(node)
                 continue
 
             if asserts != None:
@@ -137,6 +174,50 @@ class Simulator:
             #         start_time = next_node_start_time
             #     ))
             # simulation_queue += node.child
+            finish(node)
         
         self.simulation_tree = AnalysisTree(root)
+        if writer is not None:
+            writer.close()
+            self.simulation_tree.attach_binary(stream_to)
         return self.simulation_tree
+
+    @staticmethod
+    def extend_traces(node: AnalysisTreeNode, end_time, time_step, lane_map):
+        """Simulate the agents of node from the end of their traces, or their initial condition, until end_time"""
+        for agent_id, agent in node.agent.items():
+            trace = node.trace.get(agent_id)
+            if trace is None:
+                start_time, state = node.start_time, node.init[agent_id]
+            else:
+                start_time, state = trace[-1, 0], trace[-1, 1:].tolist()
+            remain_time = round(end_time - start_time, 10)
+            if remain_time <= 0:
+                continue
+            window = np.asarray(agent.TC_simulate(node.mode[agent_id], state, remain_time, time_step, lane_map), dtype=float)
+            window[:, 0] += start_time
+            node.trace[agent_id] = window if trace is None else np.concatenate((trace, window[1:]))
+
+    def simulate_chunks(self, node: AnalysisTreeNode, transition_graph, time_horizon, time_step, lane_map, chunk):
+        """
+        Simulate the agents of node one window of chunk seconds at a time until a guard or an assert is hit
+        in the new steps, or until time_horizon
+
+        Returns:
+            The result of get_transition_simulate_new on the traces simulated so far
+        """
+        checked = 0
+        end_time = node.start_time
+        while True:
+            # The traces inherited from the parent may already go past the next window
+            end_time = max([end_time + chunk] + [trace[-1, 0] for trace in node.trace.values()])
+            end_time = min(end_time, time_horizon)
+            self.extend_traces(node, end_time, time_step, lane_map)
+            trace_length = min(len(trace) for trace in node.trace.values())
+            for agent_id in node.trace:
+                node.trace[agent_id] = node.trace[agent_id][:trace_length]
+            asserts, transitions, transition_idx = transition_graph.get_transition_simulate_new(node, checked)
+            last_time = min(trace[-1, 0] for trace in node.trace.values())
+            if asserts is not None or transitions or last_time >= time_horizon - 1e-9:
+                return asserts, transitions, transition_idx
+            checked = trace_length
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+import glob
+import hashlib
+import inspect
+import os
+import pickle
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Parameters of the verification that don't change the tubes
+_UNKEYED_PARAMS = {'num_workers', 'tube_cache', 'verify_window', 'stream_to'}
+# Attributes of the agents that don't change the tubes: the controller only decides the transitions
+_UNKEYED_AGENT_ATTRIBUTES = {'id', 'controller', 'init_cont', 'init_disc', 'static_parameters', 'uncertain_parameters'}
+
+def _pickled_digest(obj) -> Optional[str]:
+    try:
+        data = pickle.dumps(obj, protocol=4)
+    except Exception:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+def _digest(obj) -> Tuple[str, bool]:
+    """The digest of obj, and whether it can be stored on disk.
+    Objects that can't be pickled are digested by their repr, which may hold memory addresses, so their
+    digest is only valid in this process"""
+    digest = _pickled_digest(obj)
+    if digest is None:
+        return hashlib.sha256(repr(obj).encode()).hexdigest(), False
+    return digest, True
+
+def _agent_fingerprint(agent) -> Tuple[str, bool]:
+    sources = []
+    for cls in type(agent).__mro__[:-1]:
+        try:
+            sources.append(inspect.getsource(cls))
+        except (OSError, TypeError):
+            sources.append(cls.__module__ + '.' + cls.__qualname__)
+    attributes = sorted((name, _digest(value)) for name, value in vars(agent).items() if name not in _UNKEYED_AGENT_ATTRIBUTES)
+    digest, _ = _digest((sources, attributes))
+    return digest, all(persistent for _, (_, persistent) in attributes)
+
+class TubeCache:
+    """
+    Cache of the reachtubes of the agents, to share them between the nodes of a verification
+    tree and between verifications, e.g. pass the same cache in params['tube_cache'] to all the
+    verifications of a parameter sweep.
+
+    The tubes are addressed by the content of what they depend on: the class and the parameters
+    of the agent (but not its controller, so changing a controller doesn't invalidate the tubes),
+    the mode, the uncertain parameters, the map, the time step, the reachability method and its
+    parameters, and the initial set and time horizon. The tubes are stored relative to the start
+    of their node, and a tube is reused for a shorter horizon by truncating it and, when
+    reuse_supersets is set, for any initial set contained in its (single box) initial set.
+
+    The most recently used max_entries tubes are kept in memory. If directory is given, the tubes
+    are also stored there, one file per tube, and are loaded back on a miss in memory. The tubes of
+    agents, maps or parameters that can't be pickled are only kept in memory.
+    The agents and maps are fingerprinted again at the start of each verification, so they
+    shouldn't be modified during one.
+    """
+    def __init__(self, max_entries: int = 1024, directory: Optional[str] = None, reuse_supersets: bool = True):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.reuse_supersets = reuse_supersets
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        # (group, init digest) -> (init, horizon, tube), in least recently used first order
+        self._entries = OrderedDict()
+        # group -> init digests of its entries in memory
+        self._groups = {}
+        self._loaded_groups = set()
+        # Groups with a digest only valid in this process, which aren't stored on disk
+        self._transient_groups = set()
+        self._fingerprints = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _fingerprint(self, obj) -> Tuple[str, bool]:
+        # Keyed by id, with a reference to obj so that the id isn't reused
+        if id(obj) not in self._fingerprints:
+            fingerprint = _agent_fingerprint(obj) if hasattr(obj, 'controller') else _digest(obj)
+            self._fingerprints[id(obj)] = (obj, fingerprint)
+        return self._fingerprints[id(obj)][1]
+
+    def refresh(self):
+        """Fingerprint the agents and maps again on their next use, e.g. after they were modified"""
+        self._fingerprints.clear()
+
+    def group(self, agent, mode, uncertain_param, time_step, lane_map, init_seg_length, reachability_method, params) -> str:
+        """Digest of everything the tube depends on besides the initial set and horizon"""
+        keyed_params = sorted((name, _digest(value)) for name, value in params.items() if name not in _UNKEYED_PARAMS)
+        fingerprints = (self._fingerprint(agent), self._fingerprint(lane_map))
+        group, persistent = _digest((
+            fingerprints, tuple(mode), uncertain_param,
+            round(time_step, 10), init_seg_length, reachability_method, keyed_params
+        ))
+        if not (persistent and all(fingerprint_persistent for _, fingerprint_persistent in fingerprints)
+                and all(param_persistent for _, (_, param_persistent) in keyed_params)):
+            self._transient_groups.add(group)
+        return group
+
+    def _path(self, group: str, init_digest: str) -> str:
+        return os.path.join(self.directory, f"{group}-{init_digest}.npz")
+
+    def _insert(self, group: str, init_digest: str, entry):
+        key = (group, init_digest)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._groups.setdefault(group, set()).add(init_digest)
+        while len(self._entries) > self.max_entries:
+            (old_group, old_digest), _ = self._entries.popitem(last=False)
+            self._groups[old_group].discard(old_digest)
+
+    def _load_group(self, group: str):
+        if self.directory is None or group in self._loaded_groups or group in self._transient_groups:
+            return
+        self._loaded_groups.add(group)
+        for path in glob.glob(os.path.join(self.directory, f"{group}-*.npz")):
+            init_digest = os.path.basename(path)[len(group) + 1:-len('.npz')]
+            if init_digest not in self._groups.get(group, ()):
+                with np.load(path) as data:
+                    self._insert(group, init_digest, (data['init'], float(data['horizon']), data['tube']))
+
+    @staticmethod
+    def _truncate(tube: np.ndarray, horizon: float) -> np.ndarray:
+        # The rows alternate lower and upper bounds, the time of a lower bound row is the start of its time step
+        num_steps = int(np.count_nonzero(tube[0::2, 0] < horizon - 1e-9))
+        return tube[:2 * num_steps].copy()
+
+    def get(self, group: str, init, horizon: float) -> Optional[np.ndarray]:
+        """The tube of init over horizon, or None if it isn't known"""
+        self._load_group(group)
+        init = np.array(init, dtype=float)
+        init_digest, _ = _digest(init)
+        entry = self._entries.get((group, init_digest))
+        if entry is not None and entry[1] >= horizon - 1e-9 and np.array_equal(entry[0], init):
+            key = (group, init_digest)
+        else:
+            key = None
+            if self.reuse_supersets:
+                lower, upper = init[:, 0, :].min(axis=0), init[:, 1, :].max(axis=0)
+                for candidate_digest in self._groups.get(group, ()):
+                    cached_init, cached_horizon, _ = self._entries[(group, candidate_digest)]
+                    if len(cached_init) == 1 and cached_horizon >= horizon - 1e-9 and \
+                            np.all(cached_init[0, 0] <= lower) and np.all(upper <= cached_init[0, 1]):
+                        key = (group, candidate_digest)
+                        break
+        if key is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._truncate(self._entries[key][2], horizon)
+
+    def put(self, group: str, init, horizon: float, tube: np.ndarray):
+        init = np.array(init, dtype=float)
+        init_digest, _ = _digest(init)
+        entry = self._entries.get((group, init_digest))
+        if entry is not None and entry[1] >= horizon:
+            return
+        tube = np.array(tube, dtype=float)
+        self._insert(group, init_digest, (init, horizon, tube))
+        if self.directory is not None and group not in self._transient_groups:
+            np.savez(self._path(group, init_digest), init=init, horizon=horizon, tube=tube)
+
+    def clear(self):
+        """Empty the memory of the cache, the tubes stored in directory are kept"""
+        self._entries.clear()
+        self._groups.clear()
+        self._loaded_groups.clear()
+        self._fingerprints.clear()
@@ -0,0 +1,38 @@
+import numpy as np
+
+class TubeIndex:
+    """Segment tree over the boxes of a reachtube.
+    Level 0 holds the box of each time step, and each box of level k + 1 is the bounding box of two
+    consecutive boxes of level k, so that a check that fails on a box of level k fails on the 2**k
+    time steps it covers"""
+    def __init__(self, tube):
+        tube = np.asarray(tube, dtype=float)
+        lower, upper = tube[0::2], tube[1::2]
+        self.length: int = len(lower)
+        self.levels = [(lower, upper)]
+        while len(lower) > 1:
+            if len(lower) % 2 == 1:
+                lower, upper = np.vstack((lower, lower[-1:])), np.vstack((upper, upper[-1:]))
+            lower = np.minimum(lower[0::2], lower[1::2])
+            upper = np.maximum(upper[0::2], upper[1::2])
+            self.levels.append((lower, upper))
+
+    @property
+    def depth(self) -> int:
+        return len(self.levels) - 1
+
+    def num_blocks(self, level: int) -> int:
+        return len(self.levels[level][0])
+
+    def block_range(self, level: int, block: int):
+        """The time steps covered by a block, as a start and stop index"""
+        start = block << level
+        return start, min(start + (1 << level), self.length)
+
+    def hulls(self, level: int, blocks) -> np.ndarray:
+        """The bounding boxes of blocks at level, in the same format as the tube (lower and upper bound alternating)"""
+        lower, upper = self.levels[level]
+        hulls = np.empty((2 * len(blocks), lower.shape[1]))
+        hulls[0::2] = lower[blocks]
+        hulls[1::2] = upper[blocks]
+        return hulls
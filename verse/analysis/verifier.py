@@ -1,12 +1,16 @@
-from typing import List
+from typing import List, Optional
 import copy
+import multiprocessing
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 
 # from verse.agents.base_agent import BaseAgent
-from verse.analysis.analysis_tree import AnalysisTreeNode, AnalysisTree
+from verse.analysis.analysis_tree import AnalysisTreeNode, AnalysisTree, AnalysisTreeWriter
 from verse.analysis.dryvr import calc_bloated_tube, SIMTRACENUM
 from verse.analysis.mixmonotone import calculate_bloated_tube_mixmono_cont, calculate_bloated_tube_mixmono_disc
+from verse.analysis.reset_merge import merge_reset_rects
 
 
 class Verifier:
@@ -14,6 +18,12 @@ class Verifier:
         self.reachtube_tree = None
         self.unsafe_set = None
         self.verification_result = None
+        # Nodes whose agents all start from their initial set, by modes, for the containment check
+        self.visited = None
+        # Time of the last guard hit of the transition into each child of the frontier, by id of the child
+        self.hit_end_times = {}
+        # Initial set and start time of the tubes the nodes inherit from their ancestors, by id of the node
+        self.tube_origins = {}
 
     def calculate_full_bloated_tube(
         self,
@@ -28,7 +38,8 @@ class Verifier:
         combine_seg_length = 1000,
         guard_checker=None,
         guard_str="",
-        lane_map = None
+        lane_map = None,
+        batch_sim_func = None
     ):
         # Handle Parameters
         bloating_method = 'PW'
@@ -58,7 +69,8 @@ class Verifier:
                                         bloating_method,
                                         kvalue,
                                         sim_trace_num,
-                                        lane_map = lane_map
+                                        lane_map = lane_map,
+                                        batch_sim_func = batch_sim_func
                                         )
             if combine_seg_idx == 0:
                 res_tube = cur_bloated_tube
@@ -75,9 +87,423 @@ class Verifier:
                     res_tube[combine_seg_idx*2+1::2,1:],
                     cur_bloated_tube[1::2,1:]
                 )
-        return res_tube.tolist()
+        return res_tube
 
 
+    def compute_agent_tube(
+        self,
+        agent,
+        mode,
+        init,
+        uncertain_param,
+        remain_time,
+        time_step,
+        lane_map,
+        init_seg_length,
+        reachability_method,
+        params = {}
+    ) -> np.ndarray:
+        if reachability_method == "DRYVR":
+            cur_bloated_tube = self.calculate_full_bloated_tube(mode,
+                                init,
+                                remain_time,
+                                time_step, 
+                                agent.TC_simulate,
+                                params,
+                                100,
+                                SIMTRACENUM,
+                                combine_seg_length=init_seg_length,
+                                lane_map = lane_map,
+                                batch_sim_func = getattr(agent, 'TC_simulate_batch', None)
+                                )
+        elif reachability_method == "MIXMONO_CONT":
+            cur_bloated_tube = calculate_bloated_tube_mixmono_cont(
+                mode, 
+                init, 
+                uncertain_param, 
+                remain_time,
+                time_step, 
+                agent,
+                lane_map
+            )
+        elif reachability_method == "MIXMONO_DISC":
+            cur_bloated_tube = calculate_bloated_tube_mixmono_disc(
+                mode, 
+                init, 
+                uncertain_param,
+                remain_time,
+                time_step,
+                agent,
+                lane_map,
+                params
+            ) 
+        else:
+            raise ValueError(f"Reachability computation method {reachability_method} not available.")
+        return np.array(cur_bloated_tube, dtype=float)
+
+    @staticmethod
+    def union_tubes(tubes: List[np.ndarray]) -> np.ndarray:
+        """Tube containing all the tubes, which start at the same time with the same time step"""
+        tube_length = min(tube.shape[0] for tube in tubes)
+        res_tube = np.array(tubes[0][:tube_length], dtype=float)
+        for tube in tubes[1:]:
+            res_tube[::2, 1:] = np.minimum(res_tube[::2, 1:], tube[:tube_length:2, 1:])
+            res_tube[1::2, 1:] = np.maximum(res_tube[1::2, 1:], tube[1:tube_length:2, 1:])
+        return res_tube
+
+    def compute_partitioned_tube(self, init, params, compute_tubes) -> np.ndarray:
+        """
+        Compute the tube of init, and refine the initial set where the tube is too wide.
+        Boxes whose tube is wider than params['partition_width'] (a width, or one width per dimension) in
+        some dimension are split in half along their most sensitive dimension, until params['max_partitions']
+        boxes. The sensitivity of each dimension in which the box isn't a point is measured with a probe: the
+        tube of the lower half of the box split along it, and the box is split along the dimension whose probe
+        narrows the tube the most relative to the budget. The probe of the chosen dimension is kept as the tube
+        of the lower half. The boxes and probes of each refinement level are computed together by compute_tubes,
+        which maps a list of initial sets (lists of rectangles, as init) to the list of their tubes, e.g. with
+        a worker pool
+
+        Returns:
+            The union of the tubes of the final partition
+        """
+        budget = np.asarray(params['partition_width'], dtype=float)
+        max_partitions = params.get('max_partitions', 16)
+        # The initial sets to refine, with their tube if it's already known
+        pending = [(init, None)]
+        num_partitions = 1
+        leaves = []
+        while pending:
+            missing = [i for i, (_, tube) in enumerate(pending) if tube is None]
+            for i, tube in zip(missing, compute_tubes([pending[i][0] for i in missing])):
+                pending[i] = (pending[i][0], tube)
+            splits = []
+            for rects, tube in pending:
+                rects = np.array(rects, dtype=float)
+                box = np.array([rects[:, 0, :].min(axis=0), rects[:, 1, :].max(axis=0)])
+                widths = (tube[1::2, 1:] - tube[0::2, 1:]).max(axis=0)
+                spanned = np.flatnonzero(box[1] > box[0])
+                if num_partitions >= max_partitions or len(spanned) == 0 or np.all(widths <= budget):
+                    leaves.append(tube)
+                    continue
+                splits.append((box, widths, spanned))
+                num_partitions += 1
+
+            probes = []
+            for box, _, spanned in splits:
+                for dim in spanned:
+                    lower_half = box.copy()
+                    lower_half[1, dim] = (box[0, dim] + box[1, dim]) / 2
+                    probes.append(lower_half)
+            probe_tubes = iter(compute_tubes([[lower_half.tolist()] for lower_half in probes]))
+            probes = iter(probes)
+            next_pending = []
+            for box, widths, spanned in splits:
+                candidates = [(dim, next(probes), next(probe_tubes)) for dim in spanned]
+                narrowing = [
+                    np.sum((widths - (probe_tube[1::2, 1:] - probe_tube[0::2, 1:]).max(axis=0)) / budget)
+                    for _, _, probe_tube in candidates
+                ]
+                dim, lower_half, lower_tube = candidates[int(np.argmax(narrowing))]
+                upper_half = box.copy()
+                upper_half[0, dim] = lower_half[1, dim]
+                next_pending += [([lower_half.tolist()], lower_tube), ([upper_half.tolist()], None)]
+            pending = next_pending
+        return self.union_tubes(leaves)
+
+    def create_worker_pool(
+        self,
+        num_workers,
+        agent_list,
+        time_step,
+        lane_map,
+        init_seg_length,
+        reachability_method,
+        params = {}
+    ):
+        # Agents hold compiled controller code that can't be pickled, so the workers
+        # inherit them by forking instead of receiving them with every task
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            warnings.warn("Parallel reachtube computation requires the 'fork' start method, falling back to serial computation")
+            return None
+        agent_dict = {agent.id: agent for agent in agent_list}
+        return ProcessPoolExecutor(
+            max_workers = num_workers,
+            mp_context = multiprocessing.get_context('fork'),
+            initializer = _init_worker,
+            initargs = (self, agent_dict, time_step, lane_map, init_seg_length, reachability_method, params)
+        )
+
+    @staticmethod
+    def _modes_key(node: AnalysisTreeNode):
+        return tuple(sorted((agent_id, tuple(node.mode[agent_id]), tuple(node.static[agent_id])) for agent_id in node.agent))
+
+    @staticmethod
+    def _start_boxes(node: AnalysisTreeNode, agent_id) -> np.ndarray:
+        """The boxes containing the states of the agent at the start of the node, as an array of rectangles"""
+        if agent_id in node.init:
+            return np.array(node.init[agent_id], dtype=float)
+        return np.asarray(node.trace[agent_id], dtype=float)[None, :2, 1:]
+
+    def add_visited(self, node: AnalysisTreeNode):
+        """Index node for the containment check, if the tubes of all its agents were computed from their initial set"""
+        if set(node.init) != set(node.agent):
+            return
+        start_boxes = {agent_id: self._start_boxes(node, agent_id) for agent_id in node.agent}
+        self.visited.setdefault(self._modes_key(node), []).append((node, start_boxes))
+
+    def find_covering_node(self, node: AnalysisTreeNode) -> Optional[AnalysisTreeNode]:
+        """
+        Find an explored node in the same modes, starting at the same time or earlier, whose initial set contains
+        the states of node at its start. The reachtubes from the covering node contain all the executions from node,
+        so node doesn't need to be explored
+        """
+        start_boxes = {agent_id: self._start_boxes(node, agent_id) for agent_id in node.agent}
+        for visited_node, visited_boxes in self.visited.get(self._modes_key(node), []):
+            if visited_node.start_time > node.start_time:
+                continue
+            if all(
+                # Each box is contained in one of the boxes of the initial set of the visited node
+                np.all(np.any(
+                    np.all(boxes[:, None, 0, :] >= visited_boxes[agent_id][None, :, 0, :], axis=2) &
+                    np.all(boxes[:, None, 1, :] <= visited_boxes[agent_id][None, :, 1, :], axis=2),
+                    axis=1))
+                for agent_id, boxes in start_boxes.items()
+            ):
+                return visited_node
+        return None
+
+    def prune(self, node: AnalysisTreeNode, covering_node: AnalysisTreeNode):
+        """Make node a leaf covered by covering_node, only keeping the box of its first time step"""
+        node.covered_by = covering_node
+        for agent_id in node.agent:
+            boxes = self._start_boxes(node, agent_id)
+            node.trace[agent_id] = np.hstack((
+                np.full((2, 1), node.start_time), [boxes[:, 0, :].min(axis=0), boxes[:, 1, :].max(axis=0)]))
+
+    def merge_siblings(self, children, params = {}) -> List[AnalysisTreeNode]:
+        """
+        Merge the children of the frontier in which the same agent enters the same modes at overlapping times.
+        children holds (parent, child, end time of the guard hits) for each child. The merged child starts at the
+        earliest start time, with all the reset sets, and the union of the tubes of the other agents, which are
+        extended back to that time with the tubes of their parents. The merged children are added to the tree
+        before the children they merge, which are pruned as covered by them.
+
+        children must be in BFS order, i.e. their parents in the order of the frontier.
+
+        Returns:
+            The children to explore, in BFS order
+        """
+        # Position of the parents in BFS order
+        parent_order = {}
+        for parent, _, _ in children:
+            parent_order.setdefault(id(parent), len(parent_order))
+        groups = {}
+        for parent, child, end_time in children:
+            if child.covered_by is not None:
+                continue
+            key = (list(child.init)[0], self._modes_key(child))
+            groups.setdefault(key, []).append((parent, child, end_time))
+        res = []
+        for (transit_agent_id, _), members in groups.items():
+            members.sort(key=lambda member: member[1].start_time)
+            overlapping = []
+            for parent, child, end_time in members + [(None, None, None)]:
+                if child is not None and overlapping and child.start_time <= overlapping_end + 1e-9 and \
+                        parent.start_time <= overlapping[0][1].start_time:
+                    overlapping.append((parent, child))
+                    overlapping_end = max(overlapping_end, end_time)
+                    continue
+                if len(overlapping) == 1:
+                    res.append(overlapping[0][1])
+                elif len(overlapping) > 1:
+                    res.append(self._merge_children(transit_agent_id, overlapping, parent_order, params))
+                overlapping = [(parent, child)]
+                overlapping_end = end_time
+        # The merged children were inserted in the child lists of the parents, follow them to get the BFS order
+        res = {id(child) for child in res}
+        parents = sorted({id(parent): parent for parent, _, _ in children}.values(), key=lambda parent: parent_order[id(parent)])
+        return [child for parent in parents for child in parent.child if id(child) in res]
+
+    def _merge_children(self, transit_agent_id, members, parent_order, params) -> AnalysisTreeNode:
+        _, first_child = members[0]
+        start_time = first_child.start_time
+        init, init_times = [], []
+        for _, child in members:
+            init += child.init[transit_agent_id]
+            init_times += [child.start_time] * len(child.init[transit_agent_id])
+        trace = {}
+        for agent_id in first_child.agent:
+            if agent_id == transit_agent_id:
+                continue
+            tubes = []
+            for parent, child in members:
+                parent_trace = np.asarray(parent.trace[agent_id])
+                lower_times = parent_trace[0::2, 0]
+                steps = np.flatnonzero((lower_times >= start_time - 1e-9) & (lower_times < child.start_time - 1e-9))
+                rows = np.stack((2 * steps, 2 * steps + 1), axis=1).ravel()
+                tubes.append(np.vstack((parent_trace[rows], child.trace[agent_id])))
+            trace[agent_id] = self.union_tubes(tubes)
+        merged = AnalysisTreeNode(
+            trace = trace,
+            init = {transit_agent_id: merge_reset_rects(init, init_times, params)},
+            mode = first_child.mode,
+            static = first_child.static,
+            uncertain_param = first_child.uncertain_param,
+            agent = first_child.agent,
+            assert_hits = {},
+            child = [],
+            start_time = start_time,
+            type = 'reachtube'
+        )
+        # Before the merged children in BFS order, so that the nodes they are covered by are always saved before them:
+        # under the first of their parents in BFS order, before its first merged child
+        bfs_parent = min((parent for parent, _ in members), key=lambda parent: parent_order[id(parent)])
+        bfs_child = next(child for child in bfs_parent.child if any(child is member for _, member in members))
+        bfs_parent.child.insert(bfs_parent.child.index(bfs_child), merged)
+        for _, child in members:
+            self.prune(child, merged)
+        return merged
+
+    def expand_node(self, node: AnalysisTreeNode, transition_graph, params = {}, transitions = None) -> List[AnalysisTreeNode]:
+        # Get all possible transitions to next mode, unless they were already found
+        if transitions is None:
+            transitions = transition_graph.get_transition_verify_new(node)
+        asserts, all_possible_transitions = transitions
+        if asserts != None:
+            asserts, idx = asserts
+            for agent in node.agent:
+                node.trace[agent] = node.trace[agent][:(idx + 1) * 2]
+            node.assert_hits = asserts
+            return []
+
+        max_end_idx = 0
+        for transition in all_possible_transitions:
+            # Each transition will contain a list of rectangles and their corresponding indexes in the original list
+            transit_agent_idx, src_mode, dest_mode, next_init, idx = transition
+            start_idx, end_idx = idx[0], idx[-1]
+
+            truncated_trace = {}
+            for agent_idx in node.agent:
+                truncated_trace[agent_idx] = node.trace[agent_idx][start_idx*2:]
+            if end_idx > max_end_idx:
+                max_end_idx = end_idx
+
+            if dest_mode is None:
+                continue
+            hit_times = [node.trace[transit_agent_idx][i * 2][0] for i in idx]
+            next_init = merge_reset_rects(next_init, hit_times, params)
+
+            next_node_mode = copy.deepcopy(node.mode)
+            next_node_static = node.static
+            next_node_uncertain_param = node.uncertain_param
+            next_node_mode[transit_agent_idx] = dest_mode
+            next_node_agent = node.agent
+            next_node_start_time = list(truncated_trace.values())[0][0][0]
+            next_node_init = {}
+            next_node_trace = {}
+            for agent_idx in next_node_agent:
+                if agent_idx == transit_agent_idx:
+                    next_node_init[agent_idx] = next_init
+                else:
+                    next_node_trace[agent_idx] = truncated_trace[agent_idx]
+
+            tmp = AnalysisTreeNode(
+                trace=next_node_trace,
+                init=next_node_init,
+                mode=next_node_mode,
+                static = next_node_static,
+                uncertain_param = next_node_uncertain_param,
+                agent=next_node_agent,
+                assert_hits = {},
+                child=[],
+                start_time=round(next_node_start_time, 10),
+                type='reachtube'
+            )
+            if self.visited is not None:
+                covering_node = self.find_covering_node(tmp)
+                if covering_node is not None:
+                    self.prune(tmp, covering_node)
+            self.hit_end_times[id(tmp)] = hit_times[-1]
+            node.child.append(tmp)
+
+        """Truncate trace of current node based on max_end_idx"""
+        """Only truncate when there's transitions"""
+        if all_possible_transitions:
+            for agent_idx in node.agent:
+                node.trace[agent_idx] = node.trace[agent_idx][:(
+                    max_end_idx+1)*2]
+        return node.child
+
+    def tube_origin(self, node: AnalysisTreeNode, agent_id):
+        """The initial set and start time the tube of the agent in node was computed from, None if it isn't known"""
+        if agent_id in node.init:
+            return node.init[agent_id], node.start_time
+        return self.tube_origins.get(id(node), {}).get(agent_id)
+
+    def compute_windowed_tubes(self, nodes, transition_graph, time_horizon, window, compute_tubes):
+        """
+        Compute the tubes of nodes in windows, starting with window seconds and doubling, and look for the guard
+        and assert hits in each new window, until the hits of every node are resolved: an assert is hit, the guards
+        stop being hit before the end of the window, or the tubes reach time_horizon.
+
+        The tubes of the agents are recomputed over the longer windows from the initial set they come from, so for
+        the reachability methods whose tubes over a shorter horizon are a prefix of the longer ones, e.g. DryVR with
+        the PW bloating, the tubes and transitions are the same as with the whole remaining horizon. The tubes whose
+        initial set isn't known, e.g. in merged children, are extended from their last box instead.
+
+        Returns:
+            The result of get_transition_verify_new for each node
+        """
+        lengths = {id(node): window for node in nodes}
+        scan_starts = {id(node): 0 for node in nodes}
+        results = {}
+        pending = list(nodes)
+        while pending:
+            tasks = []
+            extensions = []
+            for node in pending:
+                end_time = min(node.start_time + lengths[id(node)], time_horizon)
+                for agent_id in node.agent:
+                    trace = node.trace.get(agent_id)
+                    if trace is not None and trace[-1, 0] >= end_time - 1e-9:
+                        continue
+                    origin = self.tube_origin(node, agent_id)
+                    if origin is not None:
+                        init, start_time = origin
+                    else:
+                        init, start_time = [[trace[-2, 1:].tolist(), trace[-1, 1:].tolist()]], trace[-1, 0]
+                    tasks.append((node, agent_id, init, round(end_time - start_time, 10)))
+                    extensions.append((start_time, origin is None))
+            for (node, agent_id, _, _), (start_time, extend), tube in zip(tasks, extensions, compute_tubes(tasks)):
+                tube[:, 0] += start_time
+                if extend:
+                    node.trace[agent_id] = np.vstack((node.trace[agent_id], tube))
+                else:
+                    # Drop the steps before the start of node, when the tube comes from an ancestor
+                    num_steps = int(np.count_nonzero(tube[0::2, 0] < node.start_time - 1e-9))
+                    node.trace[agent_id] = tube[2 * num_steps:]
+
+            unresolved = []
+            for node in pending:
+                trace_length = min(len(trace) for trace in node.trace.values()) // 2
+                for agent_id in node.agent:
+                    node.trace[agent_id] = node.trace[agent_id][:2 * trace_length]
+                asserts, transitions = transition_graph.get_transition_verify_new(node, scan_starts[id(node)])
+                results[id(node)] = (asserts, transitions)
+                if asserts is not None or min(trace[-1, 0] for trace in node.trace.values()) >= time_horizon - 1e-9:
+                    continue
+                if transitions:
+                    if max(transition[4][-1] for transition in transitions) < trace_length - 1:
+                        continue
+                    # The guards are still hit at the end of the window, check them again from the first hit
+                    scan_starts[id(node)] = min(transition[4][0] for transition in transitions)
+                else:
+                    scan_starts[id(node)] = trace_length
+                lengths[id(node)] *= 2
+                unresolved.append(node)
+            pending = unresolved
+        return [results[id(node)] for node in nodes]
+
     def compute_full_reachtube(
         self,
         init_list: List[float],
@@ -117,125 +543,177 @@ class Verifier:
             root.uncertain_param[agent.id] = uncertain_param_list[i]
             root.agent[agent.id] = agent
             root.type = 'reachtube'
+        tube_cache = params.get('tube_cache')
+        if tube_cache is not None:
+            # The agents and maps may have been modified since the last verification
+            tube_cache.refresh()
+        self.visited = {} if params.get('prune_covered', False) else None
+        self.tube_origins = {}
+        verify_window = params.get('verify_window')
+        num_workers = params.get('num_workers', 1)
+        pool = None
+        if num_workers > 1:
+            pool = self.create_worker_pool(
+                num_workers, agent_list, time_step, lane_map, init_seg_length, reachability_method, params)
+        # With params['stream_to'], the nodes are written to that file one BFS level at a time once their tubes
+        # and children are final, and their traces are dropped from memory
+        stream_to = params.get('stream_to')
+        writer = None if stream_to is None else AnalysisTreeWriter(stream_to)
+        written_level = []
         verification_queue = []
         verification_queue.append(root)
-        while verification_queue != []:
-            node: AnalysisTreeNode = verification_queue.pop(0)
-            print(node.start_time, node.mode)
-            remain_time = round(time_horizon - node.start_time, 10)
-            if remain_time <= 0:
-                continue
-            # For reachtubes not already computed
-            # TODO: can add parallalization for this loop
-            for agent_id in node.agent:
-                if agent_id not in node.trace:
-                    # Compute the trace starting from initial condition
-                    mode = node.mode[agent_id]
-                    init = node.init[agent_id]
-                    uncertain_param = node.uncertain_param[agent_id]
-                    # trace = node.agent[agent_id].TC_simulate(mode, init, remain_time,lane_map)
-                    # trace[:,0] += node.start_time
-                    # node.trace[agent_id] = trace.tolist()
-                    if reachability_method == "DRYVR":
-                        cur_bloated_tube = self.calculate_full_bloated_tube(mode,
-                                            init,
-                                            remain_time,
-                                            time_step, 
-                                            node.agent[agent_id].TC_simulate,
-                                            params,
-                                            100,
-                                            SIMTRACENUM,
-                                            combine_seg_length=init_seg_length,
-                                            lane_map = lane_map
-                                            )
-                    elif reachability_method == "MIXMONO_CONT":
-                        cur_bloated_tube = calculate_bloated_tube_mixmono_cont(
-                            mode, 
-                            init, 
-                            uncertain_param, 
-                            remain_time,
-                            time_step, 
-                            node.agent[agent_id],
-                            lane_map
-                        )
-                    elif reachability_method == "MIXMONO_DISC":
-                        cur_bloated_tube = calculate_bloated_tube_mixmono_disc(
-                            mode, 
-                            init, 
-                            uncertain_param,
-                            remain_time,
-                            time_step,
-                            node.agent[agent_id],
-                            lane_map
-                        ) 
-                    else:
-                        raise ValueError(f"Reachability computation method {reachability_method} not available.")
-                    trace = np.array(cur_bloated_tube)
-                    trace[:, 0] += node.start_time
-                    node.trace[agent_id] = trace.tolist()
-                    # print("here")
-            
-            # Get all possible transitions to next mode
-            asserts, all_possible_transitions = transition_graph.get_transition_verify_new(node)
-            if asserts != None:
-                asserts, idx = asserts
-                for agent in node.agent:
-                    node.trace[agent] = node.trace[agent][:(idx + 1) * 2]
-                node.assert_hits = asserts
-                continue
+        try:
+            while verification_queue != []:
+                # Expand the whole BFS frontier at once, so the tubes of all the agents in
+                # all the sibling nodes can be computed together
+                frontier = []
+                for node in verification_queue:
+                    print(node.start_time, node.mode)
+                    remain_time = round(time_horizon - node.start_time, 10)
+                    if remain_time <= 0:
+                        continue
+                    frontier.append(node)
+                verification_queue = []
 
-            max_end_idx = 0
-            for transition in all_possible_transitions:
-                # Each transition will contain a list of rectangles and their corresponding indexes in the original list
-                transit_agent_idx, src_mode, dest_mode, next_init, idx = transition
-                start_idx, end_idx = idx[0], idx[-1]
+                def compute_tubes(tasks):
+                    if tube_cache is None:
+                        return compute_new_tubes(tasks)
+                    groups = [
+                        tube_cache.group(node.agent[agent_id], node.mode[agent_id], node.uncertain_param[agent_id],
+                                         time_step, lane_map, init_seg_length, reachability_method, params)
+                        for node, agent_id, _, _ in tasks
+                    ]
+                    tubes = [
+                        tube_cache.get(group, init, remain_time)
+                        for group, (_, _, init, remain_time) in zip(groups, tasks)
+                    ]
+                    missing = [i for i, tube in enumerate(tubes) if tube is None]
+                    for i, tube in zip(missing, compute_new_tubes([tasks[i] for i in missing])):
+                        _, _, init, remain_time = tasks[i]
+                        tube_cache.put(groups[i], init, remain_time, tube)
+                        tubes[i] = tube
+                    return tubes
 
-                truncated_trace = {}
-                for agent_idx in node.agent:
-                    truncated_trace[agent_idx] = node.trace[agent_idx][start_idx*2:]
-                if end_idx > max_end_idx:
-                    max_end_idx = end_idx
+                def compute_new_tubes(tasks):
+                    if pool is None:
+                        return [
+                            self.compute_agent_tube(
+                                node.agent[agent_id], node.mode[agent_id], init, node.uncertain_param[agent_id],
+                                remain_time, time_step, lane_map, init_seg_length, reachability_method, params
+                            )
+                            for node, agent_id, init, remain_time in tasks
+                        ]
+                    # Results are collected in submission order, so the tree is identical to the serial one
+                    futures = [
+                        pool.submit(_compute_agent_tube_worker, agent_id, node.mode[agent_id], init,
+                                    node.uncertain_param[agent_id], remain_time)
+                        for node, agent_id, init, remain_time in tasks
+                    ]
+                    return [future.result() for future in futures]
 
-                if dest_mode is None:
-                    continue
+                def compute_agent_tubes(tasks):
+                    if 'partition_width' in params:
+                        return [
+                            self.compute_partitioned_tube(
+                                init, params,
+                                lambda inits: compute_tubes([(node, agent_id, init, remain_time) for init in inits])
+                            )
+                            for node, agent_id, init, remain_time in tasks
+                        ]
+                    return compute_tubes(tasks)
 
-                next_node_mode = copy.deepcopy(node.mode)
-                next_node_static = node.static
-                next_node_uncertain_param = node.uncertain_param
-                next_node_mode[transit_agent_idx] = dest_mode
-                next_node_agent = node.agent
-                next_node_start_time = list(truncated_trace.values())[0][0][0]
-                next_node_init = {}
-                next_node_trace = {}
-                for agent_idx in next_node_agent:
-                    if agent_idx == transit_agent_idx:
-                        next_node_init[agent_idx] = next_init
-                    else:
-                        next_node_trace[agent_idx] = truncated_trace[agent_idx]
-
-                tmp = AnalysisTreeNode(
-                    trace=next_node_trace,
-                    init=next_node_init,
-                    mode=next_node_mode,
-                    static = next_node_static,
-                    uncertain_param = next_node_uncertain_param,
-                    agent=next_node_agent,
-                    assert_hits = {},
-                    child=[],
-                    start_time=round(next_node_start_time, 10),
-                    type='reachtube'
-                )
-                node.child.append(tmp)
-                verification_queue.append(tmp)
+                if verify_window is None:
+                    # For reachtubes not already computed
+                    tasks = []
+                    for node in frontier:
+                        remain_time = round(time_horizon - node.start_time, 10)
+                        for agent_id in node.agent:
+                            if agent_id not in node.trace:
+                                tasks.append((node, agent_id, node.init[agent_id], remain_time))
+                    for (node, agent_id, _, _), trace in zip(tasks, compute_agent_tubes(tasks)):
+                        trace[:, 0] += node.start_time
+                        node.trace[agent_id] = trace
+                    frontier_transitions = [None] * len(frontier)
+                else:
+                    frontier_transitions = self.compute_windowed_tubes(
+                        frontier, transition_graph, time_horizon, verify_window, compute_agent_tubes)
 
-            """Truncate trace of current node based on max_end_idx"""
-            """Only truncate when there's transitions"""
-            if all_possible_transitions:
-                for agent_idx in node.agent:
-                    node.trace[agent_idx] = node.trace[agent_idx][:(
-                        max_end_idx+1)*2]
+                children = []
+                self.hit_end_times = {}
+                for node, transitions in zip(frontier, frontier_transitions):
+                    if self.visited is not None:
+                        self.add_visited(node)
+                    for child in self.expand_node(node, transition_graph, params, transitions):
+                        if verify_window is not None:
+                            self.tube_origins[id(child)] = {
+                                agent_id: self.tube_origin(node, agent_id) for agent_id in child.trace
+                            }
+                        children.append((node, child, self.hit_end_times[id(child)]))
+                if params.get('merge_siblings', False):
+                    next_nodes = self.merge_siblings(children, params)
+                    if self.visited is not None:
+                        for child in next_nodes:
+                            covering_node = self.find_covering_node(child)
+                            if covering_node is not None:
+                                self.prune(child, covering_node)
+                else:
+                    next_nodes = [child for _, child, _ in children]
+                verification_queue = [child for child in next_nodes if child.covered_by is None]
+                if writer is not None:
+                    written_level = self.stream_level(writer, root, written_level)
+            if writer is not None:
+                # The levels of the leaves left, e.g. pruned children
+                while written_level:
+                    written_level = self.stream_level(writer, root, written_level)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            if writer is not None:
+                writer.close()
 
         self.reachtube_tree = AnalysisTree(root)
+        if writer is not None:
+            self.reachtube_tree.attach_binary(stream_to)
         return self.reachtube_tree
 
+    @staticmethod
+    def stream_level(writer: AnalysisTreeWriter, root: AnalysisTreeNode, written_level: List[AnalysisTreeNode]) -> List[AnalysisTreeNode]:
+        """Write the BFS level after written_level, the root if it's empty, drop the traces of its nodes and return it"""
+        if not written_level and id(root) not in writer.indices:
+            writer.write_node(root)
+            level = [root]
+        else:
+            level = writer.write_children(written_level)
+        for node in level:
+            node.trace = {}
+        return level
+
+
+# State shared with the worker processes, set once per worker by `_init_worker`
+_worker_state = {}
+
+def _init_worker(verifier, agent_dict, time_step, lane_map, init_seg_length, reachability_method, params):
+    _worker_state.update(
+        verifier = verifier,
+        agent_dict = agent_dict,
+        time_step = time_step,
+        lane_map = lane_map,
+        init_seg_length = init_seg_length,
+        reachability_method = reachability_method,
+        params = params,
+    )
 
+def _compute_agent_tube_worker(agent_id, mode, init, uncertain_param, remain_time):
+    verifier: Verifier = _worker_state['verifier']
+    return verifier.compute_agent_tube(
+        _worker_state['agent_dict'][agent_id],
+        mode,
+        init,
+        uncertain_param,
+        remain_time,
+        _worker_state['time_step'],
+        _worker_state['lane_map'],
+        _worker_state['init_seg_length'],
+        _worker_state['reachability_method'],
+        _worker_state['params']
+    )
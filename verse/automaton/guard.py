@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Dict, Optional, Tuple
 import pickle
 import ast
 
@@ -79,6 +79,140 @@ class ValueSubstituter(ast.NodeTransformer):
         return node
 
 
+class NonLinearGuard(Exception):
+    pass
+
+def _linear_form(expr) -> Tuple[Dict[str, float], float]:
+    """Write a z3 arithmetic expression as sum(coeffs[var]*var) + const, raises NonLinearGuard if it isn't linear"""
+    if is_int_value(expr):
+        return {}, float(expr.as_long())
+    if is_rational_value(expr):
+        return {}, expr.as_fraction().numerator / expr.as_fraction().denominator
+    if is_const(expr) and expr.decl().kind() == Z3_OP_UNINTERPRETED:
+        return {str(expr): 1.0}, 0.0
+    if is_add(expr) or is_sub(expr):
+        coeffs, const = _linear_form(expr.arg(0))
+        coeffs = dict(coeffs)
+        sign = -1 if is_sub(expr) else 1
+        for i in range(1, expr.num_args()):
+            arg_coeffs, arg_const = _linear_form(expr.arg(i))
+            for var, c in arg_coeffs.items():
+                coeffs[var] = coeffs.get(var, 0.0) + sign * c
+            const += sign * arg_const
+        return coeffs, const
+    if is_to_real(expr):
+        return _linear_form(expr.arg(0))
+    if is_app_of(expr, Z3_OP_UMINUS):
+        coeffs, const = _linear_form(expr.arg(0))
+        return {var: -c for var, c in coeffs.items()}, -const
+    if is_mul(expr) or is_div(expr):
+        forms = [_linear_form(expr.arg(i)) for i in range(expr.num_args())]
+        if is_div(expr):
+            coeffs, const = forms[1]
+            if coeffs or const == 0:
+                raise NonLinearGuard(expr)
+            forms[1] = ({}, 1 / const)
+        coeffs, const = forms[0]
+        for arg_coeffs, arg_const in forms[1:]:
+            if coeffs and arg_coeffs:
+                raise NonLinearGuard(expr)
+            if arg_coeffs:
+                coeffs, const, arg_coeffs, arg_const = arg_coeffs, arg_const, coeffs, const
+            coeffs = {var: c * arg_const for var, c in coeffs.items()}
+            const = const * arg_const
+        return coeffs, const
+    raise NonLinearGuard(expr)
+
+def _compile_interval_guard(expr):
+    """Convert a z3 guard made of linear (in)equalities into a tree that can be evaluated on boxes,
+    raises NonLinearGuard if it can't be converted"""
+    if is_true(expr) or is_false(expr):
+        return ('const', is_true(expr))
+    if is_and(expr) or is_or(expr):
+        return ('and' if is_and(expr) else 'or', [_compile_interval_guard(arg) for arg in expr.children()])
+    if is_not(expr):
+        return ('not', _compile_interval_guard(expr.arg(0)))
+    for check, op in ((is_le, '<='), (is_lt, '<'), (is_ge, '>='), (is_gt, '>'), (is_eq, '==')):
+        if check(expr) and expr.num_args() == 2 and is_arith(expr.arg(0)):
+            lhs_coeffs, lhs_const = _linear_form(expr.arg(0))
+            rhs_coeffs, rhs_const = _linear_form(expr.arg(1))
+            coeffs = dict(lhs_coeffs)
+            for var, c in rhs_coeffs.items():
+                coeffs[var] = coeffs.get(var, 0.0) - c
+            return ('cmp', op, coeffs, lhs_const - rhs_const)
+    raise NonLinearGuard(expr)
+
+def _interval_guard_value(tree, bounds) -> Optional[bool]:
+    """True if the guard holds on the whole box, False if it holds nowhere in the box, None if unknown.
+    Values within a small tolerance of the boundary are unknown, so float rounding can't change the result"""
+    kind = tree[0]
+    if kind == 'const':
+        return tree[1]
+    if kind == 'not':
+        value = _interval_guard_value(tree[1], bounds)
+        return None if value is None else not value
+    if kind in ('and', 'or'):
+        values = [_interval_guard_value(child, bounds) for child in tree[1]]
+        absorbing = kind == 'or'
+        if absorbing in values:
+            return absorbing
+        if None in values:
+            return None
+        return not absorbing
+    _, op, coeffs, const = tree
+    lo = hi = const
+    scale = abs(const)
+    for var, c in coeffs.items():
+        if var not in bounds:
+            return None
+        start, end = bounds[var]
+        lo += min(c * start, c * end)
+        hi += max(c * start, c * end)
+        scale += abs(c) * max(abs(start), abs(end))
+    eps = 1e-9 * (1 + scale)
+    # Truth of `lo..hi op 0` on the whole interval
+    if op in ('<=', '<'):
+        return True if hi < -eps else False if lo > eps else None
+    if op in ('>=', '>'):
+        return True if lo > eps else False if hi < -eps else None
+    if lo > eps or hi < -eps:
+        return False
+    return None
+
+class GuardSolver:
+    """Solvers for a continuous guard, built once and reused with push/pop scopes for the bounds of every box"""
+    def __init__(self, guard):
+        self.solver = Solver()
+        self.solver.add(guard)
+        self.negated_solver = Solver()
+        self.negated_solver.add(Not(guard))
+        try:
+            self.interval_guard = _compile_interval_guard(guard)
+        except NonLinearGuard:
+            self.interval_guard = None
+
+    def _check(self, solver, variables, bounds):
+        solver.push()
+        for symbol, (start, end) in bounds.items():
+            solver.add(variables[symbol] >= start, variables[symbol] <= end)
+        res = solver.check()
+        solver.pop()
+        return res
+
+    def check(self, variables, bounds) -> Tuple[bool, bool]:
+        """Returns whether the guard can be satisfied in the box and whether the box is contained in the guard"""
+        if self.interval_guard is not None:
+            value = _interval_guard_value(self.interval_guard, bounds)
+            if value is not None:
+                return value, value
+        if self._check(self.solver, variables, bounds) != sat:
+            return False, False
+        return True, self._check(self.negated_solver, variables, bounds) == unsat
+
+# Guard solvers shared by all the guard expressions, keyed by the z3 string of the guard
+GUARD_SOLVER_CACHE_SIZE = 1024
+_guard_solvers: Dict[str, GuardSolver] = {}
+
 class GuardExpressionAst:
     def __init__(self, guard_list, guard_idx = 0):
         self.ast_list = copy.deepcopy(guard_list)
@@ -95,11 +229,10 @@ class GuardExpressionAst:
             For example:"And(v>=40-0.1*u, v-40+0.1*u<=0)"
 
         Returns:
-            A Z3 Solver obj that check for guard.
+            A GuardSolver obj that check for guard, shared by all guards with the same string.
             A symbol index dic obj that indicates the index
             of variables that involved in the guard.
         """
-        cur_solver = Solver()
         # This magic line here is because SymPy will evaluate == to be False
         # Therefore we are not be able to get free symbols from it
         # Thus we need to replace "==" to something else
@@ -108,14 +241,16 @@ class GuardExpressionAst:
 
         for vars in reversed(self.cont_variables):
             guard_str = guard_str.replace(vars, self.cont_variables[vars])
-        # XXX `locals` should override `globals` right?
-        cur_solver.add(eval(guard_str, globals(), self.varDict))  # TODO use an object instead of `eval` a string
+        cur_solver = _guard_solvers.get(guard_str)
+        if cur_solver is None:
+            if len(_guard_solvers) >= GUARD_SOLVER_CACHE_SIZE:
+                _guard_solvers.pop(next(iter(_guard_solvers)))
+            # XXX `locals` should override `globals` right?
+            cur_solver = GuardSolver(eval(guard_str, globals(), self.varDict))  # TODO use an object instead of `eval` a string
+            _guard_solvers[guard_str] = cur_solver
         return cur_solver, symbols_map
 
     def evaluate_guard_cont(self, agent, continuous_variable_dict, lane_map):
-        res = False
-        is_contained = False
-
         for cont_vars in continuous_variable_dict:
             underscored = cont_vars.replace('.','_')
             self.cont_variables[cont_vars] = underscored
@@ -126,24 +261,9 @@ class GuardExpressionAst:
             return z3_string, z3_string 
 
         cur_solver, symbols = self._build_guard(z3_string, agent)
-        cur_solver.push()
-        for symbol in symbols:
-            start, end = continuous_variable_dict[symbols[symbol]]
-            cur_solver.add(self.varDict[symbol] >= start, self.varDict[symbol] <= end)
-        if cur_solver.check() == sat:
-            # The reachtube hits the guard
-            cur_solver.pop()
-            res = True
-            
-            tmp_solver = Solver()
-            tmp_solver.add(Not(cur_solver.assertions()[0]))
-            for symbol in symbols:
-                start, end = continuous_variable_dict[symbols[symbol]]
-                tmp_solver.add(self.varDict[symbol] >= start, self.varDict[symbol] <= end)
-            if tmp_solver.check() == unsat:
-                is_contained = True
-
-        return res, is_contained
+        bounds = {symbol: continuous_variable_dict[symbols[symbol]] for symbol in symbols}
+        # Whether the reachtube hits the guard and whether it's contained in the guard
+        return cur_solver.check(self.varDict, bounds)
 
     def generate_z3_expression(self):
         """
@@ -407,7 +527,8 @@ class GuardExpressionAst:
         else:
             raise ValueError(f'Node type {root} from {unparse(root)} is not supported')
 
-    def _handle_longitudinal_set(self, lane_seg: AbstractLane, position: np.ndarray) -> List[float]:
+    @staticmethod
+    def _handle_longitudinal_set(lane_seg: AbstractLane, position: np.ndarray) -> List[float]:
         if lane_seg.type == "Straight":
             # Delta lower
             delta0 = position[0,:] - lane_seg.start
@@ -458,7 +579,8 @@ class GuardExpressionAst:
         else:
             raise ValueError(f'Lane segment with type {lane_seg.type} is not supported')
 
-    def _handle_lateral_set(self, lane_seg: AbstractLane, position: np.ndarray) -> List[float]:
+    @staticmethod
+    def _handle_lateral_set(lane_seg: AbstractLane, position: np.ndarray) -> List[float]:
         if lane_seg.type == "Straight":
             # Delta lower
             delta0 = position[0,:] - lane_seg.start
@@ -0,0 +1,216 @@
+"""Interval evaluation of the verification guards and asserts over a whole reachtube.
+
+Every continuous variable is bound to an Interval holding the lower and upper bounds at
+each step of the tube. Boolean expressions evaluate to a Truth, which records for each
+step whether the expression definitely holds on the whole box, definitely holds nowhere
+in the box, or neither. Anything that can't be bounded this way (e.g. map functions of
+continuous variables) is unknown, and those steps have to be checked with the solver.
+"""
+
+import ast
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from verse.analysis.interval import Interval
+from verse.automaton.guard import GuardExpressionAst
+from verse.map import LaneMap
+from verse.parser import Reduction, ReductionType
+
+class Truth:
+    """For each step, whether the expression holds everywhere (true) and nowhere (false) in the box"""
+    def __init__(self, true, false):
+        self.true = true
+        self.false = false
+
+    @staticmethod
+    def const(value: bool) -> "Truth":
+        return Truth(np.bool_(value), np.bool_(not value))
+
+    def __invert__(self) -> "Truth":
+        return Truth(self.false, self.true)
+
+UNKNOWN = Truth(np.bool_(False), np.bool_(False))
+
+class _Unknown:
+    """Value that can't be bounded"""
+    pass
+
+UNKNOWN_VALUE = _Unknown()
+
+def _is_bounded(value) -> bool:
+    if isinstance(value, (Interval, Truth, _Unknown)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return any(_is_bounded(v) for v in value)
+    return False
+
+def _to_interval(value):
+    if isinstance(value, Interval):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return Interval(value, value)
+    return None
+
+def _to_truth(value) -> Truth:
+    if isinstance(value, Truth):
+        return value
+    if _is_bounded(value):
+        return UNKNOWN
+    return Truth.const(bool(value))
+
+def _and(values) -> Truth:
+    true, false = np.bool_(True), np.bool_(False)
+    for value in values:
+        true = true & value.true
+        false = false | value.false
+    return Truth(true, false)
+
+def _or(values) -> Truth:
+    return ~_and([~value for value in values])
+
+def _compare(op, left, right) -> Truth:
+    if not _is_bounded(left) and not _is_bounded(right):
+        return Truth.const(bool(_PYTHON_COMPARE[type(op)](left, right)))
+    left, right = _to_interval(left), _to_interval(right)
+    if left is None or right is None:
+        return UNKNOWN
+    diff = left - right
+    # Keep a margin around 0 so rounding in the bounds can't decide the result
+    eps = 1e-9 * (1 + left.magnitude() + right.magnitude())
+    positive, negative = diff.lo > eps, diff.hi < -eps
+    if isinstance(op, (ast.Lt, ast.LtE)):
+        return Truth(negative, positive)
+    if isinstance(op, (ast.Gt, ast.GtE)):
+        return Truth(positive, negative)
+    if isinstance(op, ast.Eq):
+        return Truth(np.bool_(False), positive | negative)
+    if isinstance(op, ast.NotEq):
+        return Truth(positive | negative, np.bool_(False))
+    return UNKNOWN
+
+_PYTHON_COMPARE = {
+    ast.Eq: lambda a, b: a == b,
+    ast.NotEq: lambda a, b: a != b,
+    ast.Lt: lambda a, b: a < b,
+    ast.LtE: lambda a, b: a <= b,
+    ast.Gt: lambda a, b: a > b,
+    ast.GtE: lambda a, b: a >= b,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+    ast.Is: lambda a, b: a is b,
+    ast.IsNot: lambda a, b: a is not b,
+}
+
+# Map functions of a lane and a position, bounded the same way as in GuardExpressionAst.evaluate_guard_hybrid
+_LANE_MAP_SETS = {
+    'get_longitudinal_position': GuardExpressionAst._handle_longitudinal_set,
+    'get_lateral_distance': GuardExpressionAst._handle_lateral_set,
+}
+
+def _lane_map_call(lane_map: LaneMap, func_name: str, args, hull: bool):
+    if len(args) != 2 or _is_bounded(args[0]) or not isinstance(args[1], list) or len(args[1]) != 2:
+        return UNKNOWN_VALUE
+    position = [_to_interval(v) for v in args[1]]
+    if any(v is None for v in position):
+        return UNKNOWN_VALUE
+    handle_set = _LANE_MAP_SETS[func_name]
+    lane = args[0]
+    if hull:
+        # The segments are looked up at the corners of the box, so the bounds only contain the bounds of
+        # every smaller box if all of them are on the same straight segment
+        segments = lane_map.lane_dict[lane].segment_list
+        if len(segments) != 1 or segments[0].type != "Straight":
+            return UNKNOWN_VALUE
+    lower = np.broadcast_arrays(*[v.lo for v in position], *[v.hi for v in position])
+    lower, upper = np.stack(lower[:2], axis=-1), np.stack(lower[2:], axis=-1)
+    lo, hi = np.empty(lower.shape[:-1]), np.empty(lower.shape[:-1])
+    for i in np.ndindex(lo.shape):
+        box = np.array([lower[i], upper[i]])
+        set1 = handle_set(lane_map.get_lane_segment(lane, list(lower[i])), box)
+        set2 = handle_set(lane_map.get_lane_segment(lane, list(upper[i])), box)
+        lo[i], hi[i] = min(set1[0], set2[0]), max(set1[1], set2[1])
+    return Interval(lo, hi)
+
+def _eval(node, env: Dict[str, Any], hull: bool):
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool):
+            return Truth.const(node.value)
+        return node.value
+    if isinstance(node, ast.Name):
+        return env.get(node.id, UNKNOWN_VALUE)
+    if isinstance(node, ast.Attribute):
+        value = _eval(node.value, env, hull)
+        if isinstance(value, _Unknown):
+            return UNKNOWN_VALUE
+        return getattr(value, node.attr, UNKNOWN_VALUE)
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_eval(elt, env, hull) for elt in node.elts]
+    if isinstance(node, ast.BoolOp):
+        values = [_to_truth(_eval(value, env, hull)) for value in node.values]
+        return _and(values) if isinstance(node.op, ast.And) else _or(values)
+    if isinstance(node, ast.UnaryOp):
+        operand = _eval(node.operand, env, hull)
+        if isinstance(node.op, ast.Not):
+            return ~_to_truth(operand)
+        interval = _to_interval(operand)
+        if interval is None or not isinstance(node.op, (ast.USub, ast.UAdd)):
+            return UNKNOWN_VALUE
+        return -interval if isinstance(node.op, ast.USub) else interval
+    if isinstance(node, ast.BinOp):
+        left, right = _to_interval(_eval(node.left, env, hull)), _to_interval(_eval(node.right, env, hull))
+        if left is None or right is None:
+            return UNKNOWN_VALUE
+        if isinstance(node.op, ast.Add):
+            return left + right
+        if isinstance(node.op, ast.Sub):
+            return left - right
+        if isinstance(node.op, ast.Mult):
+            return left * right
+        if isinstance(node.op, ast.Div) and np.all((right.lo > 0) | (right.hi < 0)):
+            return left * Interval(1 / right.hi, 1 / right.lo)
+        return UNKNOWN_VALUE
+    if isinstance(node, ast.Compare):
+        values = [_eval(node.left, env, hull)] + [_eval(comparator, env, hull) for comparator in node.comparators]
+        return _and([_compare(op, values[i], values[i + 1]) for i, op in enumerate(node.ops)])
+    if isinstance(node, ast.Call):
+        func = _eval(node.func, env, hull)
+        args = [_eval(arg, env, hull) for arg in node.args]
+        owner = getattr(func, '__self__', None)
+        if isinstance(owner, LaneMap) and func.__name__ in _LANE_MAP_SETS and not node.keywords:
+            try:
+                return _lane_map_call(owner, func.__name__, args, hull)
+            except Exception:
+                return UNKNOWN_VALUE
+        if node.keywords or isinstance(func, _Unknown) or _is_bounded(args):
+            return UNKNOWN_VALUE
+        # Calls on discrete values only, e.g. lane_map.has_left(ego.lane_mode)
+        try:
+            return func(*args)
+        except Exception:
+            return UNKNOWN_VALUE
+    if isinstance(node, Reduction):
+        elements = _eval(node.value, env, hull)
+        if not isinstance(elements, list):
+            return UNKNOWN
+        values = [_to_truth(_eval(node.expr, {**env, node.it: element}, hull)) for element in elements]
+        return _or(values) if node.op == ReductionType.Any else _and(values)
+    return UNKNOWN_VALUE
+
+def eval_interval_guard(expr: ast.expr, env: Dict[str, Any], length: int, hull: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Evaluate a verification guard over all the boxes of a tube
+
+    Args:
+        expr (ast.expr): the guard, as in ModePath.cond_veri or Assert.cond/pre
+        env (Dict[str, Any]): the packed states of the agents with Interval continuous variables
+        length (int): number of boxes in the tube
+        hull (bool): whether the boxes are hulls of several boxes of the tube. The result then
+            also holds for each of the boxes in the hull
+
+    Returns:
+        Two boolean arrays, whether the guard definitely holds on the whole box
+        and whether it definitely holds nowhere in the box
+    """
+    truth = _to_truth(_eval(expr, env, hull))
+    return np.broadcast_to(truth.true, (length,)), np.broadcast_to(truth.false, (length,))
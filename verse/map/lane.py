@@ -1,4 +1,5 @@
-from typing import List
+from typing import List, Tuple
+from collections import defaultdict
 
 import numpy as np
 
@@ -6,11 +7,14 @@ from verse.map.lane_segment import AbstractLane
 
 class Lane():
     COMPENSATE = 3
+    # Lanes with fewer segments are searched linearly, building the grid isn't worth it
+    INDEX_MIN_SEGMENTS = 16
     def __init__(self, id, seg_list: List[AbstractLane]):
         self.id = id
         self.segment_list: List[AbstractLane] = seg_list
         self._set_longitudinal_start()
         self.lane_width = seg_list[0].width
+        self._build_index()
 
     def _set_longitudinal_start(self):
         longitudinal_start = 0
@@ -18,37 +22,150 @@ class Lane():
             lane_seg.longitudinal_start = longitudinal_start
             longitudinal_start += lane_seg.length
 
-    def get_lane_segment(self, position:np.ndarray) -> AbstractLane:
+    def _build_index(self):
+        """Build a uniform grid over the bounding boxes of the segments, inflated so that the positions
+        close to a segment are in the cells of the segment"""
+        self._grid = None
+        self._last_query = None
+        if len(self.segment_list) < Lane.INDEX_MIN_SEGMENTS:
+            return
+        try:
+            boxes = np.array([segment.bounding_box() for segment in self.segment_list], dtype=float)
+        except NotImplementedError:
+            return
+        margin = self.lane_width + Lane.COMPENSATE
+        boxes[:, 0] -= margin
+        boxes[:, 1] += margin
+        origin = boxes[:, 0].min(axis=0)
+        cell_size = float(np.median(np.max(boxes[:, 1] - boxes[:, 0], axis=1)))
+        grid = defaultdict(list)
+        # The cells of each segment form a rectangle, given by its lower and upper cell
+        cell_ranges = np.floor((boxes - origin) / cell_size).astype(int)
+        for seg_idx, (lower_cell, upper_cell) in enumerate(cell_ranges):
+            for i in range(lower_cell[0], upper_cell[0] + 1):
+                for j in range(lower_cell[1], upper_cell[1] + 1):
+                    grid[(i, j)].append(seg_idx)
+        self._grid = (origin, cell_size, dict(grid), cell_ranges)
+
+    def __getstate__(self):
+        # The last query is a cache, not part of the lane
+        state = self.__dict__.copy()
+        state['_last_query'] = None
+        return state
+
+    def _search_segments(self, position: np.ndarray, seg_indices) -> Tuple[int, AbstractLane, float, float]:
         min_lateral = float('inf')
-        idx = -1
-        seg = None
-        for seg_idx, segment in enumerate(self.segment_list):
+        res = (-1, None, None, None)
+        for seg_idx in seg_indices:
+            segment = self.segment_list[seg_idx]
             logitudinal, lateral = segment.local_coordinates(position)
             is_on = 0-Lane.COMPENSATE <= logitudinal < segment.length
             if is_on:
                 if lateral < min_lateral:
-                    idx = seg_idx 
-                    seg = segment
+                    res = (seg_idx, segment, logitudinal, lateral)
                     min_lateral = lateral
-        return idx, seg
+        return res
+
+    def locate(self, position: np.ndarray) -> Tuple[int, AbstractLane, float, float]:
+        """
+        Find the segment of the lane at position and the local coordinates of position in it
+
+        The controllers usually query the same position several times in a row (e.g. the lateral
+        distance and the heading), so the result of the last query is kept and reused
+
+        Returns:
+            The index of the segment, the segment, and the longitudinal and lateral coordinates
+        """
+        key = tuple(np.asarray(position, dtype=float).ravel().tolist())
+        if self._last_query is not None and self._last_query[0] == key:
+            return self._last_query[1]
+        res = (-1, None, None, None)
+        if self._grid is not None:
+            origin, cell_size, grid, _ = self._grid
+            cell = np.floor((np.asarray(position[:2], dtype=float) - origin) / cell_size).astype(int)
+            res = self._search_segments(position, grid.get((int(cell[0]), int(cell[1])), ()))
+        if res[1] is None:
+            # Positions far from every segment are matched against all of them, as without the grid
+            res = self._search_segments(position, range(len(self.segment_list)))
+        self._last_query = (key, res)
+        return res
+
+    def _search_segments_batch(self, positions: np.ndarray, rows: np.ndarray, cells: np.ndarray, res):
+        """Same as _search_segments for the positions in rows, with all the positions matched against one segment at a time.
+        If cells is given, positions are only matched against the segments in their cell of the grid"""
+        seg_indices, longitudinal, lateral = res
+        min_lateral = np.full(len(rows), np.inf)
+        for seg_idx, segment in enumerate(self.segment_list):
+            if cells is None:
+                candidates = np.arange(len(rows))
+            else:
+                (lower0, lower1), (upper0, upper1) = self._grid[3][seg_idx]
+                in_cells = (cells[:, 0] >= lower0) & (cells[:, 0] <= upper0) & (cells[:, 1] >= lower1) & (cells[:, 1] <= upper1)
+                candidates = np.flatnonzero(in_cells)
+                if len(candidates) == 0:
+                    continue
+            seg_longitudinal, seg_lateral = segment.local_coordinates_batch(positions[rows[candidates]])
+            better = (0-Lane.COMPENSATE <= seg_longitudinal) & (seg_longitudinal < segment.length) & (seg_lateral < min_lateral[candidates])
+            candidates = candidates[better]
+            min_lateral[candidates] = seg_lateral[better]
+            seg_indices[rows[candidates]] = seg_idx
+            longitudinal[rows[candidates]] = seg_longitudinal[better]
+            lateral[rows[candidates]] = seg_lateral[better]
+
+    def local_coordinates_batch(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Vectorized version of locate, for an array of positions (e.g. all the positions of a trace)
+
+        Returns:
+            The arrays of segment indices, and longitudinal and lateral coordinates in the segments.
+            Positions that aren't on any segment have index -1 and nan coordinates
+        """
+        positions = np.asarray(positions, dtype=float)
+        positions = positions.reshape(len(positions), -1)
+        res = (np.full(len(positions), -1), np.full(len(positions), np.nan), np.full(len(positions), np.nan))
+        rows = np.arange(len(positions))
+        if self._grid is not None:
+            origin, cell_size, _, _ = self._grid
+            cells = np.floor((positions[:, :2] - origin) / cell_size).astype(int)
+            self._search_segments_batch(positions, rows, cells, res)
+            rows = np.flatnonzero(res[0] == -1)
+        if len(rows) > 0:
+            self._search_segments_batch(positions, rows, None, res)
+        return res
+
+    def get_heading_batch(self, positions: np.ndarray) -> np.ndarray:
+        seg_indices, longitudinal, lateral = self.local_coordinates_batch(positions)
+        heading = np.full(len(seg_indices), np.nan)
+        for seg_idx in np.unique(seg_indices[seg_indices >= 0]):
+            on_segment = seg_indices == seg_idx
+            heading[on_segment] = self.segment_list[seg_idx].heading_at_batch(longitudinal[on_segment])
+        return heading
+
+    def get_longitudinal_position_batch(self, positions: np.ndarray) -> np.ndarray:
+        seg_indices, longitudinal, lateral = self.local_coordinates_batch(positions)
+        longitudinal_start = np.array([segment.longitudinal_start for segment in self.segment_list] + [np.nan], dtype=float)
+        return longitudinal + longitudinal_start[seg_indices]
+
+    def get_lateral_distance_batch(self, positions: np.ndarray) -> np.ndarray:
+        seg_indices, longitudinal, lateral = self.local_coordinates_batch(positions)
+        return lateral
+
+    def get_lane_segment(self, position:np.ndarray) -> AbstractLane:
+        seg_idx, segment, longitudinal, lateral = self.locate(position)
+        return seg_idx, segment
 
     def get_heading(self, position:np.ndarray) -> float:
-        seg_idx, segment = self.get_lane_segment(position)
-        longitudinal, lateral = segment.local_coordinates(position)
+        seg_idx, segment, longitudinal, lateral = self.locate(position)
         heading = segment.heading_at(longitudinal)
         return heading
 
     def get_longitudinal_position(self, position:np.ndarray) -> float:
-        seg_idx, segment = self.get_lane_segment(position)
-        longitudinal, lateral = segment.local_coordinates(position)
-        for i in range(seg_idx):    
-            longitudinal += self.segment_list[i].length
-        return longitudinal
+        seg_idx, segment, longitudinal, lateral = self.locate(position)
+        return longitudinal + segment.longitudinal_start
 
     def get_lateral_distance(self, position:np.ndarray) -> float:
-        seg_idx, segment = self.get_lane_segment(position)
-        longitudinal, lateral = segment.local_coordinates(position)
+        seg_idx, segment, longitudinal, lateral = self.locate(position)
         return lateral
 
     def get_lane_width(self) -> float:
-        return self.lane_width
\ No newline at end of file
+        return self.lane_width
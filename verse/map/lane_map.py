@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import copy
 from enum import Enum
 
@@ -78,6 +78,22 @@ class LaneMap:
         lane = self.lane_dict[lane_idx]
         return lane.get_lateral_distance(position)
 
+    def local_coordinates_batch(self, lane_idx:str, positions:np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lane = self.lane_dict[lane_idx]
+        return lane.local_coordinates_batch(positions)
+
+    def get_longitudinal_position_batch(self, lane_idx:str, positions:np.ndarray) -> np.ndarray:
+        lane = self.lane_dict[lane_idx]
+        return lane.get_longitudinal_position_batch(positions)
+
+    def get_lateral_distance_batch(self, lane_idx:str, positions:np.ndarray) -> np.ndarray:
+        lane = self.lane_dict[lane_idx]
+        return lane.get_lateral_distance_batch(positions)
+
+    def get_lane_heading_batch(self, lane_idx:str, positions:np.ndarray) -> np.ndarray:
+        lane = self.lane_dict[lane_idx]
+        return lane.get_heading_batch(positions)
+
     def get_altitude(self, lane_idx, position:np.ndarray) -> float:
         raise NotImplementedError
 
@@ -69,6 +69,34 @@ class AbstractLane(object):
         """
         raise NotImplementedError()
 
+    def local_coordinates_batch(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Convert an array of world positions to local lane coordinates.
+
+        :param positions: the world positions, one per row [m]
+        :return: the arrays of (longitudinal, lateral) lane coordinates [m]
+        """
+        coordinates = np.array([self.local_coordinates(position) for position in np.asarray(positions)], dtype=float).reshape(-1, 2)
+        return coordinates[:, 0], coordinates[:, 1]
+
+    def heading_at_batch(self, longitudinal: np.ndarray) -> np.ndarray:
+        """
+        Get the lane heading at an array of longitudinal lane coordinates.
+
+        :param longitudinal: the longitudinal lane coordinates [m]
+        :return: the lane headings [rad]
+        """
+        return np.array([self.heading_at(s) for s in np.asarray(longitudinal)], dtype=float)
+
+    @abstractmethod
+    def bounding_box(self) -> np.ndarray:
+        """
+        Get a box containing the central curve of the lane.
+
+        :return: the lower and upper corners of the box, as a 2x2 array [m]
+        """
+        raise NotImplementedError()
+
     @classmethod
     def from_config(cls, config: dict):
         """
@@ -183,12 +211,22 @@ class StraightLane(AbstractLane):
     def width_at(self, longitudinal: float) -> float:
         return self.width
 
+    def bounding_box(self) -> np.ndarray:
+        return np.array([np.minimum(self.start, self.end)[:2], np.maximum(self.start, self.end)[:2]])
+
     def local_coordinates(self, position: np.ndarray) -> Tuple[float, float]:
         delta = position - self.start
         longitudinal = np.dot(delta, self.direction)
         lateral = np.dot(delta, self.direction_lateral)
         return float(longitudinal), float(lateral)
 
+    def local_coordinates_batch(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        delta = np.asarray(positions, dtype=float) - self.start
+        return delta @ self.direction, delta @ self.direction_lateral
+
+    def heading_at_batch(self, longitudinal: np.ndarray) -> np.ndarray:
+        return np.full(np.shape(longitudinal), self.heading, dtype=float)
+
     @classmethod
     def from_config(cls, config: dict):
         config["start"] = np.array(config["start"])
@@ -254,6 +292,10 @@ class CircularLane(AbstractLane):
     def width_at(self, longitudinal: float) -> float:
         return self.width
 
+    def bounding_box(self) -> np.ndarray:
+        # The box of the whole circle, which contains the arc
+        return np.array([self.center[:2] - self.radius, self.center[:2] + self.radius])
+
     def local_coordinates(self, position: np.ndarray) -> Tuple[float, float]:
         delta = position - self.center
         phi = np.arctan2(delta[1], delta[0])
@@ -263,6 +305,18 @@ class CircularLane(AbstractLane):
         lateral = self.direction*(self.radius - r)
         return longitudinal, lateral
 
+    def local_coordinates_batch(self, positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        delta = np.asarray(positions, dtype=float) - self.center
+        phi = np.arctan2(delta[:, 1], delta[:, 0])
+        phi = self.start_phase + wrap_to_pi(phi - self.start_phase)
+        r = np.linalg.norm(delta, axis=1)
+        longitudinal = self.direction*(phi - self.start_phase)*self.radius
+        lateral = self.direction*(self.radius - r)
+        return longitudinal, lateral
+
+    def heading_at_batch(self, longitudinal: np.ndarray) -> np.ndarray:
+        return self.heading_at(np.asarray(longitudinal, dtype=float))
+
     @classmethod
     def from_config(cls, config: dict):
         config["center"] = np.array(config["center"])
@@ -4,6 +4,7 @@ from dataclasses import dataclass, field, fields
 from enum import Enum, auto
 from verse.parser import astunparser
 from verse.analysis.utils import find
+from verse.parser.vectorize import compile_vectorized
 
 def merge_conds(c):
     if len(c) == 0:
@@ -13,6 +14,25 @@ def merge_conds(c):
     else:
         return ast.BoolOp(ast.And(), c)
 
+def ego_mode_conds(conds, disc_vars: List[str]) -> Dict[str, str]:
+    """The values the discrete variables disc_vars of the ego are tested equal to in the conjunction of conds"""
+    res = {}
+    for c in conds:
+        if isinstance(c, ast.BoolOp) and isinstance(c.op, ast.And):
+            res.update(ego_mode_conds(c.values, disc_vars))
+            continue
+        if not isinstance(c, ast.Compare) or len(c.ops) != 1 or not isinstance(c.ops[0], ast.Eq):
+            continue
+        for var, val in ((c.left, c.comparators[0]), (c.comparators[0], c.left)):
+            if isinstance(val, ast.Constant):
+                val = val.value
+            if not isinstance(var, ast.Attribute) or not isinstance(val, str) or var.attr not in disc_vars:
+                continue
+            ego = var.value
+            if (isinstance(ego, ast.arg) and ego.arg == 'ego') or (isinstance(ego, ast.Name) and ego.id == 'ego'):
+                res[var.attr] = val
+    return res
+
 def compile_expr(e):
     return compile(ast.fix_missing_locations(ast.Expression(e)), "", "eval")
 
@@ -136,6 +156,8 @@ class CompiledAssert:
     cond: Any   # FIXME type for compiled python (`code`?)
     label: str
     pre: Any
+    cond_vec: Any = None    # vectorized versions, None if they can't be vectorized
+    pre_vec: Any = None
 
 @dataclass
 class Assert:
@@ -238,6 +260,8 @@ class ModePath:
     var: str
     val: Any
     val_veri: ast.expr
+    cond_vec: Any = None    # vectorized version of `cond`, None if it can't be vectorized
+    mode_conds: Dict[str, str] = field(default_factory=dict)    # values of the ego's discrete variables `cond` requires
 
 @dataclass
 class ControllerIR:
@@ -247,6 +271,23 @@ class ControllerIR:
     asserts_veri: List[Assert]
     state_defs: Dict[str, StateDef]
     mode_defs: Dict[str, ModeDef]
+    # Indices of the paths that can be taken in each mode of the ego, filled on demand
+    mode_index: Dict[Tuple[str, ...], List[int]] = field(default_factory=dict, repr=False, compare=False)
+
+    def mode_paths(self, mode) -> List[int]:
+        """The indices of the paths whose conditions don't rule out the ego being in mode, the values of its
+        discrete variables"""
+        key = tuple(mode)
+        if key not in self.mode_index:
+            ego = find(self.args, lambda a: a.name == 'ego')
+            values = {}
+            if ego is not None and ego.typ in self.state_defs:
+                values = dict(zip(self.state_defs[ego.typ].disc, key))
+            self.mode_index[key] = [
+                i for i, path in enumerate(self.paths)
+                if all(values.get(var, val) == val for var, val in path.mode_conds.items())
+            ]
+        return self.mode_index[key]
 
     @staticmethod
     def parse(code: Optional[str] = None, fn: Optional[str] = None) -> "ControllerIR":
@@ -300,9 +341,14 @@ class ControllerIR:
         asserts_veri = [Assert(Env.trans_args(copy.deepcopy(c), True), l, Env.trans_args(copy.deepcopy(p), True)) for c, l, p in asserts]
         for a in asserts_veri:
             print(ControllerIR.dump(a.pre), ControllerIR.dump(a.cond, True))
-        asserts_sim = [CompiledAssert(compile_expr(Env.trans_args(c, False)), l, compile_expr(Env.trans_args(p, False))) for c, l, p in asserts]
+        asserts_sim = []
+        for c, l, p in asserts:
+            c, p = Env.trans_args(c, False), Env.trans_args(p, False)
+            asserts_sim.append(CompiledAssert(compile_expr(c), l, compile_expr(p), compile_vectorized(c), compile_vectorized(p)))
 
         assert isinstance(controller, Lambda)
+        ego = find(controller.args, lambda a: a.name == 'ego')
+        ego_disc = env.state_defs[ego.typ].disc if ego is not None and ego.typ in env.state_defs else []
         paths = []
         if not isinstance(controller.body, dict):
             raise NotImplementedError("non-object return")
@@ -311,12 +357,15 @@ class ControllerIR:
                 continue
             for case in val.elems:
                 if len(case.cond) > 0:
+                    mode_conds = ego_mode_conds(case.cond, ego_disc)
                     cond = merge_conds(case.cond)
                     cond_veri = Env.trans_args(copy.deepcopy(cond), True)
                     val_veri = Env.trans_args(copy.deepcopy(case.val), True)
-                    cond = compile_expr(Env.trans_args(cond, False))
+                    cond = Env.trans_args(cond, False)
+                    cond_vec = compile_vectorized(cond)
+                    cond = compile_expr(cond)
                     val = compile_expr(Env.trans_args(case.val, False))
-                    paths.append(ModePath(cond, cond_veri, var, val, val_veri))
+                    paths.append(ModePath(cond, cond_veri, var, val, val_veri, cond_vec, mode_conds))
 
         return ControllerIR(controller.args, paths, asserts_sim, asserts_veri, env.state_defs, env.mode_defs)
 
@@ -0,0 +1,126 @@
+"""Vectorized versions of the simulation guards and asserts.
+
+A vectorized expression is evaluated once with every continuous variable bound to the
+array of its values along a trace, instead of once per time step. Boolean operators,
+conditional expressions and chained comparisons are rewritten into their elementwise
+numpy equivalents, `any`/`all` reductions are applied across the elementwise results,
+and other calls (e.g. map functions) are applied point by point.
+"""
+
+import ast, copy, functools, itertools
+from typing import Any, List, Optional
+
+import numpy as np
+
+class NotVectorizable(Exception):
+    """Raised when an expression can't be evaluated elementwise over a trace"""
+    pass
+
+# Errors of evaluating expressions over arrays (or intervals) of values that work on a single value, e.g. a
+# function branching on its argument, or of calls that short circuiting would have skipped, as both sides of the
+# boolean operators are evaluated, e.g. lane_map.right_lane(ego.lane_mode) for the rightmost lane.
+# The callers then fall back to evaluating them step by step
+VECTORIZED_ERRORS = (NotVectorizable, ArithmeticError, AttributeError, LookupError, TypeError, ValueError)
+
+def _and(*values):
+    return functools.reduce(np.logical_and, values)
+
+def _or(*values):
+    return functools.reduce(np.logical_or, values)
+
+def _not(value):
+    return np.logical_not(value)
+
+def _where(test, body, orelse):
+    return np.where(test, body, orelse)
+
+def _any(values: List):
+    return functools.reduce(np.logical_or, values, False)
+
+def _all(values: List):
+    return functools.reduce(np.logical_and, values, True)
+
+def _varying(value) -> bool:
+    return isinstance(value, np.ndarray) and value.ndim > 0
+
+def _points(value):
+    """Iterate over the values of an argument at each time step, None if it's the same at every step"""
+    if _varying(value):
+        return value.tolist()
+    if isinstance(value, (list, tuple)) and any(_varying(v) for v in value):
+        return map(type(value), zip(*[v.tolist() if _varying(v) else itertools.repeat(v) for v in value]))
+    return None
+
+def _call(func, *args):
+    points = [_points(arg) for arg in args]
+    if all(p is None for p in points):
+        return func(*args)
+    points = [itertools.repeat(arg) if p is None else p for arg, p in zip(args, points)]
+    res = [func(*point_args) for point_args in zip(*points)]
+    if not all(np.ndim(r) == 0 for r in res):
+        raise NotVectorizable(f"{func} returns non scalar values")
+    return np.array(res)
+
+VECTORIZED_BUILTINS = {
+    '__verse_and': _and,
+    '__verse_or': _or,
+    '__verse_not': _not,
+    '__verse_where': _where,
+    '__verse_any': _any,
+    '__verse_all': _all,
+    '__verse_call': _call,
+}
+
+def _helper(name: str, args: List[ast.expr]) -> ast.Call:
+    return ast.Call(ast.Name(name, ctx=ast.Load()), args, [])
+
+class VectorizeTransformer(ast.NodeTransformer):
+    def visit_BoolOp(self, node: ast.BoolOp):
+        self.generic_visit(node)
+        return _helper('__verse_and' if isinstance(node.op, ast.And) else '__verse_or', node.values)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return _helper('__verse_not', [node.operand])
+        return node
+
+    def visit_IfExp(self, node: ast.IfExp):
+        self.generic_visit(node)
+        return _helper('__verse_where', [node.test, node.body, node.orelse])
+
+    def visit_Compare(self, node: ast.Compare):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # `a < b < c` is `a < b and b < c`
+        comparisons = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            comparisons.append(ast.Compare(left, [op], [right]))
+            left = right
+        return _helper('__verse_and', comparisons)
+
+    def visit_Call(self, node: ast.Call):
+        if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+            raise NotVectorizable("calls with keyword or starred arguments")
+        if isinstance(node.func, ast.Name) and node.func.id in ('any', 'all') and len(node.args) == 1:
+            arg = self.visit(node.args[0])
+            if isinstance(arg, ast.GeneratorExp):
+                arg = ast.ListComp(arg.elt, arg.generators)
+            return _helper(f'__verse_{node.func.id}', [arg])
+        self.generic_visit(node)
+        return _helper('__verse_call', [node.func] + node.args)
+
+def compile_vectorized(expr: ast.expr) -> Optional[Any]:
+    """Compile the vectorized version of a simulation expression, None if it can't be vectorized"""
+    try:
+        vectorized = VectorizeTransformer().visit(copy.deepcopy(expr))
+        return compile(ast.fix_missing_locations(ast.Expression(vectorized)), "", "eval")
+    except NotVectorizable:
+        return None
+
+def eval_vectorized(code, env, length: int) -> np.ndarray:
+    """Evaluate vectorized code in env, returns a boolean array with one value per time step"""
+    res = eval(code, {**VECTORIZED_BUILTINS, **env})
+    return np.broadcast_to(np.asarray(res, dtype=bool), (length,))
@@ -70,7 +70,7 @@ def reachtube_anime(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=g
     x_min, x_max = float('inf'), -float('inf')
     y_min, y_max = float('inf'), -float('inf')
     # input check
-    num_dim = np.array(root.trace[list(root.agent.keys())[0]]).shape[1]
+    num_dim = np.asarray(root.trace[list(root.agent.keys())[0]]).shape[1]
     check_dim(num_dim, x_dim, y_dim, print_dim_list)
     if print_dim_list is None:
         print_dim_list = range(0, num_dim)
@@ -80,7 +80,7 @@ def reachtube_anime(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=g
         node = queue.pop()
         traces = node.trace
         for agent_id in traces:
-            trace = np.array(traces[agent_id])
+            trace = np.asarray(traces[agent_id])
             if trace[0][0] > 0:
                 trace = trace[8:]
             for i in range(0, len(trace)-1, 2):
@@ -154,7 +154,7 @@ def reachtube_anime(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=g
         node = queue.pop(0)
         traces = node.trace
         for agent_id in traces:
-            trace = np.array(traces[agent_id])
+            trace = np.asarray(traces[agent_id])
             if scale_type == 'trace':
                 x_min = min(x_min, min(trace[:, x_dim]))
                 x_max = max(x_max, max(trace[:, x_dim]))
@@ -206,7 +206,7 @@ def reachtube_tree(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=go
     fig = draw_map(map=map, fig=fig, fill_type=map_type)
     agent_list = list(root.agent.keys())
     # input check
-    num_dim = np.array(root.trace[agent_list[0]]).shape[1]
+    num_dim = np.asarray(root.trace[agent_list[0]]).shape[1]
     check_dim(num_dim, x_dim, y_dim, print_dim_list)
     if print_dim_list is None:
         print_dim_list = range(0, num_dim)
@@ -233,7 +233,7 @@ def reachtube_tree(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=go
         # print({k: len(v) for k, v in traces.items()})
         i = 0
         for agent_id in traces:
-            trace = np.array(traces[agent_id])
+            trace = np.asarray(traces[agent_id])
             if scale_type == 'trace':
                 x_min = min(x_min, min(trace[:, x_dim]))
                 x_max = max(x_max, max(trace[:, x_dim]))
@@ -282,7 +282,7 @@ def simulation_tree(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=g
     fig = draw_map(map=map, fig=fig, fill_type=map_type)
     agent_list = list(root.agent.keys())
     # input check
-    num_dim = np.array(root.trace[agent_list[0]]).shape[1]
+    num_dim = np.asarray(root.trace[agent_list[0]]).shape[1]
     check_dim(num_dim, x_dim, y_dim, print_dim_list)
     if print_dim_list is None:
         print_dim_list = range(0, num_dim)
@@ -307,7 +307,7 @@ def simulation_tree(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=g
         traces = node.trace
         i = 0
         for agent_id in traces:
-            trace = np.array(traces[agent_id])
+            trace = np.asarray(traces[agent_id])
             if scale_type == 'trace':
                 x_min = min(x_min, min(trace[:, x_dim]))
                 x_max = max(x_max, max(trace[:, x_dim]))
@@ -398,7 +398,7 @@ def simulation_anime(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=
     x_min, x_max = float('inf'), -float('inf')
     y_min, y_max = float('inf'), -float('inf')
     # input check
-    num_dim = np.array(root.trace[list(root.agent.keys())[0]]).shape[1]
+    num_dim = np.asarray(root.trace[list(root.agent.keys())[0]]).shape[1]
     check_dim(num_dim, x_dim, y_dim, print_dim_list)
     if print_dim_list is None:
         print_dim_list = range(0, num_dim)
@@ -408,7 +408,7 @@ def simulation_anime(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=
         node = queue.pop()
         traces = node.trace
         for agent_id in traces:
-            trace = np.array(traces[agent_id])
+            trace = np.asarray(traces[agent_id])
             for i in range(len(trace)):
                 x_min = min(x_min, trace[i][x_dim])
                 x_max = max(x_max, trace[i][x_dim])
@@ -614,7 +614,7 @@ def simulation_anime(root: Union[AnalysisTree, AnalysisTreeNode], map=None, fig=
         traces = node.trace
         i = 0
         for agent_id in traces:
-            trace = np.array(traces[agent_id])
+            trace = np.asarray(traces[agent_id])
             trace_y = trace[:, y_dim].tolist()
             trace_x = trace[:, x_dim].tolist()
             i = agent_list.index(agent_id)
@@ -679,7 +679,7 @@ def reachtube_tree_single(root: Union[AnalysisTree, AnalysisTreeNode], agent_id,
     while queue != []:
         node = queue.pop(0)
         traces = node.trace
-        trace = np.array(traces[agent_id])
+        trace = np.asarray(traces[agent_id])
         max_id = len(trace)-1
         if len(np.unique(np.array([trace[i][x_dim] for i in range(0, max_id)]))) == 1 and len(np.unique(np.array([trace[i][y_dim] for i in range(0, max_id)]))) == 1:
             fig.add_trace(go.Scatter(x=[trace[0][x_dim]], y=[trace[0][y_dim]], mode='markers+lines',
@@ -848,7 +848,7 @@ def simulation_tree_single(root: Union[AnalysisTree, AnalysisTreeNode], agent_id
         traces = node.trace
         if agent_id not in traces.keys():
             return fig
-        trace = np.array(traces[agent_id])
+        trace = np.asarray(traces[agent_id])
         start = list(trace[0])
         end = list(trace[-1])
         if (start in start_list) and (end in end_list):
@@ -1115,20 +1115,17 @@ def sample_trace(root, sample_rate: int = 1):
         while queue != []:
             node = queue.pop()
             for agent_id in node.agent:
-                trace_length = len(node.trace[agent_id])
-                tmp = []
-                for i in range(0, trace_length, sample_rate):
-                    if i+sample_rate-1 < trace_length:
-                        tmp.append(node.trace[agent_id][i])
-                        tmp.append(node.trace[agent_id][i+sample_rate-1])
-                node.trace[agent_id] = tmp
+                trace = np.asarray(node.trace[agent_id])
+                # keep the first and last row of every group of sample_rate rows
+                lower_idx = np.arange(0, len(trace)-sample_rate+1, sample_rate)
+                node.trace[agent_id] = np.stack(
+                    (trace[lower_idx], trace[lower_idx+sample_rate-1]), axis=1).reshape(-1, trace.shape[1])
             queue += node.child
     else:
         while queue != []:
             node = queue.pop()
             for agent_id in node.agent:
-                node.trace[agent_id] = [node.trace[agent_id][i]
-                                        for i in range(0, len(node.trace[agent_id]), sample_rate)]
+                node.trace[agent_id] = np.asarray(node.trace[agent_id])[::sample_rate]
             queue += node.child
     return root
 
@@ -125,7 +125,7 @@ def plot_simulation_tree(root, agent_id, x_dim: int=0, y_dim_list: List[int]=[1]
     while queue != []:
         node = queue.pop(0)
         traces = node.trace
-        trace = np.array(traces[agent_id])
+        trace = np.asarray(traces[agent_id])
         for y_dim in y_dim_list:
             ax.plot(trace[:,x_dim], trace[:,y_dim], color)
             x_min = min(x_min, trace[:,x_dim].min())
@@ -1,6 +1,7 @@
 from lib2to3.pytree import Base
 from typing import DefaultDict, Optional, Tuple, List, Dict, Any
 import copy
+import functools
 import itertools
 import warnings
 from collections import defaultdict, namedtuple
@@ -10,8 +11,11 @@ import numpy as np
 
 from verse.agents.base_agent import BaseAgent
 from verse.automaton import GuardExpressionAst, ResetExpression
-from verse.analysis import Simulator, Verifier, AnalysisTreeNode, AnalysisTree
+from verse.automaton.interval_guard import Interval, eval_interval_guard
+from verse.analysis import Simulator, Verifier, MonteCarloSimulator, MonteCarloResult, AnalysisTreeNode, AnalysisTree
+from verse.analysis.tube_index import TubeIndex
 from verse.analysis.utils import find, sample_rect
+from verse.parser.vectorize import eval_vectorized, NotVectorizable, VECTORIZED_ERRORS
 from verse.sensor.base_sensor import BaseSensor
 from verse.map.lane_map import LaneMap
 
@@ -23,6 +27,7 @@ class Scenario:
         self.agent_dict: Dict[str, BaseAgent] = {}
         self.simulator = Simulator()
         self.verifier = Verifier()
+        self.monte_carlo_simulator = MonteCarloSimulator()
         self.init_dict = {}
         self.init_mode_dict = {}
         self.static_dict = {}
@@ -136,14 +141,35 @@ class Scenario:
                 agent_id)
         return
 
-    def simulate_multi(self, time_horizon, num_sim):
+    def simulate_multi(self, time_horizon, num_sim, time_step, params={}) -> List[AnalysisTree]:
+        """Simulate num_sim points sampled in the initial sets one after another, and return their trees"""
         res_list = []
         for i in range(num_sim):
-            trace = self.simulate(time_horizon)
+            trace = self.simulate(time_horizon, time_step, params)
             res_list.append(trace)
         return res_list
 
-    def simulate(self, time_horizon, time_step) -> AnalysisTree:
+    def simulate_monte_carlo(self, time_horizon, time_step, num_sim, seed=None, keep_traces=True) -> MonteCarloResult:
+        """Simulate num_sim points sampled in the initial sets together, see MonteCarloSimulator"""
+        self.check_init()
+        init_list = []
+        init_mode_list = []
+        static_list = []
+        agent_list = []
+        uncertain_param_list = []
+        for agent_id in self.agent_dict:
+            init = self.init_dict[agent_id]
+            if np.array(init).ndim < 2:
+                init = [init, init]
+            init_list.append(init)
+            init_mode_list.append(self.init_mode_dict[agent_id])
+            static_list.append(self.static_dict[agent_id])
+            uncertain_param_list.append(self.uncertain_param_dict[agent_id])
+            agent_list.append(self.agent_dict[agent_id])
+        return self.monte_carlo_simulator.simulate(init_list, init_mode_list, static_list, uncertain_param_list, agent_list,
+                                                   self, time_horizon, time_step, self.map, num_sim, seed, keep_traces)
+
+    def simulate(self, time_horizon, time_step, params={}) -> AnalysisTree:
         self.check_init()
         init_list = []
         init_mode_list = []
@@ -157,7 +183,7 @@ class Scenario:
             uncertain_param_list.append(self.uncertain_param_dict[agent_id])
             agent_list.append(self.agent_dict[agent_id])
         print(init_list)
-        return self.simulator.simulate(init_list, init_mode_list, static_list, uncertain_param_list, agent_list, self, time_horizon, time_step, self.map)
+        return self.simulator.simulate(init_list, init_mode_list, static_list, uncertain_param_list, agent_list, self, time_horizon, time_step, self.map, params)
 
     def verify(self, time_horizon, time_step, reachability_method='DRYVR', params={}) -> AnalysisTree:
         self.check_init()
@@ -191,7 +217,7 @@ class Scenario:
         dest = copy.deepcopy(agent_mode)
         possible_dest = [[elem] for elem in dest]
         ego_type = find(agent.controller.args, lambda a: a.name == EGO).typ
-        rect = copy.deepcopy([agent_state[0][1:], agent_state[1][1:]])
+        rect = [agent_state[0][1:].tolist(), agent_state[1][1:].tolist()]
 
         # The reset_list here are all the resets for a single transition. Need to evaluate each of them
         # and then combine them together
@@ -290,12 +316,206 @@ class Scenario:
     #         unrolled_variable, unrolled_variable_index = updater[variable]
     #         disc_var_dict[unrolled_variable] = disc_var_dict[variable][unrolled_variable_index]
 
-    def get_transition_simulate_new(self, node: AnalysisTreeNode) -> Tuple[Optional[Dict[str, List[str]]], Dict[str, List[Tuple[float]]], float]:
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _state_type(ego_ty_name: str, all_vars: Tuple[str]):
+        # Creating a namedtuple type is much slower than creating an instance, and the guards are checked at every step
+        return namedtuple(ego_ty_name, all_vars)
+
+    def _pack_env(self, agent: BaseAgent, ego_ty_name: str, cont, disc, map) -> Dict[str, Any]:
+        # The values are only read, a shallow copy is enough
+        env = dict(cont)
+        env.update(disc)
+
+        state_ty = self._state_type(ego_ty_name, tuple(agent.controller.state_defs[ego_ty_name].all_vars()))
+        packed: DefaultDict[str, Any] = defaultdict(dict)
+        for k, v in env.items():
+            k = k.split(".")
+            packed[k[0]][k[1]] = v
+        for arg in agent.controller.args:
+            if arg.name != EGO and 'map' not in arg.name:
+                other = arg.name
+                if other in packed:
+                    others_keys = list(packed[other].keys())
+                    packed[other] = [state_ty(
+                        **{k: packed[other][k][i] for k in others_keys}) for i in range(len(packed[other][others_keys[0]]))]
+                    if not arg.is_list:
+                        packed[other] = packed[other][0]
+                else:
+                    if arg.is_list:
+                        packed[other] = []
+                    else:
+                        raise ValueError(
+                            f"Expected one {ego_ty_name} for {other}, got none")
+
+        packed[EGO] = state_ty(**packed[EGO])
+        map_var = find(agent.controller.args,
+                       lambda a: "map" in a.name)
+        if map_var != None:
+            packed[map_var.name] = map
+        packed: Dict[str, Any] = dict(packed.items())
+        # packed.update(env)
+        return packed
+
+    def _vectorized_agents(self, agent_ids) -> Optional[List[BaseAgent]]:
+        """The agents, if all their guards and asserts can be evaluated vectorized, None otherwise"""
+        if self._trace_sensor() is None:
+            # The sensor can't sense whole traces as the states
+            return None
+        agents = []
+        for agent_id in agent_ids:
+            agent: BaseAgent = self.agent_dict[agent_id]
+            codes = [path.cond_vec for path in agent.controller.paths]
+            codes += [c for a in agent.controller.asserts for c in (a.pre_vec, a.cond_vec)]
+            if any(code is None for code in codes):
+                return None
+            agents.append(agent)
+        return agents
+
+    def _trace_sensor(self) -> Optional[BaseSensor]:
+        """The sensor if its sense_trace senses whole traces the same way as its sense does step by step"""
+        sensor_type = type(self.sensor)
+        if not issubclass(sensor_type, BaseSensor):
+            return None
+        if sensor_type.sense is not BaseSensor.sense and sensor_type.sense_trace is BaseSensor.sense_trace:
+            return None
+        return self.sensor
+
+    def _sense_rows(self, agent: BaseAgent, state_dict, reachtube: bool = False):
+        """Sense the states in state_dict given as arrays of rows, with sense_trace if the sensor supports it"""
+        sensor = self._trace_sensor()
+        if sensor is not None:
+            return sensor.sense_trace(self, agent, state_dict, self.map, reachtube)
+        return self.sensor.sense(self, agent, state_dict, self.map)
+
+    def _transition_candidates(self, agents: List[BaseAgent], state_dict, length: int, sensed=None) -> np.ndarray:
+        """Evaluate the vectorized guards and asserts of agents over the rows of the states in state_dict
+        (one array of length rows per agent) and return for each row whether any of them can be satisfied.
+        sensed can hold what the sensor gives each agent for state_dict, when it was already sensed"""
+        hit = np.zeros(length, dtype=bool)
+        for agent in agents:
+            if sensed is not None:
+                cont, disc, _ = sensed[agent.id]
+            else:
+                cont, disc, _ = self._sense_rows(agent, state_dict)
+            ego_ty_name = find(agent.controller.args, lambda a: a.name == EGO).typ
+            env = self._pack_env(agent, ego_ty_name, cont, disc, self.map)
+            paths = agent.controller.paths
+            for i in agent.controller.mode_paths(state_dict[agent.id][1]):
+                hit |= eval_vectorized(paths[i].cond_vec, env, length)
+            for a in agent.controller.asserts:
+                hit |= eval_vectorized(a.pre_vec, env, length) & ~eval_vectorized(a.cond_vec, env, length)
+        return hit
+
+    def _first_transition_candidate(self, node: AnalysisTreeNode, agent_ids, trace_length: int, start_idx: int = 0, sensed=None) -> int:
+        """Evaluate the vectorized guards and asserts over windows of the trace from start_idx and return the first
+        index where any of them can be satisfied, trace_length if none of them can be. Returns start_idx if some of
+        them can't be vectorized, so that the caller checks every step. sensed can hold what sense_trace gives each
+        agent for the traces from start_idx"""
+        agents = self._vectorized_agents(agent_ids)
+        if agents is None:
+            return start_idx
+
+        # Windows grow geometrically, so a transition early in the trace doesn't pay for evaluating the whole trace
+        start, window = start_idx, 32
+        try:
+            while start < trace_length:
+                stop = min(start + window, trace_length)
+                state_dict = {}
+                for agent_id in node.agent:
+                    state_dict[agent_id] = (np.asarray(node.trace[agent_id])[start:stop], node.mode[agent_id], node.static[agent_id])
+                window_sensed = None
+                if sensed is not None and all(agent.id in sensed for agent in agents):
+                    rows = slice(start - start_idx, stop - start_idx)
+                    window_sensed = {
+                        agent.id: (BaseSensor.sense_step(sensed[agent.id][0], rows),) + tuple(sensed[agent.id][1:])
+                        for agent in agents
+                    }
+                hit = self._transition_candidates(agents, state_dict, stop - start, window_sensed)
+                if hit.any():
+                    return start + int(np.argmax(hit))
+                start, window = stop, window * 2
+        except VECTORIZED_ERRORS:
+            return start_idx
+        return trace_length
+
+    def _decided_boxes(self, node: AnalysisTreeNode, tubes, guard_paths, length: int, hull: bool) -> np.ndarray:
+        """Evaluate the guards (the indices of the paths of each agent in guard_paths) and asserts with interval
+        arithmetic over the boxes of tubes (one tube per agent, with length boxes each) and return for each box
+        whether none of them can be satisfied in it"""
+        state_dict = {}
+        for agent_id in node.agent:
+            state_dict[agent_id] = (tubes[agent_id], node.mode[agent_id], node.static[agent_id])
+        decided = np.ones(length, dtype=bool)
+        for agent_id in self.agent_dict:
+            agent: BaseAgent = self.agent_dict[agent_id]
+            if len(agent.controller.args) == 0:
+                continue
+            cont, disc, _ = self._sense_rows(agent, state_dict, reachtube=True)
+            # The rows of the tube alternate between the lower and upper bounds
+            for k, v in cont.items():
+                if isinstance(v, list):
+                    cont[k] = [Interval(np.asarray(u)[0::2], np.asarray(u)[1::2]) for u in v]
+                else:
+                    cont[k] = Interval(np.asarray(v)[0::2], np.asarray(v)[1::2])
+            ego_ty_name = find(agent.controller.args, lambda a: a.name == EGO).typ
+            env = self._pack_env(agent, ego_ty_name, cont, disc, self.map)
+            for a in agent.controller.asserts_veri:
+                _, pre_false = eval_interval_guard(a.pre, env, length, hull)
+                cond_true, _ = eval_interval_guard(a.cond, env, length, hull)
+                decided &= pre_false | cond_true
+            for guard_idx in guard_paths.get(agent_id, []):
+                path = agent.controller.paths[guard_idx]
+                _, guard_false = eval_interval_guard(path.cond_veri, env, length, hull)
+                decided &= guard_false
+        return decided
+
+    def _skippable_verify_steps(self, node: AnalysisTreeNode, guard_paths, trace_length: int) -> np.ndarray:
+        """Return for each step of the reachtube whether none of the guards and asserts can be satisfied, so that
+        the step doesn't need to be checked with the solver. Steps where that can't be decided are False.
+        The checks start from the bounding box of the whole tube and only descend the TubeIndex of the tube
+        into the blocks of steps where they can't be decided, so far from the guards whole blocks are
+        skipped with one check"""
+        skippable = np.zeros(trace_length, dtype=bool)
+        if self._trace_sensor() is None:
+            # The sensor can't sense whole tubes as the states
+            return skippable
+        indices = {agent_id: TubeIndex(node.trace[agent_id]) for agent_id in node.agent}
+        index = indices[next(iter(indices))]
+        blocks = np.arange(index.num_blocks(index.depth))
+        try:
+            for level in range(index.depth, -1, -1):
+                tubes = {agent_id: indices[agent_id].hulls(level, blocks) for agent_id in indices}
+                decided = self._decided_boxes(node, tubes, guard_paths, len(blocks), level > 0)
+                for block in blocks[decided]:
+                    start, stop = index.block_range(level, block)
+                    skippable[start:stop] = True
+                if level == 0:
+                    break
+                undecided = blocks[~decided]
+                blocks = np.stack((2 * undecided, 2 * undecided + 1), axis=1).ravel()
+                blocks = blocks[blocks < index.num_blocks(level - 1)]
+                if len(blocks) == 0:
+                    break
+        except VECTORIZED_ERRORS:
+            skippable[:] = False
+        return skippable
+
+    def get_transition_simulate_new(self, node: AnalysisTreeNode, start_idx: int = 0) -> Tuple[Optional[Dict[str, List[str]]], Dict[str, List[Tuple[float]]], float]:
+        """Find the first step of the traces of node, from start_idx, where an assert or a guard is hit"""
         lane_map = self.map
         trace_length = len(list(node.trace.values())[0])
 
         # For each agent
         agent_guard_dict = defaultdict(list)
+        # Sense the steps to check at once when the sensor allows it
+        sensor = self._trace_sensor()
+        sensed = {}
+        sensed_from = start_idx
+        if sensor is not None:
+            trace_dict = {}
+            for tmp in node.agent:
+                trace_dict[tmp] = (node.trace[tmp][start_idx:], node.mode[tmp], node.static[tmp])
 
         for agent_id in node.agent:
             # Get guard
@@ -303,70 +523,57 @@ class Scenario:
             agent_mode = node.mode[agent_id]
             if len(agent.controller.args) == 0:
                 continue
-            state_dict = {}
-            for tmp in node.agent:
-                state_dict[tmp] = (node.trace[tmp][0],
-                                   node.mode[tmp], node.static[tmp])
-            cont_var_dict_template, discrete_variable_dict, len_dict = self.sensor.sense(
-                self, agent, state_dict, self.map)
-            paths = agent.controller.paths
-            for path in paths:
+            if sensor is not None:
+                try:
+                    sensed[agent_id] = sensor.sense_trace(self, agent, trace_dict, self.map)
+                except NotVectorizable:
+                    # Sensed at each step below
+                    pass
+            if agent_id in sensed:
+                discrete_variable_dict = sensed[agent_id][1]
+            else:
+                state_dict = {}
+                for tmp in node.agent:
+                    state_dict[tmp] = (node.trace[tmp][0],
+                                       node.mode[tmp], node.static[tmp])
+                cont_var_dict_template, discrete_variable_dict, len_dict = self.sensor.sense(
+                    self, agent, state_dict, self.map)
+            # Only the guards that can be taken in the mode of the agent
+            for i in agent.controller.mode_paths(agent_mode):
+                path = agent.controller.paths[i]
                 agent_guard_dict[agent_id].append(
                     (path.cond, discrete_variable_dict, path.var, path.val))
 
         transitions = defaultdict(list)
-        # TODO: We can probably rewrite how guard hit are detected and resets are handled for simulation
-        for idx in range(trace_length):
+        # Skip the steps where no guard or assert can be hit. The remaining steps are checked one by one
+        # so the transitions are found exactly as before
+        start_idx = self._first_transition_candidate(
+            node, agent_guard_dict.keys(), trace_length, start_idx, sensed if sensor is not None else None)
+        idx = trace_length - 1
+        for idx in range(start_idx, trace_length):
             satisfied_guard = []
             asserts = defaultdict(list)
             for agent_id in agent_guard_dict:
                 agent: BaseAgent = self.agent_dict[agent_id]
-                state_dict = {}
-                for tmp in node.agent:
-                    state_dict[tmp] = (node.trace[tmp][idx],
-                                       node.mode[tmp], node.static[tmp])
-                agent_state, agent_mode, agent_static = state_dict[agent_id]
-                agent_state = agent_state[1:]
-                continuous_variable_dict, orig_disc_vars, _ = self.sensor.sense(
-                    self, agent, state_dict, self.map)
+                agent_mode = node.mode[agent_id]
+                agent_state = node.trace[agent_id][idx][1:].tolist()
+                if agent_id in sensed:
+                    cont, disc, _ = sensed[agent_id]
+                    continuous_variable_dict = sensor.sense_step(cont, idx - sensed_from)
+                    orig_disc_vars = dict(disc)
+                else:
+                    state_dict = {}
+                    for tmp in node.agent:
+                        state_dict[tmp] = (node.trace[tmp][idx],
+                                           node.mode[tmp], node.static[tmp])
+                    continuous_variable_dict, orig_disc_vars, _ = self.sensor.sense(
+                        self, agent, state_dict, self.map)
                 # Unsafety checking
                 ego_ty_name = find(agent.controller.args,
                                    lambda a: a.name == EGO).typ
 
                 def pack_env(agent: BaseAgent, cont, disc, map):
-                    env = copy.deepcopy(cont)
-                    env.update(disc)
-
-                    state_ty = namedtuple(
-                        ego_ty_name, agent.controller.state_defs[ego_ty_name].all_vars())
-                    packed: DefaultDict[str, Any] = defaultdict(dict)
-                    for k, v in env.items():
-                        k = k.split(".")
-                        packed[k[0]][k[1]] = v
-                    for arg in agent.controller.args:
-                        if arg.name != EGO and 'map' not in arg.name:
-                            other = arg.name
-                            if other in packed:
-                                others_keys = list(packed[other].keys())
-                                packed[other] = [state_ty(
-                                    **{k: packed[other][k][i] for k in others_keys}) for i in range(len(packed[other][others_keys[0]]))]
-                                if not arg.is_list:
-                                    packed[other] = packed[other][0]
-                            else:
-                                if arg.is_list:
-                                    packed[other] = []
-                                else:
-                                    raise ValueError(
-                                        f"Expected one {ego_ty_name} for {other}, got none")
-
-                    packed[EGO] = state_ty(**packed[EGO])
-                    map_var = find(agent.controller.args,
-                                   lambda a: "map" in a.name)
-                    if map_var != None:
-                        packed[map_var.name] = map
-                    packed: Dict[str, Any] = dict(packed.items())
-                    # packed.update(env)
-                    return packed
+                    return self._pack_env(agent, ego_ty_name, cont, disc, map)
                 packed_env = pack_env(
                     agent, continuous_variable_dict, orig_disc_vars, self.map)
 
@@ -382,13 +589,11 @@ class Scenario:
                     continue
 
                 all_resets = defaultdict(list)
+                # The guards are checked with the variables sensed at this step, which the asserts are already
+                # packed with, as the sensor can perceive other agents at each step
                 for guard_comp, discrete_variable_dict, var, reset in agent_guard_dict[agent_id]:
-                    new_cont_var_dict = copy.deepcopy(continuous_variable_dict)
-                    env = pack_env(agent, new_cont_var_dict,
-                                   discrete_variable_dict, self.map)
-
                     # Collect all the hit guards for this agent at this time step
-                    if eval(guard_comp, env):
+                    if eval(guard_comp, packed_env):
                         # If the guard can be satisfied, handle resets
                         all_resets[var].append(reset)
 
@@ -433,45 +638,153 @@ class Scenario:
                 break
         return None, transitions, idx
 
-    def get_transition_verify_new(self, node: AnalysisTreeNode):
+    def get_transition_simulate_batch(self, state_dict, length: int):
+        """
+        Vectorized version of get_transition_simulate_new for a single step of length samples in the same modes.
+        state_dict holds for each agent the states of all the samples (one row each), its mode and its static.
+        Raises NotVectorizable if the guards, asserts or resets can't be evaluated over all the samples at once
+
+        Returns:
+            The boolean array of the samples that hit an assert, which are left to get_transition_simulate_new
+            to find the labels, and for each agent, a list of (samples, transitions), where transitions are the
+            transitions the agent can take in each of the samples, with an array of initial states (one row per sample)
+        """
+        agents = self._vectorized_agents([agent_id for agent_id in state_dict if len(self.agent_dict[agent_id].controller.args) > 0])
+        if agents is None:
+            raise NotVectorizable("guards or asserts can't be vectorized")
+        asserts = np.zeros(length, dtype=bool)
+        transitions = {}
+        for agent in agents:
+            paths = [agent.controller.paths[i] for i in agent.controller.mode_paths(state_dict[agent.id][1])]
+            ego_ty_name = find(agent.controller.args, lambda a: a.name == EGO).typ
+            cont, disc, _ = self._sense_rows(agent, state_dict)
+            env = self._pack_env(agent, ego_ty_name, cont, disc, self.map)
+            for a in agent.controller.asserts:
+                asserts |= eval_vectorized(a.pre_vec, env, length) & ~eval_vectorized(a.cond_vec, env, length)
+            hits = np.array([eval_vectorized(path.cond_vec, env, length) for path in paths], dtype=bool).reshape(len(paths), length)
+            patterns = defaultdict(list)
+            for i in np.flatnonzero(hits.any(axis=0)):
+                patterns[tuple(hits[:, i])].append(i)
+            agent_state, agent_mode, agent_static = state_dict[agent.id]
+            ego_type = agent.controller.state_defs[ego_ty_name]
+            transitions[agent.id] = []
+            for pattern, samples in patterns.items():
+                samples = np.array(samples)
+                sample_state_dict = {agent_id: (np.asarray(state)[samples], mode, static) for agent_id, (state, mode, static) in state_dict.items()}
+                cont, disc, _ = self.sensor.sense(self, agent, sample_state_dict, self.map)
+                packed_env = self._pack_env(agent, ego_ty_name, cont, disc, self.map)
+                all_resets = defaultdict(list)
+                for path, hit in zip(paths, pattern):
+                    if hit:
+                        if any(isinstance(node, ast.Call) for node in ast.walk(path.val_veri)):
+                            # Functions (e.g. of the map) may not work elementwise on arrays
+                            raise NotVectorizable("resets with calls")
+                        all_resets[path.var].append(path.val)
+                agent_transitions = []
+                for pos in itertools.product(*[range(len(resets)) for resets in all_resets.values()]):
+                    next_init = np.array(np.asarray(agent_state)[samples, 1:], dtype=float)
+                    possible_dest = [[elem] for elem in agent_mode]
+                    for reset_variable, reset_idx in zip(all_resets, pos):
+                        res = eval(all_resets[reset_variable][reset_idx], dict(packed_env))
+                        if "mode" in reset_variable:
+                            if isinstance(res, np.ndarray):
+                                raise NotVectorizable("mode resets depending on the states")
+                            if not isinstance(res, list):
+                                res = [res]
+                            possible_dest[ego_type.disc.index(reset_variable)] = res
+                        else:
+                            next_init[:, ego_type.cont.index(reset_variable)] = res
+                    all_dest = list(itertools.product(*possible_dest))
+                    if not all_dest:
+                        warnings.warn(
+                            f"Guard hit for mode {agent_mode} for agent {agent.id} without available next mode")
+                        all_dest.append(None)
+                    for dest in all_dest:
+                        agent_transitions.append((agent.id, agent_mode, dest, next_init))
+                transitions[agent.id].append((samples, agent_transitions))
+        return asserts, transitions
+
+    def _verify_guards(self, agent: BaseAgent, agent_mode, cont_var_dict_template, discrete_variable_dict, length_dict):
+        """The guards of agent that can be taken in agent_mode, unrolled over the others sensed in the variables given,
+        as (guard expression, continuous variable updater, discrete variables, reset). Updates cont_var_dict_template"""
+        guards = []
+        # TODO-PARSER: Get equivalent for this function
+        # Only the guards that can be taken in the mode of the agent
+        for guard_idx in agent.controller.mode_paths(agent_mode):
+            path = agent.controller.paths[guard_idx]
+            # Construct the guard expression
+            reset = (path.var, path.val_veri)
+            guard_expression = GuardExpressionAst(
+                [path.cond_veri], guard_idx)
+
+            cont_var_updater = guard_expression.parse_any_all_new(
+                cont_var_dict_template, discrete_variable_dict, length_dict)
+            self.apply_cont_var_updater(
+                cont_var_dict_template, cont_var_updater)
+            guard_can_satisfied = guard_expression.evaluate_guard_disc(
+                agent, discrete_variable_dict, cont_var_dict_template, self.map)
+            if not guard_can_satisfied:
+                continue
+            guards.append(
+                (guard_expression, cont_var_updater, copy.deepcopy(discrete_variable_dict), reset))
+        return guards
+
+    def get_transition_verify_new(self, node: AnalysisTreeNode, start_idx: int = 0):
+        """Find the steps of the reachtubes of node, from start_idx, where the asserts or the guards can be hit"""
         lane_map = self.map
+        # Sense the whole tubes at once when the sensor allows it, the guards are unrolled over the same others
+        sensor = self._trace_sensor()
+        sensed = {}
+        if sensor is not None:
+            trace_dict = {}
+            for tmp in node.agent:
+                trace_dict[tmp] = (node.trace[tmp], node.mode[tmp], node.static[tmp])
 
         agent_guard_dict = defaultdict(list)
+        step_sensed = {}
         for agent_id in node.agent:
             agent: BaseAgent = self.agent_dict[agent_id]
             if len(agent.controller.args) == 0:
                 continue
             agent_mode = node.mode[agent_id]
-            state_dict = {}
-            for tmp in node.agent:
-                state_dict[tmp] = (node.trace[tmp][0*2:0*2+2],
-                                   node.mode[tmp], node.static[tmp])
+            if sensor is not None:
+                try:
+                    sensed[agent_id] = sensor.sense_trace(self, agent, trace_dict, self.map, reachtube=True)
+                except NotVectorizable:
+                    # Sensed at each step below
+                    pass
+            if agent_id in sensed:
+                cont, discrete_variable_dict, length_dict = sensed[agent_id]
+                cont_var_dict_template = sensor.sense_step(cont, slice(0, 2))
+                discrete_variable_dict = dict(discrete_variable_dict)
+            else:
+                state_dict = {}
+                for tmp in node.agent:
+                    state_dict[tmp] = (node.trace[tmp][0*2:0*2+2],
+                                       node.mode[tmp], node.static[tmp])
 
-            cont_var_dict_template, discrete_variable_dict, length_dict = self.sensor.sense(
-                self, agent, state_dict, self.map)
-            # TODO-PARSER: Get equivalent for this function
-            paths = agent.controller.paths
-            for guard_idx, path in enumerate(paths):
-                # Construct the guard expression
-                reset = (path.var, path.val_veri)
-                guard_expression = GuardExpressionAst(
-                    [path.cond_veri], guard_idx)
-
-                cont_var_updater = guard_expression.parse_any_all_new(
-                    cont_var_dict_template, discrete_variable_dict, length_dict)
-                self.apply_cont_var_updater(
-                    cont_var_dict_template, cont_var_updater)
-                guard_can_satisfied = guard_expression.evaluate_guard_disc(
-                    agent, discrete_variable_dict, cont_var_dict_template, self.map)
-                if not guard_can_satisfied:
-                    continue
-                agent_guard_dict[agent_id].append(
-                    (guard_expression, cont_var_updater, copy.deepcopy(discrete_variable_dict), reset))
+                cont_var_dict_template, discrete_variable_dict, length_dict = self.sensor.sense(
+                    self, agent, state_dict, self.map)
+                # The others perceived at the first step, the guards are unrolled again at the steps where they differ
+                step_sensed[agent_id] = (copy.deepcopy(discrete_variable_dict), dict(length_dict))
+            guards = self._verify_guards(agent, agent_mode, cont_var_dict_template, discrete_variable_dict, length_dict)
+            if guards:
+                agent_guard_dict[agent_id] = guards
 
         trace_length = int(len(list(node.trace.values())[0])/2)
+        guard_paths = {agent_id: [guard[0].guard_idx for guard in guards] for agent_id, guards in agent_guard_dict.items()}
+        for agent_id in step_sensed:
+            # The guards were only kept for the others perceived at the first step
+            guard_paths[agent_id] = self.agent_dict[agent_id].controller.mode_paths(node.mode[agent_id])
+        skippable = self._skippable_verify_steps(node, guard_paths, trace_length)
         guard_hits = []
         guard_hit = False
-        for idx in range(0, trace_length):
+        for idx in range(start_idx, trace_length):
+            if skippable[idx]:
+                # No guard or assert can be satisfied in this step
+                if guard_hit:
+                    break
+                continue
             any_contained = False
             hits = []
             state_dict = {}
@@ -486,8 +799,13 @@ class Scenario:
                     continue
                 agent_state, agent_mode, agent_static = state_dict[agent_id]
                 agent_state = agent_state[1:]
-                cont_vars, disc_vars, len_dict = self.sensor.sense(
-                    self, agent, state_dict, self.map)
+                if agent_id in sensed:
+                    cont, disc, len_dict = sensed[agent_id]
+                    cont_vars = sensor.sense_step(cont, slice(idx*2, idx*2+2))
+                    disc_vars = dict(disc)
+                else:
+                    cont_vars, disc_vars, len_dict = self.sensor.sense(
+                        self, agent, state_dict, self.map)
                 resets = defaultdict(list)
                 # Check safety conditions
                 for i, a in enumerate(agent.controller.asserts_veri):
@@ -517,10 +835,11 @@ class Scenario:
                             asserts[agent_id].append(label)
                 if agent_id in asserts:
                     continue
-                if agent_id not in agent_guard_dict:
-                    continue
+                guards = agent_guard_dict.get(agent_id, [])
+                if agent_id in step_sensed and (disc_vars, len_dict) != step_sensed[agent_id]:
+                    guards = self._verify_guards(agent, agent_mode, copy.deepcopy(cont_vars), disc_vars, len_dict)
 
-                for guard_expression, continuous_variable_updater, discrete_variable_dict, reset in agent_guard_dict[agent_id]:
+                for guard_expression, continuous_variable_updater, discrete_variable_dict, reset in guards:
                     new_cont_var_dict = copy.deepcopy(cont_vars)
                     one_step_guard: GuardExpressionAst = copy.deepcopy(
                         guard_expression)
@@ -1,5 +1,6 @@
 import numpy as np
 from verse.agents.base_agent import BaseAgent
+from verse.parser.vectorize import NotVectorizable
 
 
 def sets(d, thing, attrs, vals):
@@ -23,7 +24,7 @@ def set_states_2d(cnts, disc, thing, val, cont_var, disc_var, stat_var):
 
 def set_states_3d(cnts, disc, thing, val, cont_var, disc_var, stat_var):
     state, mode, static = val
-    transp = np.transpose(np.array(state)[:, 1:])
+    transp = np.transpose(np.asarray(state)[:, 1:])
     # assert len(transp) == 4
     sets(cnts, thing, cont_var, transp)
     sets(disc, thing, disc_var, mode)
@@ -39,7 +40,7 @@ def add_states_2d(cont, disc, thing, val, cont_var, disc_var, stat_var):
 
 def add_states_3d(cont, disc, thing, val, cont_var, disc_var, stat_var):
     state, mode, static = val
-    transp = np.transpose(np.array(state)[:, 1:])
+    transp = np.transpose(np.asarray(state)[:, 1:])
     assert len(transp) == 4
     adds(cont, thing, cont_var, transp)
     adds(disc, thing, disc_var, mode)
@@ -125,3 +126,41 @@ class BaseSensor():
                     add_states_3d(cont, disc, arg_name, state_dict[agent_id], cont_var, disc_var, stat_var)
                 
         return cont, disc, len_dict
+
+    def sense_trace(self, scenario, agent: BaseAgent, trace_dict, lane_map, reachtube: bool = False):
+        """
+        Sense the whole traces at once, in the same way as sense. trace_dict holds for each agent an array of
+        states (one row per time step, or per bound for reachtubes), its mode and its static. The continuous
+        variables are returned as the columns of the arrays, sense_step gives their values at some of the rows.
+        As in sense, the others are skipped if the controller has no argument for them, unless the traces are
+        reachtubes. Raises NotVectorizable in the cases sense rejects, so that the caller senses each step instead
+        """
+        cont = {}
+        disc = {}
+        len_dict = {'others': len(trace_dict)-1}
+        ego_type = None
+        other_name, other_type = None, None
+        for arg in agent.controller.args:
+            if arg.name == 'ego':
+                ego_type = arg.typ
+            elif other_type is None and 'map' not in arg.name:
+                other_name, other_type = arg.name, arg.typ
+        if ego_type is None or (reachtube and other_type is None and len(trace_dict) > 1):
+            raise NotVectorizable(f"no argument of the controller of {agent.id} for the ego or the others")
+        for agent_id, (trace, mode, static) in trace_dict.items():
+            if agent_id == agent.id:
+                thing, arg_type, add = 'ego', ego_type, sets
+            elif other_type is not None:
+                thing, arg_type, add = other_name, other_type, adds
+            else:
+                continue
+            state_def = agent.controller.state_defs[arg_type]
+            add(cont, thing, state_def.cont, np.asarray(trace, dtype=float)[:, 1:].T)
+            add(disc, thing, state_def.disc, mode)
+            add(disc, thing, state_def.static, static)
+        return cont, disc, len_dict
+
+    @staticmethod
+    def sense_step(cont, rows):
+        """The continuous variables sensed by sense_trace at rows, an index or a slice of the rows of the traces"""
+        return {k: [u[rows] for u in v] if isinstance(v, list) else v[rows] for k, v in cont.items()}
@@ -0,0 +1,106 @@
+from typing import Optional, Sequence
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from verse.agents.base_agent import BaseAgent
+from verse.parser.vectorize import NotVectorizable
+from verse.sensor.base_sensor import BaseSensor
+
+
+class NeighborhoodSensor(BaseSensor):
+    """
+    Sensor where each agent only perceives the other agents close to it: the ones within radius of it, or its k
+    nearest neighbors (within radius if both are given). The guards and asserts over the others are unrolled over
+    the perceived agents only, so scenes with many agents don't pay for every pair of agents.
+
+    The positions are the state variables at the indices position (x and y by default). The neighbors are found
+    with a KD-tree of the positions of the agents. For reachtubes, each pair of lower and upper bounds is taken as
+    a box and the radius is checked against the distance between the boxes. The k nearest neighbors are found from
+    the centers of the boxes, then the ones with a box farther than radius are dropped. When several rows are
+    sensed at once with sense_trace, the neighbors are found at each of them, and the rows are only sensed at once
+    if the agent perceives the same others at all of them, so that it senses the same as sense at each row.
+
+    The agents out of range aren't perceived at all, so the guards should only depend on the others within radius,
+    e.g. the distance thresholds of the guards should be smaller than radius.
+    """
+    def __init__(self, radius: Optional[float] = None, k: Optional[int] = None, position: Sequence[int] = (0, 1)):
+        if radius is None and k is None:
+            raise ValueError("Either the radius or the number of neighbors k has to be given")
+        self.radius = radius
+        self.k = k
+        self.position = list(position)
+        # Positions of the agents in the last states sensed and their neighbors, reused for each ego
+        self._last_neighbors = (None, None, None)
+
+    def _positions(self, state_dict):
+        # The positions of the agents at each row, shape (num_rows, num_agents, dims)
+        columns = [1 + i for i in self.position]
+        return np.stack([np.atleast_2d(np.asarray(state, dtype=float))[:, columns] for state, _, _ in state_dict.values()], axis=1)
+
+    def neighbors(self, state_dict, reachtube: bool = False):
+        """
+        The sets of the indices (in state_dict) of the agents each agent perceives, as a list in the order of
+        state_dict, for each row of the states in state_dict, or each pair of bounds if they're reachtubes
+        """
+        positions = self._positions(state_dict)
+        last_positions, last_reachtube, last_neighbors = self._last_neighbors
+        if last_reachtube == reachtube and last_positions is not None and np.array_equal(last_positions, positions):
+            return last_neighbors
+        if reachtube:
+            lower = np.minimum(positions[0::2], positions[1::2])
+            upper = np.maximum(positions[0::2], positions[1::2])
+        else:
+            lower = upper = positions
+        centers, half_widths = (lower + upper) / 2, (upper - lower) / 2
+        num_agents = centers.shape[1]
+        max_half_width = np.linalg.norm(half_widths, axis=2).max(axis=1)
+        all_neighbors = []
+        for center, half_width, max_extent in zip(centers, half_widths, max_half_width):
+            neighbors = [set() for _ in range(num_agents)]
+            all_neighbors.append(neighbors)
+            tree = cKDTree(center)
+            if self.k is None:
+                # Candidates by the distance between the centers, then the exact distance between the boxes
+                pairs = tree.query_pairs(self.radius + 2 * max_extent, output_type='ndarray')
+                if len(pairs) == 0:
+                    continue
+                gaps = np.maximum(np.abs(center[pairs[:, 0]] - center[pairs[:, 1]]) - half_width[pairs[:, 0]] - half_width[pairs[:, 1]], 0)
+                pairs = pairs[np.linalg.norm(gaps, axis=1) <= self.radius]
+                for i, j in pairs.tolist():
+                    neighbors[i].add(j)
+                    neighbors[j].add(i)
+            else:
+                k = min(self.k + 1, num_agents)
+                bound = np.inf if self.radius is None else self.radius + 2 * max_extent
+                distances, indices = tree.query(center, k=k, distance_upper_bound=bound)
+                indices = indices.reshape(num_agents, k)
+                for i in range(num_agents):
+                    candidates = [j for j in indices[i].tolist() if j < num_agents and j != i]
+                    if self.radius is not None and candidates:
+                        # The exact distance between the boxes, as for the radius alone
+                        gaps = np.maximum(np.abs(center[candidates] - center[i]) - half_width[candidates] - half_width[i], 0)
+                        candidates = [j for j, gap in zip(candidates, np.linalg.norm(gaps, axis=1)) if gap <= self.radius]
+                    neighbors[i].update(candidates)
+        self._last_neighbors = (positions, reachtube, all_neighbors)
+        return all_neighbors
+
+    def _perceived(self, agent: BaseAgent, state_dict, reachtube: bool):
+        agent_ids = list(state_dict)
+        if agent.id not in state_dict:
+            return state_dict
+        ego = agent_ids.index(agent.id)
+        neighbors = self.neighbors(state_dict, reachtube)
+        perceived = neighbors[0][ego]
+        if any(row[ego] != perceived for row in neighbors[1:]):
+            raise NotVectorizable(f"the agents {agent.id} perceives change over the rows")
+        return {agent_id: state for i, (agent_id, state) in enumerate(state_dict.items()) if agent_id == agent.id or i in perceived}
+
+    def sense(self, scenario, agent: BaseAgent, state_dict, lane_map):
+        # A single state, or the lower and upper bounds of a reachtube
+        reachtube = np.ndim(next(iter(state_dict.values()))[0]) >= 2
+        return super().sense(scenario, agent, self._perceived(agent, state_dict, reachtube), lane_map)
+
+    def sense_trace(self, scenario, agent: BaseAgent, trace_dict, lane_map, reachtube: bool = False):
+        """Raises NotVectorizable if the agent doesn't perceive the same others at all the rows of trace_dict"""
+        return super().sense_trace(scenario, agent, self._perceived(agent, trace_dict, reachtube), lane_map, reachtube)